@@ -19,6 +19,7 @@ from flika.app.settings_editor import (
 )
 from flika.images import image_path
 from flika.logger import handle_exception, logger
+from flika.process.progress_bar import shutdown_worker_pool
 from flika.update_flika import checkUpdates
 from flika.utils.app import get_qapp
 from flika.utils.misc import load_ui, nonpartial, send_error_report, send_user_stats
@@ -237,6 +238,7 @@ class FlikaApplication(QtWidgets.QMainWindow):
         """
         # Clean up threads
         cleanup_threads()
+        shutdown_worker_pool()
 
     def setWindowSize(self):
         # desktop = QtWidgets.QApplication.desktop()
@@ -252,6 +254,7 @@ class FlikaApplication(QtWidgets.QMainWindow):
         from flika.process.file_ import (
             open_file,
             open_file_from_gui,
+            open_file_lazy_from_gui,
             open_image_sequence_from_gui,
             open_points,
             save_file,
@@ -264,6 +267,9 @@ class FlikaApplication(QtWidgets.QMainWindow):
         fileMenu = self.menuBar().addMenu("File")
         openMenu = fileMenu.addMenu("Open")
         openMenu.addAction("Open Image/Movie", open_file_from_gui)
+        openMenu.addAction(
+            "Open Image/Movie (memory-mapped)", open_file_lazy_from_gui
+        )
         openMenu.addAction("Open Image Sequence", open_image_sequence_from_gui)
         openMenu.addAction("Open ROIs", open_rois)
         openMenu.addAction("Open Points", open_points)
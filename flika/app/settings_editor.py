@@ -37,12 +37,20 @@ class SettingsEditor(BaseDialog):
         multipleTracesCheck.setChecked(g.settings["multipleTraceWindows"])
         multiprocessing = QtWidgets.QCheckBox()
         multiprocessing.setChecked(g.settings["multiprocessing"])
+        background = QtWidgets.QCheckBox()
+        background.setChecked(g.settings["background_processes"])
         nCores = QtWidgets.QComboBox()
         debug_check = QtWidgets.QCheckBox(checked=g.settings["debug_mode"])
         debug_check.toggled.connect(setConsoleVisible)
         for i in np.arange(cpu_count()) + 1:
             nCores.addItem(str(i))
         nCores.setCurrentIndex(g.settings["nCores"] - 1)
+        memory_budget = QtWidgets.QSpinBox()
+        memory_budget.setRange(16, 1048576)
+        memory_budget.setSingleStep(64)
+        memory_budget.setValue(g.settings["memory_budget_mb"])
+        integral_image_check = QtWidgets.QCheckBox()
+        integral_image_check.setChecked(g.settings["integral_image_cache"])
         random_color_check = QtWidgets.QCheckBox()
         random_color_check.setChecked(g.settings["roi_color"] == "random")
         roi_color = ColorSelector()
@@ -91,6 +99,13 @@ class SettingsEditor(BaseDialog):
                 "object": multiprocessing,
             }
         )
+        items.append(
+            {
+                "name": "background_processes",
+                "string": "Run processes in the background",
+                "object": background,
+            }
+        )
         items.append(
             {
                 "name": "nCores",
@@ -98,6 +113,20 @@ class SettingsEditor(BaseDialog):
                 "object": nCores,
             }
         )
+        items.append(
+            {
+                "name": "memory_budget_mb",
+                "string": "Memory budget for processing a block of a movie (MB)",
+                "object": memory_budget,
+            }
+        )
+        items.append(
+            {
+                "name": "integral_image_cache",
+                "string": "Cache summed-area table for rectangle ROI traces",
+                "object": integral_image_check,
+            }
+        )
         items.append(
             {"name": "debug_mode", "string": "Debug Mode", "object": debug_check}
         )
@@ -114,7 +143,10 @@ class SettingsEditor(BaseDialog):
             g.settings["show_windows"] = showCheck.isChecked()
             g.settings["multipleTraceWindows"] = multipleTracesCheck.isChecked()
             g.settings["multiprocessing"] = multiprocessing.isChecked()
+            g.settings["background_processes"] = background.isChecked()
             g.settings["nCores"] = int(nCores.itemText(nCores.currentIndex()))
+            g.settings["memory_budget_mb"] = memory_budget.value()
+            g.settings["integral_image_cache"] = integral_image_check.isChecked()
             g.settings["debug_mode"] = debug_check.isChecked()
             if not random_color_check.isChecked() and roi_color.color == "random":
                 roi_color.color = "#ffff00"
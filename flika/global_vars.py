@@ -23,6 +23,7 @@ from qtpy import QtCore, QtGui, QtWidgets
 import flika.images
 import flika.utils.misc
 import flika.utils.system_info
+from flika.utils.thread_manager import run_on_gui_thread
 
 # Local application imports
 from flika.logger import logger
@@ -63,6 +64,8 @@ class Settings(
         "recent_scripts": [],
         "recent_files": [],
         "nCores": multiprocessing.cpu_count(),
+        "memory_budget_mb": 512,
+        "integral_image_cache": False,
         "debug_mode": False,
         "point_color": "#ff0000",
         "point_size": 5,
@@ -71,6 +74,7 @@ class Settings(
         "rect_height": 5,
         "show_all_points": False,
         "default_roi_on_click": False,
+        "background_processes": False,
     }
 
     def __init__(self):
@@ -266,8 +270,13 @@ def alert(msg, title="flika - Alert"):
     Arguments:
         msg (str): Alert message displayed to the user
         title (str): Title of the alert message popup
+
+    Alerts raised on worker threads are shown by the GUI thread.
     """
+    run_on_gui_thread(_show_alert, msg, title)
+
 
+def _show_alert(msg, title):
     print("\nAlert: " + msg)
     msgbx = QtWidgets.QMessageBox(m)
     msgbx.setIcon(QtWidgets.QMessageBox.Information)
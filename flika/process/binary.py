@@ -70,9 +70,9 @@ class Threshold(BaseProcess):
         self.gui_reset()
         valueSlider = SliderLabel(2)
         if g.win is not None:
-            image = g.win.image
-            valueSlider.setRange(np.min(image), np.max(image))
-            valueSlider.setValue(np.mean(image))
+            stats = g.win.stats()
+            valueSlider.setRange(stats.min, stats.max)
+            valueSlider.setValue(stats.mean)
         preview = CheckBox()
         preview.setChecked(True)
         self.items.append({"name": "value", "string": "Value", "object": valueSlider})
@@ -224,23 +224,25 @@ class Adaptive_threshold(BaseProcess):
             g.alert("Local Threshold does not support float16 type arrays")
             return None
 
-        newtif = np.copy(self.tif)
+        def threshold(frame):
+            thresholded = threshold_local(frame, block_size, offset=value)
+            if darkBackground:
+                thresholded = np.logical_not(thresholded)
+            return thresholded
 
         if self.oldwindow.nDims == 2:
-            newtif = threshold_local(newtif, block_size, offset=value)
+            newtif = threshold(self.tif)
         elif self.oldwindow.nDims == 3:
-            for i in range(len(newtif)):
-                newtif[i] = threshold_local(newtif[i], block_size, offset=value)
+            newtif = self.map_frames(threshold, dtype=np.uint8)
+            if newtif is None:
+                return None
         else:
             g.alert(
                 "You cannot run this function on an image of dimension greater than 3. If your window has color, convert to a grayscale image before running this function"
             )
             return None
 
-        if darkBackground:
-            newtif = np.logical_not(newtif)
-
-        self.newtif = newtif.astype(np.uint8)
+        self.newtif = newtif.astype(np.uint8, copy=False)
         self.newname = f"{self.oldname} - Thresholded {value}"
         return self.end()
 
@@ -319,7 +321,6 @@ class Canny_edge_detector(BaseProcess):
     ) -> flika.window.Window | None:
         self.start(keepSourceWindow)
         nDim = len(self.tif.shape)
-        newtif = np.copy(self.tif)
 
         if self.tif.dtype == np.float16:
             g.alert(
@@ -330,10 +331,13 @@ class Canny_edge_detector(BaseProcess):
         if nDim == 2:
             newtif = feature.canny(self.tif, sigma)
         else:
-            for i in range(len(newtif)):
-                newtif[i] = feature.canny(self.tif[i], sigma)
+            newtif = self.map_frames(
+                lambda frame: feature.canny(frame, sigma), dtype=np.uint8
+            )
+            if newtif is None:
+                return None
 
-        self.newtif = newtif.astype(np.uint8)
+        self.newtif = newtif.astype(np.uint8, copy=False)
         self.newname = f"{self.oldname} - Canny"
         return self.end()
 
@@ -380,6 +384,8 @@ class Logically_combine(BaseProcess):
         newWindow: A new window with the combined binary image
     """
 
+    runs_in_background = False
+
     def gui(self) -> None:
         self.gui_reset()
         window1 = WindowSelector()
@@ -482,10 +488,14 @@ class Remove_small_blobs(BaseProcess):
             newtif = remove_small_objects(self.tif.astype(bool), value, connectivity=2)
         elif self.oldwindow.nDims == 3:
             if rank == 2:
-                for i in range(len(self.tif)):
-                    newtif[i] = remove_small_objects(
-                        self.tif[i].astype(bool), value, connectivity=2
-                    )
+                newtif = self.map_frames(
+                    lambda frame: remove_small_objects(
+                        frame.astype(bool), value, connectivity=2
+                    ),
+                    dtype=bool,
+                )
+                if newtif is None:
+                    return None
             elif rank == 3:
                 newtif = remove_small_objects(
                     self.tif.astype(bool), value, connectivity=2
@@ -649,6 +659,8 @@ class Generate_ROIs(BaseProcess):
         newWindow: A new window with the generated ROIs
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
         self.ROIs: list = []
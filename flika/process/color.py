@@ -14,6 +14,8 @@ class Split_channels(BaseProcess):
         list of new Windows
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
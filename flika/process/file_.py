@@ -4,7 +4,9 @@ File-related operations for flika - opening, saving, and closing files.
 """
 
 # Standard library imports
+import collections
 import datetime
+import functools
 import json
 import os.path
 import pathlib
@@ -13,11 +15,13 @@ import shutil
 import subprocess
 import sys
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Third-party imports
 import numpy as np
 import pyqtgraph as pg
-from qtpy import QtGui, QtWidgets
+from qtpy import QtCore, QtGui, QtWidgets
 
 # Local application imports
 import flika.global_vars as g
@@ -31,8 +35,10 @@ __all__ = [
     "save_points",
     "save_rois",
     "save_movie_gui",
+    "save_movie",
     "open_file",
     "open_file_from_gui",
+    "open_file_lazy_from_gui",
     "open_image_sequence_from_gui",
     "open_points",
     "close",
@@ -43,12 +49,20 @@ __all__ = [
 ########################################################################################################################
 
 
-def save_file(filename: str | None | bool = None) -> str | None:
-    """save_file(filename=None)
+def save_file(
+    filename: str | None | bool = None, compress: int | str = 0
+) -> str | None:
+    """save_file(filename=None, compress=0)
     Save the image in the currentWindow to a .tif file.
 
+    Movies are written one frame at a time, so saving never needs a second copy of
+    the movie in memory. Frames are read and compressed ahead of the writer on
+    g.settings['nCores'] threads. Files that do not fit in a standard tif are saved
+    as BigTIFF.
+
     Parameters:
         filename (str): The image or movie will be saved as  'filename'.tif.
+        compress (int or str): 0 saves the file uncompressed. 1 to 9 sets the level of zlib compression, and 'lzma' uses LZMA compression.
 
     """
     if filename is None or filename is False:
@@ -62,8 +76,6 @@ def save_file(filename: str | None | bool = None) -> str | None:
         filename = os.path.join(directory, filename)
     g.m.statusBar().showMessage(f"Saving {os.path.basename(filename)}")
     A = g.win.image
-    if A.dtype == bool:
-        A = A.astype(np.uint8)
     metadata = g.win.metadata
     try:
         metadata = json.dumps(metadata, default=JSONhandler)
@@ -74,13 +86,60 @@ def save_file(filename: str | None | bool = None) -> str | None:
         A = np.transpose(A, (0, 2, 1))  # This keeps the x and the y the same as in FIJI
     elif len(A.shape) == 2:
         A = np.transpose(A, (1, 0))
-    tifffile.imsave(
-        filename, A, description=metadata
-    )  # http://stackoverflow.com/questions/20529187/what-is-the-best-way-to-save-image-metadata-alongside-a-tif-with-python
+    if A.ndim == 2 or (A.ndim == 3 and g.win.metadata["is_rgb"]):
+        pages = A[np.newaxis]  # a single image is saved in one piece
+    else:
+        pages = A
+    compressor = _tiff_compressor(compress)
+    # Standard tifs address up to 4 GB. tifffile stops compressed ones at 2 GB.
+    bigtiff = A.nbytes + 2**25 > (2**31 if compress else 2**32)
+
+    def prepare(page):
+        page = np.ascontiguousarray(page)
+        if page.dtype == bool:
+            page = page.astype(np.uint8)
+        if compressor is None or page.ndim > 2:
+            # TiffWriter splits a colour image into planes and compresses them itself
+            return page, None
+        return page, [compressor(page)]
+
+    nCores = g.settings["nCores"]
+    pending = collections.deque()
+    percent = 0
+    with tifffile.TiffWriter(filename, bigtiff=bigtiff) as tif, ThreadPoolExecutor(
+        nCores
+    ) as executor:
+        for i in range(len(pages)):
+            while len(pending) < 2 * nCores and i + len(pending) < len(pages):
+                pending.append(executor.submit(prepare, pages[i + len(pending)]))
+            page, compressed = pending.popleft().result()
+            tif.save(
+                page,
+                compress=compress,
+                compressed=compressed,
+                description=metadata if i == 0 else None,
+                metadata=None if compress else {},
+            )  # http://stackoverflow.com/questions/20529187/what-is-the-best-way-to-save-image-metadata-alongside-a-tif-with-python
+            if percent < int(100 * i / len(pages)):
+                percent = int(100 * i / len(pages))
+                g.m.statusBar().showMessage(f"Saving file {percent}%")
+                QtWidgets.QApplication.processEvents()
     g.m.statusBar().showMessage(f"Successfully saved {os.path.basename(filename)}")
     return filename
 
 
+def _tiff_compressor(compress):
+    """Returns the function tifffile uses for the 'compress' argument of
+    TiffWriter.save, or None if the file is saved uncompressed."""
+    if not compress:
+        return None
+    if compress == "lzma":
+        import lzma
+
+        return lzma.compress
+    return functools.partial(zlib.compress, level=compress)
+
+
 def save_points(filename=None):
     """save_points(filename=None)
     Saves the points in the current window to a text file
@@ -124,85 +183,210 @@ def save_rois(filename=None):
 
 
 def save_movie(rate, filename=None):
-    """save_movie(rate, filename)
-    Saves the currentWindow video as a .mp4 movie by joining .jpg frames together
+    """save_movie(rate, filename=None)
+    Saves the currentWindow video as a .mp4 movie
+
+    Frames are mapped through the levels and lookup table of the window on
+    g.settings['nCores'] threads and piped into a single ffmpeg process, a few
+    frames ahead of the encoder. The time stamp, scale bar, points and ROIs are
+    drawn over each frame. The movie shows the whole image, enlarged about as
+    much as it is on screen.
 
     Parameters:
         rate (int): framerate
-        filename (str): Address to save the movie to, with .mp4
-
-    Notes:
-        Once you've exported all of the frames you wanted, open a command line and run the following:
-        ffmpeg -r 100 -i %03d.jpg output.mp4
-        -r: framerate
-        -i: input files.
-        %03d: The files have to be numbered 001.jpg, 002.jpg... etc.
+        filename (str): Address to save the movie to, with .mp4. If None, a
+            file dialog asks for it.
 
     """
-
-    ## Check if ffmpeg is installed
-    if os.name == "nt":  # If we are running windows
-        try:
-            subprocess.call(["ffmpeg"])
-        except FileNotFoundError as e:
-            if e.errno == os.errno.ENOENT:
-                # handle file not found error.
-                # I used http://ffmpeg.org/releases/ffmpeg-2.8.4.tar.bz2 originally
-                g.alert(
-                    "The program FFmpeg is required to export movies. \
-                \n\nFor instructions on how to install, go here: http://www.wikihow.com/Install-FFmpeg-on-Windows"
-                )
-                return None
-            else:
-                # Something else went wrong while trying to run `wget`
-                raise
-
-    filetypes = "Movies (*.mp4)"
-    prompt = "Save movie to .mp4 file"
-    filename = save_file_gui(prompt, filetypes=filetypes)
-    if filename is None:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        # I used http://ffmpeg.org/releases/ffmpeg-2.8.4.tar.bz2 originally
+        g.alert(
+            "The program FFmpeg is required to export movies. \
+        \n\nFor instructions on how to install, go here: http://www.wikihow.com/Install-FFmpeg-on-Windows"
+        )
         return None
 
     win = g.win
-    A = win.image
-    if len(A.shape) < 3:
+    if win is None or win.imageview.axes["t"] is None:
         g.alert("Movie not the right shape for saving.")
         return None
+    if filename is None:
+        filetypes = "Movies (*.mp4)"
+        prompt = "Save movie to .mp4 file"
+        filename = save_file_gui(prompt, filetypes=filetypes)
+        if filename is None:
+            return None
+
+    imageview = win.imageview
+    item = imageview.imageItem
+    source = imageview.frameSource()
+    nFrames = imageview.nframes()
+    levels = item.getLevels()
+    lut = item.lut
+    if callable(lut):
+        lut = lut(item.image, 256)
+    zoom = _movie_zoom(imageview.view)
+    overlays = _MovieOverlays(win, zoom)
+    width, height = np.array(source(0).shape[:2]) * zoom
+
+    def render(i):
+        return _movie_frame(source(i), levels, lut, zoom)
+
+    g.m.statusBar().showMessage(f"Saving {os.path.basename(filename)}")
+    command = [
+        ffmpeg,
+        "-y",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgra",
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        "%d" % rate,
+        "-i",
+        "-",
+        "-vf",
+        "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-pix_fmt",
+        "yuv420p",
+        filename,
+    ]
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    nCores = g.settings["nCores"]
+    pending = collections.deque()
+    percent = 0
     try:
-        exporter = pg.exporters.ImageExporter(win.imageview.view)
-    except TypeError:
-        exporter = pg.exporters.ImageExporter.ImageExporter(win.imageview.view)
-
-    nFrames = len(A)
-    tmpdir = os.path.join(os.path.dirname(g.settings.settings_file), "tmp")
-    if os.path.isdir(tmpdir):
-        shutil.rmtree(tmpdir)
-    os.mkdir(tmpdir)
-    win.top_left_label.hide()
-    for i in np.arange(0, nFrames):
-        win.setIndex(i)
-        exporter.export(os.path.join(tmpdir, f"{i:03}.jpg"))
-        QtWidgets.QApplication.processEvents()
-    win.top_left_label.show()
-    olddir = os.getcwd()
-    os.chdir(tmpdir)
-    subprocess.call(
-        [
-            "ffmpeg",
-            "-r",
-            "%d" % rate,
-            "-i",
-            "%03d.jpg",
-            "-vf",
-            "scale=trunc(iw/2)*2:trunc(ih/2)*2",
-            "output.mp4",
-        ]
-    )
-    os.rename("output.mp4", filename)
-    os.chdir(olddir)
+        with ThreadPoolExecutor(nCores) as executor:
+            for i in range(nFrames):
+                while len(pending) < 2 * nCores and i + len(pending) < nFrames:
+                    pending.append(executor.submit(render, i + len(pending)))
+                frame = pending.popleft().result()
+                overlays.paint(frame, i)
+                proc.stdin.write(frame.data)
+                if percent < int(100 * i / nFrames):
+                    percent = int(100 * i / nFrames)
+                    g.m.statusBar().showMessage(f"Saving movie {percent}%")
+                    QtWidgets.QApplication.processEvents()
+    except BrokenPipeError:
+        for future in pending:
+            future.cancel()
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        error = proc.stderr.read().decode(errors="replace")
+        proc.wait()
+    if proc.returncode != 0:
+        g.alert(f"FFmpeg could not save the movie.\n\n{error}")
+        return None
     g.m.statusBar().showMessage(
         f"Successfully saved movie as {os.path.basename(filename)}."
     )
+    return filename
+
+
+def _movie_zoom(view):
+    """The integer factor that enlarges the image about as much as the view
+    shows it on screen"""
+    pixel_size = view.viewPixelSize()  # the image pixels in a screen pixel
+    if not min(pixel_size) > 0:
+        return 1
+    return int(np.clip(np.round(1 / max(pixel_size)), 1, 16))
+
+
+def _movie_frame(frame, levels, lut, zoom):
+    """Maps a frame, as it is passed to the ImageItem, to the contiguous
+    [y, x, BGRA] bytes of a movie frame"""
+    frame = frame.swapaxes(0, 1)  # the ImageItem is column-major
+    if frame.dtype == bool:
+        frame = frame.view(np.uint8)
+    argb, _ = pg.functions.makeARGB(frame, lut=lut, levels=levels)
+    argb[..., 3] = 255
+    if zoom > 1:
+        argb = argb.repeat(zoom, axis=0).repeat(zoom, axis=1)
+    return np.ascontiguousarray(argb)
+
+
+class _MovieOverlays:
+    """The items drawn over the image of a window, captured once so save_movie
+    can paint them over its frames without repainting the window"""
+
+    def __init__(self, win, zoom):
+        self.zoom = zoom
+        self.win = win
+        self.points = win.scatterPoints
+        self.show_all_points = g.settings["show_all_points"]
+        if self.show_all_points:
+            self.all_points = [pt for frame in self.points for pt in frame]
+        self.rois = []
+        for roi in win.rois:
+            color = QtGui.QColor(roi.pen.color())
+            pts = np.asarray(roi.getPoints(), dtype=float)
+            if roi.kind == "rectangle":
+                self.rois.append((color, QtCore.QRectF(*pts[0], *pts[1])))
+            else:
+                polygon = QtGui.QPolygonF([QtCore.QPointF(*pt) for pt in pts])
+                if roi.kind == "freehand":
+                    polygon.append(polygon.first())
+                self.rois.append((color, polygon))
+        self.labels = []
+        label = getattr(win, "scaleBarLabel", None)
+        if label is not None:
+            self.labels.append((label.pos(), label.textItem.toHtml()))
+            bar = label.bar
+            self.bar = (bar.brush().color(), bar.rect())
+        else:
+            self.bar = None
+        self.timeStamp = getattr(win, "timeStampLabel", None)
+
+    def paint(self, frame, t):
+        """Paints the overlays of frame t onto the [y, x, BGRA] array frame"""
+        points = self.all_points if self.show_all_points else self.points[t]
+        labels = list(self.labels)
+        if self.timeStamp is not None:
+            labels.append((self.timeStamp.pos(), self.win.timeStampHtml(t)))
+        if not (points or labels or self.rois or self.bar):
+            return
+        height, width = frame.shape[:2]
+        image = QtGui.QImage(
+            frame.data, width, height, 4 * width, QtGui.QImage.Format.Format_ARGB32
+        )
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+        painter.scale(self.zoom, self.zoom)  # image pixels to movie pixels
+        for color, shape in self.rois:
+            pen = QtGui.QPen(color)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.setBrush(QtCore.Qt.BrushStyle.NoBrush)
+            if isinstance(shape, QtCore.QRectF):
+                painter.drawRect(shape)
+            else:
+                painter.drawPolyline(shape)
+        if self.bar is not None:
+            color, rect = self.bar
+            painter.fillRect(rect, color)
+        painter.resetTransform()
+        painter.setPen(QtGui.QColor(0, 0, 0))
+        for pt in points:
+            radius = pt[3] / 2
+            painter.setBrush(pt[2])
+            painter.drawEllipse(
+                QtCore.QPointF(pt[0] * self.zoom, pt[1] * self.zoom), radius, radius
+            )
+        for pos, html in labels:
+            document = QtGui.QTextDocument()
+            document.setHtml(html)
+            painter.save()
+            painter.translate(pos.x() * self.zoom, pos.y() * self.zoom)
+            document.drawContents(painter)
+            painter.restore()
+        painter.end()
 
 
 ########################################################################################################################
@@ -218,6 +402,10 @@ def open_file_from_gui():
     open_file(None, True)
 
 
+def open_file_lazy_from_gui():
+    open_file(None, True, lazy=True)
+
+
 def open_image_sequence(filename=None, from_gui=False):
     """open_image_sequencefilename(filename=None)
     Opens an image sequence (.tif, .png) into a new_window.
@@ -276,12 +464,15 @@ def open_image_sequence(filename=None, from_gui=False):
     return new_window
 
 
-def open_file(filename: str | None = None, from_gui: bool = False):
-    """open_file(filename=None)
+def open_file(
+    filename: str | None = None, from_gui: bool = False, lazy: bool = False
+):
+    """open_file(filename=None, lazy=False)
     Opens an image or movie file (.tif, .stk, .nd2) into a new_window.
 
     Parameters:
         filename (str): Address of file to open. If no filename is provided, the last opened file is used.
+        lazy (bool): If True, .tif files are memory-mapped instead of read into RAM. The window's image is a read-only view of the file, and frames are only read from disk when they are displayed or processed. Use this for movies that are larger than the available memory.
     Returns:
         new_window
 
@@ -304,7 +495,7 @@ def open_file(filename: str | None = None, from_gui: bool = False):
     metadata: dict = {}
     ext = os.path.splitext(str(filename))[1]
     if ext in [".tif", ".stk", ".tiff", ".ome"]:
-        results = open_tiff(str(filename), metadata)
+        results = open_tiff(str(filename), metadata, lazy)
         if results is None:
             return None
         else:
@@ -368,21 +559,30 @@ def open_file(filename: str | None = None, from_gui: bool = False):
     msg = f"{os.path.basename(str(filename))} successfully loaded ({time.time() - t} s)"
     g.m.statusBar().showMessage(msg)
     g.settings["filename"] = str(filename)
-    commands = [f"open_file('{filename}')"]
+    if lazy:
+        commands = [f"open_file('{filename}', lazy=True)"]
+    else:
+        commands = [f"open_file('{filename}')"]
     new_window = Window(
         A, os.path.basename(str(filename)), filename, commands, metadata
     )
     return new_window
 
 
-def open_tiff(filename, metadata):
+def open_tiff(filename, metadata, lazy=False):
     try:
         Tiff = tifffile.TiffFile(str(filename))
     except Exception as s:
         g.alert(f"Unable to open {filename}. {s}")
         return None
     metadata = get_metadata_tiff(Tiff)
-    A = Tiff.asarray()
+    if lazy:
+        # Contiguous pages are mapped straight from the tif. Anything else (e.g.
+        # compressed pages) is unpacked page by page into a temporary file on disk.
+        A = Tiff.asarray(memmap=True)
+        A.flags.writeable = False
+    else:
+        A = Tiff.asarray()
     Tiff.close()
     axes = [tifffile.AXES_LABELS[ax] for ax in Tiff.series[0].axes]
     # print("Original Axes = {}".format(Tiff.series[0].axes)) #sample means RBGA, plane means frame, width means X, height means Y
@@ -394,30 +594,14 @@ def open_tiff(filename, metadata):
         msg += f"Axes found by tifffile.py: {axes}\n"
         g.alert(msg)
         return None
-    if set(axes) == set(["height", "width"]):  # still image in black and white.
-        target_axes = ["width", "height"]
-    elif set(axes) == set(["height", "width", "channel"]):  # still image in color.
-        target_axes = ["width", "height", "channel"]
-        metadata["is_rgb"] = True
-    elif set(axes) == set(["height", "width", "sample"]):  # still image in color.
-        target_axes = ["width", "height", "sample"]
-        metadata["is_rgb"] = True
-    elif set(axes) == set(["height", "width", "series"]):  # movie in black and white
-        target_axes = ["series", "width", "height"]
-    elif set(axes) == set(["height", "width", "time"]):  # movie in black and white
-        target_axes = ["time", "width", "height"]
-    elif set(axes) == set(["height", "width", "depth"]):  # movie in black and white
-        target_axes = ["depth", "width", "height"]
-    elif set(axes) == set(["channel", "time", "height", "width"]):  # movie in color
-        target_axes = ["time", "width", "height", "channel"]
-        metadata["is_rgb"] = True
-    elif set(axes) == set(["sample", "time", "height", "width"]):  # movie in color
-        target_axes = ["time", "width", "height", "sample"]
+    target_axes, is_rgb = tiff_target_axes(axes)
+    if target_axes is None:
+        g.alert(f"Tiff could not be loaded because its axes {axes} are not supported")
+        return None
+    if is_rgb:
         metadata["is_rgb"] = True
-    elif set(axes) == set(["other", "height", "width"]):
-        target_axes = ["other", "height", "width"]
+    elif target_axes[0] == "other":
         metadata["is_rgb"] = False
-
     perm = get_permutation_tuple(axes, target_axes)
     A = np.transpose(A, perm)
     if target_axes[-1] in ["channel", "sample", "series"] and A.shape[-1] == 2:
@@ -497,6 +681,45 @@ def open_points(filename=None):
 ########################################################################################################################
 ######################                INTERNAL HELPER FUNCTIONS                              ###########################
 ########################################################################################################################
+def tiff_target_axes(axes):
+    """tiff_target_axes(axes)
+
+    Parameters:
+        axes (list): The axes of the tiff, as labelled by tifffile.AXES_LABELS.
+
+    Returns:
+        tuple: (target_axes, is_rgb). target_axes orders the axes the way flika stores
+        images ([t, x, y] for movies), or is None if the axes are not supported.
+    """
+    is_rgb = False
+    if set(axes) == set(["height", "width"]):  # still image in black and white.
+        target_axes = ["width", "height"]
+    elif set(axes) == set(["height", "width", "channel"]):  # still image in color.
+        target_axes = ["width", "height", "channel"]
+        is_rgb = True
+    elif set(axes) == set(["height", "width", "sample"]):  # still image in color.
+        target_axes = ["width", "height", "sample"]
+        is_rgb = True
+    elif set(axes) == set(["height", "width", "series"]):  # movie in black and white
+        target_axes = ["series", "width", "height"]
+    elif set(axes) == set(["height", "width", "time"]):  # movie in black and white
+        target_axes = ["time", "width", "height"]
+    elif set(axes) == set(["height", "width", "depth"]):  # movie in black and white
+        target_axes = ["depth", "width", "height"]
+    elif set(axes) == set(["channel", "time", "height", "width"]):  # movie in color
+        target_axes = ["time", "width", "height", "channel"]
+        is_rgb = True
+    elif set(axes) == set(["sample", "time", "height", "width"]):  # movie in color
+        target_axes = ["time", "width", "height", "sample"]
+        is_rgb = True
+    elif set(axes) == set(["other", "height", "width"]):
+        target_axes = ["other", "height", "width"]
+        is_rgb = False
+    else:
+        return None, False
+    return target_axes, is_rgb
+
+
 def get_permutation_tuple(src, dst):
     """get_permtation_tuple(src, dst)
 
@@ -1,17 +1,15 @@
-import multiprocessing
-
 import numpy as np
+import scipy.fft
 import skimage
 import skimage.filters
 from qtpy import QtWidgets
-from scipy import signal
-from scipy.fftpack import fft, fftfreq, ifft
+from scipy import ndimage, signal
 from scipy.ndimage import convolve
 from scipy.signal import butter, filtfilt, medfilt
 
 import flika.global_vars as g
 from flika.logger import logger
-from flika.process.progress_bar import ProgressBar
+from flika.process.progress_bar import BlockProgress, PoolProgressBar
 from flika.roi import ROI_Base
 from flika.utils.BaseProcess import BaseProcess
 from flika.utils.custom_widgets import CheckBox, SliderLabel, SliderLabelOdd
@@ -82,17 +80,31 @@ class Gaussian_blur(BaseProcess):
         else:
             mode = "nearest"
         if sigma > 0:
-            self.newtif = np.zeros(self.tif.shape)
-            if len(self.tif.shape) == 3:
-                for i in np.arange(len(self.newtif)):
-                    self.newtif[i] = skimage.filters.gaussian(
-                        self.tif[i].astype(np.float64), sigma, mode=mode
-                    )
-            elif len(self.tif.shape) == 2:
-                self.newtif = skimage.filters.gaussian(
-                    self.tif.astype(np.float64), sigma, mode=mode
+
+            # frames of a 4D movie are color images; blur each channel separately
+            channel_axis = -1 if self.tif.ndim == 4 else None
+
+            def blur(frame):
+                return skimage.filters.gaussian(
+                    frame.astype(np.float64),
+                    sigma,
+                    mode=mode,
+                    channel_axis=channel_axis,
                 )
-            self.newtif = self.newtif.astype(g.settings["internal_data_type"])
+
+            if len(self.tif.shape) == 2:
+                self.newtif = blur(self.tif)
+            else:
+                self.newtif = self.map_frames(
+                    blur, dtype=g.settings["internal_data_type"]
+                )
+                if self.newtif is None:
+                    return None
+            # map_frames already returns this dtype, and a copy would load
+            # out-of-core results into memory
+            self.newtif = self.newtif.astype(
+                g.settings["internal_data_type"], copy=False
+            )
         else:
             self.newtif = self.tif
         self.newname = self.oldname + " - Gaussian Blur sigma=" + str(sigma)
@@ -163,21 +175,30 @@ class Difference_of_Gaussians(BaseProcess):
     def __call__(self, sigma1: float, sigma2: float, keepSourceWindow: bool = False):
         self.start(keepSourceWindow)
         if sigma1 > 0 and sigma2 > 0:
-            self.newtif = np.zeros(self.tif.shape)
-            if len(self.tif.shape) == 3:
-                for i in np.arange(len(self.newtif)):
-                    self.newtif[i] = skimage.filters.gaussian(
-                        self.tif[i].astype(np.float64), sigma1, mode="nearest"
-                    ) - skimage.filters.gaussian(
-                        self.tif[i].astype(np.float64), sigma2, mode="nearest"
-                    )
-            elif len(self.tif.shape) == 2:
-                self.newtif = skimage.filters.gaussian(
-                    self.tif.astype(np.float64), sigma1, mode="nearest"
+
+            channel_axis = -1 if self.tif.ndim == 4 else None
+
+            def difference(frame):
+                frame = frame.astype(np.float64)
+                return skimage.filters.gaussian(
+                    frame, sigma1, mode="nearest", channel_axis=channel_axis
                 ) - skimage.filters.gaussian(
-                    self.tif.astype(np.float64), sigma2, mode="nearest"
+                    frame, sigma2, mode="nearest", channel_axis=channel_axis
+                )
+
+            if len(self.tif.shape) == 2:
+                self.newtif = difference(self.tif)
+            else:
+                self.newtif = self.map_frames(
+                    difference, dtype=g.settings["internal_data_type"]
                 )
-            self.newtif = self.newtif.astype(g.settings["internal_data_type"])
+                if self.newtif is None:
+                    return None
+            # map_frames already returns this dtype, and a copy would load
+            # out-of-core results into memory
+            self.newtif = self.newtif.astype(
+                g.settings["internal_data_type"], copy=False
+            )
         else:
             self.newtif = self.tif
         self.newname = self.oldname + " - Difference of Gaussians ({} {})".format(
@@ -208,6 +229,32 @@ difference_of_gaussians = Difference_of_Gaussians()
 ##################   TEMPORAL FILTERS       ###################################
 ###############################################################################
 
+# Temporal filters process the movie in tiles of whole rows of pixels, so that
+# each call operates on a [t, x, y] block that fits comfortably in cache.
+TILE_BYTES = 2**20
+
+
+def spatial_tiles(shape: tuple, itemsize: int = 8, max_bytes: int | None = None):
+    """spatial_tiles(shape, itemsize=8, max_bytes=None)
+
+    Splits a [t, x, y] movie into blocks of rows along the x axis.
+
+    Parameters:
+        shape (tuple): The shape of the movie.
+        itemsize (int): Bytes per element of the working array of each tile.
+        max_bytes (int): Approximate upper bound on the size of one tile. Defaults
+            to TILE_BYTES.
+    Yields:
+        slice: A slice along the x axis selecting one tile.
+    """
+    if max_bytes is None:
+        max_bytes = TILE_BYTES
+    mt, mx, my = shape[:3]
+    row_bytes = max(mt * my * itemsize, 1)
+    rows = int(np.clip(max_bytes // row_bytes, 1, max(mx, 1)))
+    for x0 in range(0, mx, rows):
+        yield slice(x0, min(x0 + rows, mx))
+
 
 class Butterworth_filter(BaseProcess):
     """butterworth_filter(filter_order, low, high, framerate, keepSourceWindow=False)
@@ -291,23 +338,23 @@ class Butterworth_filter(BaseProcess):
         if self.tif.ndim != 3:
             g.alert("Butterworth filter only works on 3-dimensional movies.")
             return
-        if g.settings["multiprocessing"]:
+        # the process pool reports its progress in a window of its own
+        if (
+            g.settings["multiprocessing"]
+            and not self.out_of_core
+            and not self.in_background
+        ):
             self.newtif = butterworth_filter_multi(
-                filter_order, low / (framerate / 2), high / (framerate / 2), g.win.image
+                filter_order, low / (framerate / 2), high / (framerate / 2), self.tif
             )
         else:
-            self.newtif = np.zeros(
-                self.tif.shape, dtype=g.settings.d["internal_data_type"]
-            )
-            mt, mx, my = self.tif.shape
             b, a, padlen = self.makeButterFilter(
                 filter_order, low / (framerate / 2), high / (framerate / 2)
             )
-            for i in np.arange(mx):
-                for j in np.arange(my):
-                    self.newtif[:, i, j] = filtfilt(
-                        b, a, self.tif[:, i, j], padlen=padlen
-                    )
+            # every pixel needs its whole trace, so stream the movie in spatial chunks
+            self.newtif = self.map_chunks(
+                lambda block: butterworth_filter_stack(b, a, padlen, block), axis=1
+            )
         self.newname = self.oldname + " - Butter Filtered"
         return self.end()
 
@@ -357,81 +404,74 @@ class Butterworth_filter(BaseProcess):
 butterworth_filter = Butterworth_filter()
 
 
+def butterworth_filter_stack(
+    b: np.ndarray,
+    a: np.ndarray,
+    padlen: int,
+    tif: np.ndarray,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """butterworth_filter_stack(b, a, padlen, tif, out=None)
+
+    Applies filtfilt along the time axis of a [t, x, y] movie. Every pixel of a
+    tile is filtered in one call, and the result is written directly into
+    ``out``.
+
+    Parameters:
+        b (np.ndarray): Numerator coefficients from makeButterFilter.
+        a (np.ndarray): Denominator coefficients from makeButterFilter.
+        padlen (int): Padding length passed to filtfilt.
+        tif (np.ndarray): The [t, x, y] movie to filter.
+        out (np.ndarray): Optional preallocated output with the same shape as tif.
+    Returns:
+        np.ndarray: The filtered movie, of type g.settings['internal_data_type']
+        unless ``out`` was given.
+    """
+    if out is None:
+        out = np.empty(tif.shape, dtype=g.settings["internal_data_type"])
+    for xs in spatial_tiles(tif.shape):
+        out[:, xs] = _filtfilt_tile(b, a, padlen, tif[:, xs])
+    return out
+
+
+def _filtfilt_tile(
+    b: np.ndarray, a: np.ndarray, padlen: int, block: np.ndarray
+) -> np.ndarray:
+    # lfilter runs much faster along the last axis, so filter a [pixels, t] view.
+    mt = block.shape[0]
+    traces = block.reshape(mt, -1).T
+    return filtfilt(b, a, traces, axis=-1, padlen=padlen).T.reshape(block.shape)
+
+
 def butterworth_filter_multi(
     filter_order: int, low: float, high: float, tif: np.ndarray
 ) -> np.ndarray | None:
-    nThreads = g.settings["nCores"]
-    mt, mx, my = tif.shape
-    block_ends = np.linspace(0, mx, nThreads + 1).astype(int)
-    data = [
-        tif[:, block_ends[i] : block_ends[i + 1], :] for i in np.arange(nThreads)
-    ]  # split up data along x axis. each thread will get one.
-    args = (filter_order, low, high)
-    progress = ProgressBar(
+    progress = PoolProgressBar(
         butterworth_filter_multi_inner,
-        data,
-        args,
-        nThreads,
+        tif,
+        (filter_order, low, high),
+        g.settings["nCores"],
+        dtype=g.settings["internal_data_type"],
         msg="Performing Butterworth Filter",
     )
-    if progress.results is None or any(r is None for r in progress.results):
-        result = None
-    else:
-        result: np.ndarray = np.concatenate(progress.results, axis=1).astype(
-            g.settings["internal_data_type"]
-        )
-    return result
+    return progress.result
 
 
 def butterworth_filter_multi_inner(
-    q_results,
-    q_progress,
-    q_status,
-    child_conn: multiprocessing.connection.Connection,
-    args: tuple,
-) -> None:
-    data = child_conn.recv()
-    status = q_status.get(
-        True
-    )  # this blocks the process from running until all processes are launched
-    if status == "Stop":
-        q_results.put(None)
-
-    def makeButterFilter(filter_order: int, low: float, high: float) -> tuple:
-        padlen = 0
-        if high == 1:
-            if low == 0:  # if there is no temporal filter at all,
-                return None, None, None
-            else:  # if only high pass temporal filter
-                [b, a] = butter(filter_order, low, btype="highpass")
-                padlen = 3
-        else:
-            if low == 0:
-                [b, a] = butter(filter_order, high, btype="lowpass")
-            else:
-                [b, a] = butter(filter_order, [low, high], btype="bandpass")
-            padlen = 6
-        return b, a, padlen
-
+    data: np.ndarray, result: np.ndarray, args: tuple, progress: BlockProgress
+) -> bool:
     filter_order, low, high = args
-    b, a, padlen = makeButterFilter(filter_order, low, high)
+    b, a, padlen = butterworth_filter.makeButterFilter(filter_order, low, high)
     mt, mx, my = data.shape
-    result = np.zeros(data.shape, g.settings["internal_data_type"])
-    nPixels = mx * my
-    pixel = 0
     percent = 0
-    for x in np.arange(mx):
-        for y in np.arange(my):
-            if not q_status.empty():
-                stop = q_status.get(False)
-                q_results.put(None)
-                return
-            pixel += 1
-            if percent < int(100 * pixel / nPixels):
-                percent = int(100 * pixel / nPixels)
-                q_progress.put(percent)
-            result[:, x, y] = filtfilt(b, a, data[:, x, y], padlen=padlen)
-    q_results.put(result)
+    for xs in spatial_tiles(data.shape):
+        if progress.stopped():
+            return False
+        result[:, xs] = _filtfilt_tile(b, a, padlen, data[:, xs])
+        if percent < int(100 * xs.stop / mx):
+            percent = int(100 * xs.stop / mx)
+            progress.update(percent)
+    return True
 
 
 class Mean_filter(BaseProcess):
@@ -474,8 +514,9 @@ class Mean_filter(BaseProcess):
         if self.tif.ndim != 3:
             g.alert("Mean Filter only supports 3-dimensional movies.")
             return
-        self.newtif = convolve(
-            self.tif, weights=np.full((nFrames, 1, 1), 1.0 / nFrames)
+        weights = np.full((nFrames, 1, 1), 1.0 / nFrames)
+        self.newtif = self.map_chunks(
+            lambda block: convolve(block, weights=weights), halo=nFrames // 2
         )
         self.newname = self.oldname + " - Mean Filtered"
         return self.end()
@@ -502,17 +543,34 @@ mean_filter = Mean_filter()
 
 
 def varfilt(trace: np.ndarray, nFrames: int) -> np.ndarray:
-    result = np.zeros_like(trace)
+    """varfilt(trace, nFrames)
+
+    Sliding-window variance along the first axis of ``trace``. Frame i is the
+    variance of frames [i - ceil(nFrames/2), i + floor(nFrames/2)), clipped to
+    the bounds of the array. Windows are evaluated with cumulative sums of x and
+    x**2, so the cost does not depend on nFrames.
+
+    Parameters:
+        trace (np.ndarray): A 1D trace, or a [t, ...] block of traces.
+        nFrames (int): Width of the window.
+    Returns:
+        np.ndarray: float64 array with the same shape as trace.
+    """
     mt = len(trace)
-    for i in np.arange(mt):
-        i0 = int(i - nFrames / 2)
-        i1 = int(i + nFrames / 2)
-        if i0 < 0:
-            i0 = 0
-        if i1 > len(trace):
-            i1 = len(trace)
-        result[i] = np.var(trace[i0:i1])
-    return result
+    idx = np.arange(mt)
+    i0 = np.clip(idx - (nFrames + 1) // 2, 0, mt)
+    i1 = np.clip(idx + nFrames // 2, 0, mt)
+    count = (i1 - i0).reshape((mt,) + (1,) * (trace.ndim - 1))
+    x = trace.astype(np.float64)
+    x -= x.mean(0)  # the variance is shift invariant; centering keeps x**2 small
+    s1 = np.zeros((mt + 1,) + x.shape[1:])
+    s2 = np.zeros((mt + 1,) + x.shape[1:])
+    np.cumsum(x, 0, out=s1[1:])
+    np.cumsum(np.square(x, out=x), 0, out=s2[1:])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (s1[i1] - s1[i0]) / count
+        result = (s2[i1] - s2[i0]) / count - mean**2
+    return np.maximum(result, 0, out=result)
 
 
 class Variance_filter(BaseProcess):
@@ -554,11 +612,14 @@ class Variance_filter(BaseProcess):
         if self.tif.ndim != 3:
             g.alert("Variance filter only supports 3-dimensional movies.")
             return
-        self.newtif = np.zeros(self.tif.shape)
-        _, mx, my = self.tif.shape
-        for i in np.arange(my):
-            for j in np.arange(mx):
-                self.newtif[:, i, j] = varfilt(self.tif[:, i, j], nFrames)
+
+        def variance(block):
+            out = np.empty(block.shape, g.settings["internal_data_type"])
+            for xs in spatial_tiles(block.shape):
+                out[:, xs] = varfilt(block[:, xs], nFrames)
+            return out
+
+        self.newtif = self.map_chunks(variance, halo=(nFrames + 1) // 2)
         self.newname = self.oldname + " - Variance Filtered"
         return self.end()
 
@@ -624,12 +685,9 @@ class Median_filter(BaseProcess):
                 "Median filter requires at least 3 dimensions. %d < 3" % self.tif.ndim
             )
             return
-        mx = self.tif.shape[2]
-        my = self.tif.shape[1]
-        self.newtif = np.zeros(self.tif.shape)
-        for i in np.arange(my):
-            for j in np.arange(mx):
-                self.newtif[:, i, j] = medfilt(self.tif[:, i, j], kernel_size=nFrames)
+        self.newtif = self.map_chunks(
+            lambda block: median_filter_stack(block, nFrames), halo=nFrames // 2
+        )
         self.newname = self.oldname + " - Median Filtered"
         return self.end()
 
@@ -657,6 +715,39 @@ class Median_filter(BaseProcess):
 median_filter = Median_filter()
 
 
+def median_filter_stack(
+    tif: np.ndarray, nFrames: int, out: np.ndarray | None = None
+) -> np.ndarray:
+    """median_filter_stack(tif, nFrames, out=None)
+
+    Running median along the time axis of a movie, with the same zero padded
+    edges as scipy.signal.medfilt. The traces of each spatial tile are laid end
+    to end, separated by nFrames // 2 zeros, and filtered with a single call to
+    scipy's one dimensional running median.
+
+    Parameters:
+        tif (np.ndarray): The [t, x, y] movie to filter.
+        nFrames (int): Width of the median window. Must be odd.
+        out (np.ndarray): Optional preallocated output with the same shape as tif.
+    Returns:
+        np.ndarray: The filtered movie. Medians are values of the input, so the
+        input dtype is kept unless ``out`` was given.
+    """
+    if out is None:
+        out = np.empty(tif.shape, dtype=tif.dtype)
+    mt = tif.shape[0]
+    gap = nFrames // 2
+    for xs in spatial_tiles(tif.shape):
+        block = tif[:, xs]
+        traces = np.zeros((block[0].size, mt + gap), dtype=tif.dtype)
+        traces[:, :mt] = block.reshape(mt, -1).T
+        filtered = ndimage.median_filter(
+            traces.ravel(), size=nFrames, mode="constant", cval=0
+        ).reshape(traces.shape)
+        out[:, xs] = filtered[:, :mt].T.reshape(block.shape)
+    return out
+
+
 class Fourier_filter(BaseProcess):
     """fourier_filter(frame_rate, low, high, loglogPreview, keepSourceWindow=False)
 
@@ -736,17 +827,9 @@ class Fourier_filter(BaseProcess):
             return
         if low == 0 and high == frame_rate / 2.0:
             return
-        mt, mx, my = self.tif.shape
-        W = fftfreq(mt, d=1.0 / frame_rate)
-        filt = np.ones((mt))
-        filt[(np.abs(W) < low)] = 0
-        filt[(np.abs(W) > high)] = 0
-        self.newtif = np.zeros(self.tif.shape)
-        for i in np.arange(my):
-            for j in np.arange(mx):
-                f_signal = fft(self.tif[:, i, j])
-                f_signal *= filt
-                self.newtif[:, i, j] = np.real(ifft(f_signal))
+        self.newtif = self.map_chunks(
+            lambda block: fourier_filter_stack(block, frame_rate, low, high), axis=1
+        )
         self.newname = self.oldname + " - Fourier Filtered"
         return self.end()
 
@@ -762,11 +845,9 @@ class Fourier_filter(BaseProcess):
                     self.roi.redraw_trace()  # redraw roi without filter
                 else:
                     trace = self.roi.getTrace()
-                    W = fftfreq(len(trace), d=1.0 / frame_rate)
-                    f_signal = fft(trace)
-                    f_signal[(np.abs(W) < low)] = 0
-                    f_signal[(np.abs(W) > high)] = 0
-                    cut_signal = np.real(ifft(f_signal))
+                    filt = fourier_mask(len(trace), frame_rate, low, high)
+                    f_signal = scipy.fft.rfft(trace) * filt
+                    cut_signal = scipy.fft.irfft(f_signal, n=len(trace))
                     roi_index = g.currentTrace.get_roi_index(self.roi)
                     g.currentTrace.update_trace_full(
                         roi_index, cut_signal
@@ -812,6 +893,58 @@ def plotSpectrum(y,Fs):
 fourier_filter = Fourier_filter()
 
 
+def fourier_mask(mt: int, frame_rate: float, low: float, high: float) -> np.ndarray:
+    """fourier_mask(mt, frame_rate, low, high)
+
+    Returns:
+        np.ndarray: 1 for every rfft frequency of an mt frame trace that lies
+        between low and high (inclusive), 0 everywhere else.
+    """
+    W = scipy.fft.rfftfreq(mt, d=1.0 / frame_rate)
+    return ((W >= low) & (W <= high)).astype(np.float64)
+
+
+def fourier_filter_stack(
+    tif: np.ndarray,
+    frame_rate: float,
+    low: float,
+    high: float,
+    out: np.ndarray | None = None,
+) -> np.ndarray:
+    """fourier_filter_stack(tif, frame_rate, low, high, out=None)
+
+    Band-pass filters every pixel of a [t, x, y] movie in the frequency domain.
+    Since the movie is real, only the non-negative half of the spectrum is
+    computed. Tiles are sized so the spectrum and the filtered result of one
+    tile stay within g.settings['memory_budget_mb'].
+
+    Parameters:
+        tif (np.ndarray): The [t, x, y] movie to filter.
+        frame_rate (float): Frame rate in Hz.
+        low (float): Low cutoff frequency in Hz.
+        high (float): High cutoff frequency in Hz.
+        out (np.ndarray): Optional preallocated output with the same shape as tif.
+    Returns:
+        np.ndarray: The filtered movie, of type g.settings['internal_data_type']
+        unless ``out`` was given.
+    """
+    if out is None:
+        out = np.empty(tif.shape, dtype=g.settings["internal_data_type"])
+    mt = tif.shape[0]
+    filt = fourier_mask(mt, frame_rate, low, high)
+    workers = g.settings["nCores"]
+    max_bytes = g.settings["memory_budget_mb"] * 2**20
+    # a complex128 spectrum plus a float64 result per frame of each pixel
+    for xs in spatial_tiles(tif.shape, itemsize=24, max_bytes=max_bytes):
+        block = tif[:, xs]
+        traces = block.reshape(mt, -1).T  # transforms are fastest on the last axis
+        f_signal = scipy.fft.rfft(traces, axis=-1, workers=workers)
+        f_signal *= filt
+        filtered = scipy.fft.irfft(f_signal, n=mt, axis=-1, workers=workers)
+        out[:, xs] = filtered.T.reshape(block.shape)
+    return out
+
+
 class Difference_filter(BaseProcess):
     """difference_filter(keepSourceWindow=False)
 
@@ -832,9 +965,13 @@ class Difference_filter(BaseProcess):
 
     def __call__(self, keepSourceWindow: bool = False):
         self.start(keepSourceWindow)
-        self.newtif = np.zeros(self.tif.shape)
-        for i in np.arange(1, len(self.newtif)):
-            self.newtif[i] = self.tif[i] - self.tif[i - 1]
+
+        def difference(block):
+            out = np.zeros(block.shape)
+            out[1:] = block[1:] - block[:-1]
+            return out
+
+        self.newtif = self.map_chunks(difference, halo=1)
         self.newname = self.oldname + " - Difference Filtered"
         return self.end()
 
@@ -1085,18 +1222,19 @@ class Bilateral_filter(BaseProcess):
         if self.tif.ndim != 3:
             g.alert("Bilateral filter requires 3-dimensional image.")
             return
-        if g.settings["multiprocessing"]:
+        if g.settings["multiprocessing"] and not self.in_background:
             self.newtif = bilateral_filter_multi(
-                soft, beta, width, stoptol, maxiter, g.win.image
+                soft, beta, width, stoptol, maxiter, self.tif
             )
         else:
-            self.newtif = np.zeros(self.tif.shape)
-            mt, mx, my = self.tif.shape
-            for i in np.arange(mx):
-                for j in np.arange(my):
-                    self.newtif[:, i, j] = bilateral_smooth(
-                        soft, beta, width, stoptol, maxiter, self.tif[:, i, j]
-                    )
+            self.newtif = np.empty(self.tif.shape, g.settings["internal_data_type"])
+            for xs in spatial_tiles(self.tif.shape, itemsize=BILATERAL_ITEMSIZE):
+                if self.cancelled():
+                    self.show_status("{} cancelled.".format(self.__name__))
+                    return None
+                self.newtif[:, xs] = bilateral_smooth(
+                    soft, beta, width, stoptol, maxiter, self.tif[:, xs]
+                )
         self.newname = self.oldname + " - Bilateral Filtered"
         return self.end()
 
@@ -1122,129 +1260,93 @@ class Bilateral_filter(BaseProcess):
 
 def bilateral_filter_multi(
     soft: bool, beta: float, width: float, stoptol: float, maxiter: int, tif: np.ndarray
-) -> np.ndarray:
-    nThreads = g.settings["nCores"]
-    mt, mx, my = tif.shape
-    block_ends = np.linspace(0, mx, nThreads + 1).astype(int)
-    data = [
-        tif[:, block_ends[i] : block_ends[i + 1], :] for i in np.arange(nThreads)
-    ]  # split up data along x axis. each thread will get one.
-    args = (soft, beta, width, stoptol, maxiter)
-    progress = ProgressBar(
-        bilateral_filter_inner, data, args, nThreads, msg="Performing Bilateral Filter"
+) -> np.ndarray | None:
+    progress = PoolProgressBar(
+        bilateral_filter_inner,
+        tif,
+        (soft, beta, width, stoptol, maxiter),
+        g.settings["nCores"],
+        dtype=g.settings["internal_data_type"],
+        msg="Performing Bilateral Filter",
     )
-    if progress.results is None or any(r is None for r in progress.results):
-        result = None
-    else:
-        result = np.concatenate(progress.results, axis=1)
-    return result
+    return progress.result
 
 
 def bilateral_filter_inner(
-    q_results,
-    q_progress,
-    q_status,
-    child_conn: multiprocessing.connection.Connection,
-    args: tuple,
-) -> None:
-    data = child_conn.recv()  # unfortunately this step takes a long time
-    percent = 0  # This is the variable we send back which displays our progress
-    status = q_status.get(
-        True
-    )  # this blocks the process from running until all processes are launched
-    if status == "Stop":
-        q_results.put(None)  # if the user presses stop, return None
-
-    # Here is the meat of the inner_func.
-    soft, beta, width, stoptol, maxiter = (
-        args  # unpack all the variables inside the args tuple
-    )
-    result = np.zeros(data.shape)
+    data: np.ndarray, result: np.ndarray, args: tuple, progress: BlockProgress
+) -> bool:
+    soft, beta, width, stoptol, maxiter = args
     tt, xx, yy = data.shape
-    for x in np.arange(xx):
-        for y in np.arange(yy):
-            result[:, x, y] = bilateral_smooth(
-                soft, beta, width, stoptol, maxiter, data[:, x, y]
-            )
-            if not q_status.empty():  # check if the stop button has been pressed
-                stop = q_status.get(False)
-                q_results.put(None)
-                return
-        if percent < int(100 * x / xx):
-            percent = int(100 * x / xx)
-            q_progress.put(percent)
+    percent = 0
+    for xs in spatial_tiles(data.shape, itemsize=BILATERAL_ITEMSIZE):
+        if progress.stopped():  # check if the stop button has been pressed
+            return False
+        result[:, xs] = bilateral_smooth(
+            soft, beta, width, stoptol, maxiter, data[:, xs]
+        )
+        if percent < int(100 * xs.stop / xx):
+            percent = int(100 * xs.stop / xx)
+            progress.update(percent)
+    return True
+
 
-    # finally, when we've finished with our calculation, we send back the result
-    q_results.put(result)
+# bilateral_smooth keeps about six float64 arrays the size of its input alive.
+BILATERAL_ITEMSIZE = 48
 
 
 def bilateral_smooth(
     soft: bool, beta: float, width: float, stoptol: float, maxiter: int, y: np.ndarray
 ) -> np.ndarray:
-    display = False  # 1 to report iteration values
-
-    y = np.array(y[:])
-    N = np.size(y, 0)
-    w = np.zeros((N, N))
-    j = np.arange(0, N)
-
-    # construct initial bilateral kernel
-    for i in np.arange(0, N):
-        w[i, np.arange(0, N)] = abs(i - j) <= width
-
-    # initial guess from input signal
-    xold = np.copy(y)
+    """bilateral_smooth(soft, beta, width, stoptol, maxiter, y)
 
-    # new matrix for storing distances
-    d = np.zeros((N, N))
+    Iterative bilateral mean shift smoothing along the first axis of ``y``.
 
-    # fig1 = plt.plot(y)
+    The spatial kernel only connects frames that are at most ``width`` apart, so
+    each iteration visits the 2 * width off-diagonals of the kernel instead of
+    building dense N x N matrices. Every trace of a [t, ...] block is smoothed
+    at once. A trace stops updating when the squared change of one iteration
+    falls below ``stoptol``.
 
-    if display:
-        if soft:
-            print("Soft kernel")
-        else:
-            print("Hard kernel")
-        print("Kernel parameters beta= %d, W= %d" % (beta, width))
-        print("Iter# Change")
+    Parameters:
+        soft (bool): True for a gaussian kernel, False for a hard kernel.
+        beta (float): beta of the kernel.
+        width (float): width of the kernel, in frames.
+        stoptol (float): tolerance for convergence.
+        maxiter (int): maximum number of iterations.
+        y (np.ndarray): A 1D trace, or a [t, ...] block of traces.
+    Returns:
+        np.ndarray: float64 array with the same shape as y.
+    """
+    N = np.size(y, 0)
+    xold = np.array(y, dtype=np.float64).reshape(N, -1)
+    K = int(np.floor(width))
+    active = np.arange(xold.shape[1])  # traces that have not converged yet
 
-    # start iteration
     iterate = 1
-    gap = np.inf
-
-    while iterate < maxiter:
-        if display:
-            print("%d %f" % (iterate, gap))
-
-        # calculate paiwise distances for all points
-        for i in np.arange(0, N):
-            d[:, i] = 0.5 * (xold - xold[i]) ** 2
-
-        # create kernel
-        if soft:
-            W = np.multiply(np.exp(-beta * d), w)
-
-        else:
-            W = np.multiply((d <= beta**2), w)
-
-        # apply kernel to get weighted mean shift
-        xnew1 = np.sum(np.multiply(np.transpose(W), xold), axis=1)
-        xnew2 = np.sum(W, axis=1)
-        xnew = np.divide(xnew1, xnew2)
-
-        # plt.plot(xnew)
-
-        # check for convergence
-        gap = np.sum(np.square(xold - xnew))
-
-        if gap < stoptol:
-            if display:
-                print("Converged in %d iterations" % iterate)
-            break
-
-        xold = np.copy(xnew)
+    while iterate < maxiter and active.size > 0:
+        x = xold[:, active]
+        xnew1 = x.copy()  # every frame has weight 1 for itself
+        xnew2 = np.ones_like(x)
+        for k in range(1, min(K, N - 1) + 1):
+            # pairwise distances between frames i and i + k
+            d = 0.5 * (x[k:] - x[:-k]) ** 2
+            if soft:
+                W = np.exp(-beta * d)
+            else:
+                W = (d <= beta**2).astype(np.float64)
+            xnew1[:-k] += W * x[k:]
+            xnew2[:-k] += W
+            xnew1[k:] += W * x[:-k]
+            xnew2[k:] += W
+        xnew = xnew1 / xnew2
+
+        # converged traces keep their previous estimate
+        gap = np.sum(np.square(x - xnew), axis=0)
+        moving = gap >= stoptol
+        xold[:, active[moving]] = xnew[:, moving]
+        active = active[moving]
         iterate += 1
-    return xold
+    return xold.reshape(np.shape(y))
 
 
 bilateral_filter = Bilateral_filter()
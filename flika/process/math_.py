@@ -59,10 +59,11 @@ class Subtract(BaseProcess):
         self.gui_reset()
         value = QtWidgets.QDoubleSpinBox()
         if g.win is not None:
-            maxx = np.max(g.win.image) * 100
+            stats = g.win.stats()
+            maxx = stats.max * 100
             minn = -1 * maxx  # -np.max sometimes returns abnormal large value
             value.setRange(minn, maxx)
-            value.setValue(np.min(g.win.image))
+            value.setValue(stats.min)
         self.items.append({"name": "value", "string": "Value", "object": value})
         self.items.append(
             {"name": "preview", "string": "Preview", "object": CheckBox()}
@@ -73,16 +74,18 @@ class Subtract(BaseProcess):
         self.start(keepSourceWindow)
         if hasattr(value, "is_integer") and value.is_integer():
             value = int(value)
+        stats = self.oldwindow.stats()
         if np.issubdtype(self.tif.dtype, np.integer):
             ddtype = np.iinfo(self.tif.dtype)
             # Simple bounds check for subtraction
-            while (value > 0 and np.min(self.tif) < ddtype.min + value) or (
-                value < 0 and np.max(self.tif) > ddtype.max + value
+            while (value > 0 and stats.min < ddtype.min + value) or (
+                value < 0 and stats.max > ddtype.max + value
             ):
                 ddtype = np.iinfo(upgrade_dtype(ddtype.dtype))
             self.newtif = self.tif.astype(ddtype.dtype) - value
         else:
             self.newtif = self.tif - value
+        self.newstats = stats.shifted(-value)
         self.newname = self.oldname + " - Subtracted " + str(value)
         return self.end()
 
@@ -109,6 +112,9 @@ class Subtract_trace(BaseProcess):
         newWindow
     """
 
+    # reads g.currentTrace, which only the GUI thread may touch
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
@@ -139,6 +145,9 @@ class Divide_trace(BaseProcess):
         newWindow
     """
 
+    # reads g.currentTrace, which only the GUI thread may touch
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
@@ -24,6 +24,8 @@ class Measure(BaseProcess):
 
     """
 
+    runs_in_background = False
+
     def __init__(self):
         self.ON = False
         super().__init__()
@@ -160,16 +162,11 @@ class Measure(BaseProcess):
     def getNearestPoint(self, point):
         if hasattr(self.fig, "imageview"):
             return point
-        roi = g.currentTrace.rois[0]
-        d = roi["p2trace"].getData()
-        index = np.abs(d[0] - point[0]).argmin()
-        x = d[0][index]
-        ys = []
-        for roi in g.currentTrace.rois:
-            d = roi["p2trace"].getData()
-            ys.append(d[1][index])
-        roi_idx = np.argmin(abs(ys - point[1]))
-        y = ys[roi_idx]
+        # the plotted traces are decimated, so snap to the full resolution samples
+        traces = [roi["pyramid"].data for roi in g.currentTrace.rois]
+        x = int(np.clip(np.round(point[0]), 0, len(traces[0]) - 1))
+        ys = np.array([trace[min(x, len(trace) - 1)] for trace in traces])
+        y = ys[np.argmin(np.abs(ys - point[1]))]
         return np.array([x, y])
 
     def export_gui(self):
@@ -20,6 +20,8 @@ class Time_Stamp(BaseProcess):
         None
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
@@ -93,6 +95,8 @@ class Background(BaseProcess):
         None
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
@@ -171,6 +175,8 @@ class Scale_Bar(BaseProcess):
         show (bool): controls whether the Scale_bar is displayed or not
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
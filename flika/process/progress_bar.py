@@ -1,10 +1,13 @@
+import multiprocessing
 import sys
 import time
-from multiprocessing import Pipe, Process, Queue, cpu_count
+from multiprocessing import Pipe, Process, Queue, cpu_count, shared_memory
 
 import numpy as np
 from qtpy import QtCore, QtWidgets
 
+from flika.logger import logger
+
 __all__ = []
 
 tic = time.time()
@@ -184,6 +187,235 @@ class ProgressBar(QtWidgets.QWidget):
                 pass
 
 
+###############################################################################
+##################   SHARED MEMORY WORKER POOL   ##############################
+###############################################################################
+"""
+PoolProgressBar runs an inner function on blocks of an array using a persistent
+pool of worker processes. The input array is placed in shared memory once, and
+every worker writes its block of the result directly into a shared output
+array, so nothing is pickled through pipes and no results need to be
+concatenated.
+"""
+
+_pool = None
+_pool_size = 0
+_progress_queue = None
+_stop_event = None
+_job_counter = 0
+
+
+def _init_worker(progress_queue, stop_event):
+    global _progress_queue, _stop_event
+    _progress_queue = progress_queue
+    _stop_event = stop_event
+
+
+def get_worker_pool(nCores):
+    """get_worker_pool(nCores)
+    Returns the persistent pool of worker processes, creating it the first time
+    it is needed or whenever the number of cores changes.
+    """
+    global _pool, _pool_size, _progress_queue, _stop_event
+    if _pool is None or _pool_size != nCores:
+        shutdown_worker_pool()
+        _progress_queue = Queue()
+        _stop_event = multiprocessing.Event()
+        _pool = multiprocessing.Pool(
+            nCores, initializer=_init_worker, initargs=(_progress_queue, _stop_event)
+        )
+        _pool_size = nCores
+    return _pool
+
+
+def shutdown_worker_pool():
+    """shutdown_worker_pool()
+    Terminates the persistent pool of worker processes, if it exists.
+    """
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+        _pool_size = 0
+
+
+def _attach_shared_memory(name):
+    if sys.version_info >= (3, 13):
+        # the process that created the block is responsible for unlinking it
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _close_shared_memory(shm):
+    try:
+        shm.close()
+    except BufferError:  # a traceback still holds a view into the block
+        pass
+
+
+class _ResultMemory(shared_memory.SharedMemory):
+    """Shared memory block for the output of a PoolProgressBar. The result array
+    is built on its mmap, so closing the block leaves the mapping to that array,
+    which unmaps it once it is garbage collected."""
+
+    def close(self):
+        self._mmap = None
+        super().close()
+
+
+class BlockProgress(object):
+    """Passed to the inner function of a PoolProgressBar, which uses it to report
+    the progress of its block and to check whether Stop has been pressed."""
+
+    def __init__(self, job, block):
+        self.job = job
+        self.block = block
+
+    def update(self, percent):
+        _progress_queue.put((self.job, self.block, percent))
+
+    def stopped(self):
+        return _stop_event.is_set()
+
+
+def _run_block(innerfunc, job, block, src_spec, dst_spec, block_slice, args):
+    src = _attach_shared_memory(src_spec[0])
+    dst = _attach_shared_memory(dst_spec[0])
+    data = np.ndarray(src_spec[1], src_spec[2], buffer=src.buf)[block_slice]
+    result = np.ndarray(dst_spec[1], dst_spec[2], buffer=dst.buf)[block_slice]
+    try:
+        finished = innerfunc(data, result, args, BlockProgress(job, block))
+        return finished is not False
+    finally:
+        del data, result
+        _close_shared_memory(src)
+        _close_shared_memory(dst)
+
+
+class PoolProgressBar(QtWidgets.QWidget):
+    """PoolProgressBar(innerfunc, tif, args, nCores, dtype=None, msg="Performing Operations", parent=None)
+    Splits ``tif`` into nCores blocks along axis 1 and runs
+    ``innerfunc(data, result, args, progress)`` on each block in the persistent
+    worker pool. ``data`` is the block of the input, ``result`` the matching
+    block of the output, which the inner function fills in place, and
+    ``progress`` a BlockProgress. If Stop is pressed or a block fails,
+    ``self.result`` is None. Otherwise it holds the output array, a view into
+    the shared memory the workers wrote it to.
+    """
+
+    finished_sig = QtCore.Signal()
+
+    def __init__(
+        self,
+        innerfunc,
+        tif,
+        args,
+        nCores,
+        dtype=None,
+        msg="Performing Operations",
+        parent=None,
+    ):
+        super(PoolProgressBar, self).__init__(parent)
+        global _job_counter
+        self.nCores = nCores
+        self.msg = msg
+        self.result = None
+
+        # GUI
+        self.label = QtWidgets.QLabel(msg)
+        self.progress_bars = []
+        self.button = QtWidgets.QPushButton("Stop")
+        self.button.clicked.connect(self.handleButton)
+        main_layout = QtWidgets.QGridLayout()
+        main_layout.addWidget(self.label, 0, 0)
+        main_layout.addWidget(self.button, 0, 1)
+        for i in range(nCores):
+            bar = QtWidgets.QProgressBar()
+            bar.setMinimum(1)
+            bar.setMaximum(100)
+            main_layout.addWidget(bar, 1 + i, 0)
+            self.progress_bars.append(bar)
+        self.setLayout(main_layout)
+        self.setWindowTitle(msg)
+        self.stopPressed = False
+        self.show()
+        QtWidgets.QApplication.processEvents()
+
+        pool = get_worker_pool(nCores)
+        _stop_event.clear()
+        _job_counter += 1
+        self.job = _job_counter
+        dtype = np.dtype(tif.dtype if dtype is None else dtype)
+        self.src = shared_memory.SharedMemory(create=True, size=max(tif.nbytes, 1))
+        self.dst = _ResultMemory(
+            create=True, size=max(int(np.prod(tif.shape)) * dtype.itemsize, 1)
+        )
+        src_view = np.ndarray(tif.shape, tif.dtype, buffer=self.src.buf)
+        src_view[:] = tif
+        del src_view
+        src_spec = (self.src.name, tif.shape, tif.dtype)
+        self.dst_spec = (self.dst.name, tif.shape, dtype)
+        block_ends = np.linspace(0, tif.shape[1], nCores + 1).astype(int)
+        self.async_results = []
+        for i in range(nCores):
+            block_slice = (slice(None), slice(block_ends[i], block_ends[i + 1]))
+            self.async_results.append(
+                pool.apply_async(
+                    _run_block,
+                    (innerfunc, self.job, i, src_spec, self.dst_spec, block_slice, args),
+                )
+            )
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.check_if_finished)
+        self.timer.start(50)
+
+        self.loop = QtCore.QEventLoop()
+        self.finished = False
+        self.finished_sig.connect(self.loop.quit)
+        self.finished_sig.connect(self.update_finished_status)
+        self.loop.exec_()  # This blocks until the "finished" signal is emitted
+
+        while self.finished is False:  # see ProgressBar.__init__
+            time.sleep(0.01)
+            QtWidgets.QApplication.processEvents()
+        self.collect_result()
+        self.close()
+
+    def check_if_finished(self):
+        while not _progress_queue.empty():
+            job, block, percent = _progress_queue.get()
+            if job == self.job:
+                self.progress_bars[block].setValue(percent)
+        if self.stopPressed:
+            _stop_event.set()
+        if all(r.ready() for r in self.async_results):
+            self.timer.timeout.disconnect()
+            self.finished_sig.emit()
+
+    def collect_result(self):
+        succeeded = True
+        for r in self.async_results:
+            try:
+                succeeded = r.get() and succeeded
+            except Exception as e:
+                logger.error("Error in worker process: {}".format(e))
+                succeeded = False
+        if succeeded and not self.stopPressed:
+            name, shape, dtype = self.dst_spec
+            self.result = np.ndarray(shape, dtype, buffer=self.dst.buf.obj)
+        for shm in (self.src, self.dst):
+            shm.close()
+            shm.unlink()
+
+    def handleButton(self):
+        self.stopPressed = True
+
+    def update_finished_status(self):
+        self.finished = True
+
+
 #    def closeEvent(self, event):
 #        for child in self.findChildren(QtGui.QDialog):
 #            if child is not widget:
@@ -209,6 +441,24 @@ class ProgressBar(QtWidgets.QWidget):
 
 
 """
+PoolProgressBar only needs an inner function. It receives a block of the input
+array, the matching block of the output array to fill in place, the args tuple
+and a BlockProgress object:
+
+    def inner_func(data, result, args, progress):
+        (val,) = args
+        for i in np.arange(len(data)):
+            if progress.stopped():  # the stop button has been pressed
+                return False
+            result[i] = data[i] + val
+            progress.update(int(100 * (i + 1) / len(data)))
+
+    result = PoolProgressBar(inner_func, original_data, (1,), nCores).result
+
+The inner function has to be importable by the worker processes, so define it at
+the top level of a module.
+
+The older ProgressBar pipes each block of data to freshly created processes.
 When using the Progress Bar, you need to write two functions:
     1) An outer function that takes an object like a numpy array, breaks it into blocks, and creates the ProgressBar object.
     2) An inner function that receives the chunks, performs the processing, and returns the results.
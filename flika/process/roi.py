@@ -5,6 +5,7 @@ from qtpy import QtWidgets
 import flika.global_vars as g
 from flika.utils.BaseProcess import BaseProcess
 from flika.utils.custom_widgets import CheckBox
+from flika.utils.thread_manager import run_on_gui_thread
 
 __all__ = ["set_value"]
 
@@ -76,19 +77,19 @@ class Set_value(BaseProcess):
             mt, mx, my = self.tif.shape
         elif nDim == 2:
             mx, my = self.tif.shape
+        # the ROI of the window being processed, which may not be g.win when the
+        # process runs in the background. ROIs are read on the GUI thread.
+        roi = self.oldwindow.currentROI
         if restrictToROI:
-            roi = g.win.currentROI
-            xx, yy = roi.getMask()
+            xx, yy = run_on_gui_thread(roi.getMask)
             if nDim == 2:
                 self.newtif[xx, yy] = value
             elif nDim == 3:
-                for i in np.arange(firstFrame, lastFrame + 1):
-                    self.newtif[i][xx, yy] = value
+                self.newtif[firstFrame : lastFrame + 1, xx, yy] = value
         elif restrictToOutside:
-            roi = g.win.currentROI
-            roi.pts = roi.getPoints()
-            x = np.array([p[0] for p in roi.pts])
-            y = np.array([p[1] for p in roi.pts])
+            pts = run_on_gui_thread(roi.getPoints)
+            x = np.array([p[0] for p in pts])
+            y = np.array([p[1] for p in pts])
             xx, yy = skimage.draw.polygon(x, y)
             inside_bounds = (xx >= 0) & (yy >= 0) & (xx < mx) & (yy < my)
             xx = xx[inside_bounds]
@@ -81,6 +81,8 @@ class Deinterleave(BaseProcess):
         newWindow
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
@@ -280,9 +282,15 @@ class Resize(BaseProcess):
         if not is_rgb:
             if nDim == 3:
                 mt, mx, my = A.shape
-                B = np.zeros((mt, mx * factor, my * factor))
-                for t in np.arange(mt):
-                    B[t] = skimage.transform.resize(A[t], (mx * factor, my * factor))
+                B = self.map_frames(
+                    lambda frame: skimage.transform.resize(
+                        frame, (mx * factor, my * factor)
+                    ),
+                    tif=A,
+                    dtype=np.float64,
+                )
+                if B is None:
+                    return None
             elif nDim == 2:
                 mx, my = A.shape
                 B = skimage.transform.resize(A, (mx * factor, my * factor))
@@ -420,9 +428,7 @@ class ZProject(BaseProcess):
     def __call__(self, firstFrame, lastFrame, projection_type, keepSourceWindow=False):
         self.start(keepSourceWindow)
         if self.tif.ndim != 3 or self.tif.shape[2] == 3:
-            g.m.statusBar().showMessage(
-                "zproject only works on 3 dimensional, non-color windows"
-            )
+            self.show_status("zproject only works on 3 dimensional, non-color windows")
             return False
         self.newtif = self.tif[firstFrame : lastFrame + 1]
         p = projection_type
@@ -458,6 +464,8 @@ class Image_calculator(BaseProcess):
         newWindow
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
@@ -583,6 +591,8 @@ class Concatenate_stacks(BaseProcess):
         newWindow
     """
 
+    runs_in_background = False
+
     def __init__(self):
         super().__init__()
 
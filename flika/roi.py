@@ -14,6 +14,9 @@ Example:
     >>> win2 = open_file()
     >>> roi2 = win2.paste()
 
+Traces can also be computed from files, without a Window:
+    >>> traces = extract_traces('recording.tif', 'rois.txt')
+
 Todo:
     * Correct ROI line handles to be at center of pixel
 """
@@ -21,14 +24,19 @@ Todo:
 # Standard library imports
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+
 import jaxtyping
 import numpy as np
 import pyqtgraph as pg
+import scipy.ndimage
+import scipy.sparse
 import skimage.draw
 from pyqtgraph.graphicsItems.ROI import Handle
 from qtpy import QtCore, QtGui, QtWidgets
 
 import flika.global_vars as g
+from flika.logger import logger
 from flika.utils.misc import nonpartial, open_file_gui, random_color
 
 
@@ -151,8 +159,7 @@ class ROI_Base:
 
     def __init__(self, window, pts):
         self.window = window  #: window.Window: Parent window that this ROI belongs to
-        self.colorDialog = QtWidgets.QColorDialog()
-        self.colorDialog.colorSelected.connect(self.colorSelected)
+        self.colorDialog = None
         self.window.closeSignal.connect(self.delete)
         self.window.currentROI = self
         self.traceWindow = None  #: tracefig.TraceFig: the Trace window that this ROI is plotted in. To test if roi is plotted, check 'roi.traceWindow is None'
@@ -161,8 +168,11 @@ class ROI_Base:
             pts
         )  #: list: Array of points that make up the boundary of the ROI
         self.linkedROIs = set()
+        self.maskGeneration = 0  #: int: incremented to invalidate the cached mask
+        self._maskCache = None
+        self._runningTrace = _RunningTrace()
         self.resetSignals()
-        self.makeMenu()
+        self.menu = None  # made on first use, creating thousands of ROIs is faster
         self.pen = pg.mkPen(QtGui.QColor(255, 255, 255))
         self.currentPen = self.pen
         self.mouseHovering = False
@@ -243,6 +253,7 @@ class ROI_Base:
             self.traceWindow.translateFinished(self)
 
     def onRegionChange(self):
+        self.invalidateMask()
         self.pts = self.getPoints()
         self.updateLinkedROIs(finish=False)
 
@@ -258,8 +269,52 @@ class ROI_Base:
         self.linkedROIs = join - {self}
         roi.linkedROIs = join - {roi}
 
-    def getMask(self):
-        """Returns the list of integer points contained within the ROI, differs by ROI type"""
+    def getMask(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the (xx, yy) integer points contained within the ROI, differs by ROI type
+
+        The points are cached until the geometry of the ROI changes, so the arrays
+        returned are read-only.
+        """
+        key = (self.maskGeneration, self.window.mx, self.window.my, self._maskKey())
+        cache = self._maskCache
+        if cache is None or cache[0] != key:
+            xx, yy = self._computeMask()
+            xx, yy = np.array(xx, dtype=np.intp), np.array(yy, dtype=np.intp)
+            xx.flags.writeable = yy.flags.writeable = False
+            cache = (key, (xx, yy), None)
+            self._maskCache = cache
+        return cache[1]
+
+    def getMaskIndices(self) -> jaxtyping.Integer[np.ndarray, "n"]:
+        """Returns the flat indices x*my + y of the points returned by getMask(), in
+        the same order. Use them with np.take on frames reshaped to [t, mx*my].
+        """
+        xx, yy = self.getMask()
+        key, mask, idx = self._maskCache
+        if idx is None:
+            idx = xx * self.window.my + yy
+            idx.flags.writeable = False
+            self._maskCache = (key, mask, idx)
+        return idx
+
+    def _setCachedMask(self, idx) -> None:
+        """Use precomputed flat indices, e.g. read from an ROI file, as the mask of
+        the current geometry"""
+        idx = np.array(idx, dtype=np.intp)
+        xx, yy = np.divmod(idx, self.window.my)
+        xx.flags.writeable = yy.flags.writeable = idx.flags.writeable = False
+        key = (self.maskGeneration, self.window.mx, self.window.my, self._maskKey())
+        self._maskCache = (key, (xx, yy), idx)
+
+    def invalidateMask(self) -> None:
+        """Discard the cached mask, so the next getMask() call recomputes it"""
+        self.maskGeneration += 1
+
+    def _maskKey(self):
+        """Hashable summary of the geometry that the mask is computed from"""
+        return np.asarray(self.pts, dtype=float).tobytes()
+
+    def _computeMask(self):
         raise NotImplementedError()
 
     def getTrace(
@@ -270,28 +325,48 @@ class ROI_Base:
         Returns:
             Average value within ROI mask, as an array. Cropped to bounds if specified
         """
-        trace: jaxtyping.Float[np.ndarray, "t"] | None
         if self.window.image.ndim == 4 or self.window.metadata["is_rgb"]:
             g.alert(
                 "Plotting trace of RGB movies is not supported. Try splitting the channels."
             )
             return None
-        s1, s2 = self.getMask()
-        if np.size(s1) == 0 or np.size(s2) == 0:
-            trace = np.zeros(self.window.mt, dtype=float)
-
-        elif self.window.image.ndim == 3:
-            trace = self.window.image[:, s1, s2]
-            if trace is not None:
-                while trace.ndim > 1:
-                    trace = np.average(trace, 1)
-        elif self.window.image.ndim == 2:
-            trace = self.window.image[s1, s2]
-            if trace is not None:
-                trace = np.array([np.average(trace)])
-        if bounds and trace is not None:
-            trace = trace[bounds[0] : bounds[1]]
-        return trace
+        return _mask_traces(self.window, [self], bounds)[0]
+
+    def _cachedTrace(
+        self, bounds: list[int] | None = None
+    ) -> jaxtyping.Float[np.ndarray, "t"] | None:
+        """Compute the trace from data cached by the window, or None if the ROI
+        type or the window's cache does not allow it"""
+        return None
+
+    def getTraceSampling(self):
+        """Returns what getTraceIncremental reads from the geometry of the ROI, here
+        the flat indices of its mask. Read it on the GUI thread to compute the trace
+        on a worker thread while the ROI keeps moving.
+        """
+        return self.getMaskIndices()
+
+    def getTraceIncremental(
+        self, bounds: list[int] | None = None, sampling=None
+    ) -> jaxtyping.Float[np.ndarray, "t"] | None:
+        """Compute the same trace as getTrace, updating the per-frame sums of the
+        previous call with only the pixels that entered or left the mask since.
+        Used to redraw the trace while the ROI is being dragged.
+
+        Args:
+            bounds: [first, last) frames to compute, or None for the whole movie
+            sampling: the result of getTraceSampling(). Read from the ROI if None.
+
+        Returns:
+            Average value within ROI mask, as an array. Cropped to bounds if specified
+        """
+        if type(self).getTrace is not ROI_Base.getTrace:
+            return self.getTrace(bounds)
+        if sampling is None:
+            sampling = self.getTraceSampling()
+        if self.window.image.ndim == 4 or self.window.metadata["is_rgb"]:
+            return self.getTrace(bounds)
+        return self._runningTrace.update(self.window, sampling, bounds)
 
     def getPoints(self) -> jaxtyping.Float[np.ndarray, "n 2"]:
         """Get points that represent this ROI, used for exporting
@@ -343,6 +418,9 @@ class ROI_Base:
         return self.traceWindow
 
     def changeColor(self, unused_flag: bool) -> None:
+        if self.colorDialog is None:
+            self.colorDialog = QtWidgets.QColorDialog()
+            self.colorDialog.colorSelected.connect(self.colorSelected)
         self.colorDialog.open()
 
     def colorSelected(self, color: QtGui.QColor) -> None:
@@ -385,6 +463,8 @@ class ROI_Base:
         pos: QtCore.QPoint = ev.screenPos()
         x: int = int(pos.x())
         y: int = int(pos.y())
+        if self.menu is None:
+            self.makeMenu()
         self.menu.addSeparator()
         self.menu.addActions(self.window.menu.actions())
         self.menu.popup(QtCore.QPoint(x, y))
@@ -511,6 +591,7 @@ class ROI_line(ROI_Base, pg.LineSegmentROI):
         #    self.sigRegionChanged.emit(self)
 
     def draw_from_points(self, pts, finish=True):
+        self.invalidateMask()
         self.blockSignals(True)
         self.movePoint(self.handles[0]["item"], pts[0], finish=False)
         self.movePoint(self.handles[1]["item"], pts[1], finish=False)
@@ -524,16 +605,8 @@ class ROI_line(ROI_Base, pg.LineSegmentROI):
         if self.kymograph:
             self.deleteKymograph()
 
-    def getMask(self):
-        x = np.array([p[0] for p in self.pts], dtype=int)
-        y = np.array([p[1] for p in self.pts], dtype=int)
-        xx, yy = skimage.draw.line(x[0], y[0], x[1], y[1])
-        idx_to_keep = np.logical_not(
-            (xx >= self.window.mx) | (xx < 0) | (yy >= self.window.my) | (yy < 0)
-        )
-        xx = xx[idx_to_keep]
-        yy = yy[idx_to_keep]
-        return xx, yy
+    def _computeMask(self):
+        return _line_mask(self.pts, self.window.mx, self.window.my)
 
     def getPoints(self) -> jaxtyping.Float[np.ndarray, "2 2"]:
         return np.array([handle["pos"] + self.state["pos"] for handle in self.handles])
@@ -551,38 +624,36 @@ class ROI_line(ROI_Base, pg.LineSegmentROI):
             g.alert("Can only kymograph a 3d movie")
             return
 
-        xx, yy = self.getMask()
-        mt = len(tif)
-        if len(xx) == 0:
-            return
-        xx = np.array(xx)
-        yy = np.array(yy)
-
-        if len(xx) == 0:
+        idx = self.getMaskIndices()
+        if len(idx) == 0:
             return
-        mn = np.zeros((mt, len(xx)))
-        for t in np.arange(mt):
-            mn[t] = tif[t, xx, yy]
-        mn = mn.T
+        mn = _kymograph(tif, idx).T
         if self.kymograph is None:
             self.createKymograph(mn)
         else:
             self.kymograph.imageview.setImage(mn, autoLevels=False, autoRange=False)
             # self.kymograph.imageview.view.setAspectLocked(lock=True,ratio=mn.shape[1]/mn.shape[0])
 
+    def _kymographSampling(self):
+        if self.window.image.ndim != 3 or len(self.getMaskIndices()) == 0:
+            return None
+        return self.getMaskIndices()
+
     def createKymograph(self, mn):
         from .window import Window
 
         oldwindow = g.win
         name = oldwindow.name + " - Kymograph"
         self.kymograph = Window(mn, name, metadata=self.window.metadata)
-        self.sigRegionChanged.connect(self.update_kymograph)
+        self.kymographUpdater = _KymographUpdater(self)
+        self.sigRegionChanged.connect(self.kymographUpdater.request)
         self.kymograph.closeSignal.connect(self.deleteKymograph)
         self.sigRemoveRequested.connect(self.deleteKymograph)
 
     def deleteKymograph(self):
         self.kymograph.closeSignal.disconnect(self.deleteKymograph)
-        self.sigRegionChanged.disconnect(self.update_kymograph)
+        self.sigRegionChanged.disconnect(self.kymographUpdater.request)
+        self.kymographUpdater.shutdown()
         self.kymograph = None
 
 
@@ -650,22 +721,64 @@ class ROI_rectangle(ROI_Base, pg.ROI):
             np.all(target < self.pts[0] + self.pts[1])
         )
 
-    def getMask(self) -> tuple[np.ndarray, np.ndarray]:
-        x, y = self.state["pos"]
-        ww, hh = self.state["size"]
+    def _maskKey(self):
+        return tuple(self.state["pos"]), tuple(self.state["size"])
 
-        xmin = max(x, 0)
-        ymin = max(y, 0)
-        xmax = min(x + ww, self.window.mx)
-        ymax = min(y + hh, self.window.my)
-
-        xx, yy = np.meshgrid(
-            np.arange(xmin, xmax, dtype=int), np.arange(ymin, ymax, dtype=int)
+    def _computeMask(self) -> tuple[np.ndarray, np.ndarray]:
+        return _rectangle_mask(
+            self.state["pos"], self.state["size"], self.window.mx, self.window.my
         )
 
-        return xx.flatten(), yy.flatten()
+    def _cachedTrace(
+        self, bounds: list[int] | None = None
+    ) -> jaxtyping.Float[np.ndarray, "t"] | None:
+        return self._integralTrace(self.state["pos"], self.state["size"], bounds)
+
+    def getTraceSampling(self):
+        pos, size = np.array(self.state["pos"]), np.array(self.state["size"])
+        return pos, size, self.getMaskIndices()
+
+    def getTraceIncremental(
+        self, bounds: list[int] | None = None, sampling=None
+    ) -> jaxtyping.Float[np.ndarray, "t"] | None:
+        if sampling is None:
+            sampling = self.getTraceSampling()
+        pos, size, idx = sampling
+        trace = self._integralTrace(pos, size, bounds)
+        if trace is not None:
+            return trace
+        return ROI_Base.getTraceIncremental(self, bounds, idx)
+
+    def _integralTrace(
+        self, pos, size, bounds: list[int] | None = None
+    ) -> jaxtyping.Float[np.ndarray, "t"] | None:
+        """Average the rectangle at pos with four lookups per frame in the window's
+        summed-area table (see Window.integralImage), or None if the rectangle is
+        not aligned to pixels or the window has no table"""
+        pos, size = np.asarray(pos), np.asarray(size)
+        if np.any(pos != np.round(pos)) or np.any(size != np.round(size)):
+            return None
+        S = self.window.integralImage()
+        if S is None:
+            return None
+        x, y = pos.astype(int)
+        ww, hh = size.astype(int)
+        xmin, ymin = max(x, 0), max(y, 0)
+        xmax, ymax = min(x + ww, self.window.mx), min(y + hh, self.window.my)
+        if bounds:
+            start, stop, _ = slice(bounds[0], bounds[1]).indices(len(S))
+        else:
+            start, stop = 0, len(S)
+        if xmax <= xmin or ymax <= ymin:
+            return np.zeros(max(stop - start, 0))
+        S = S[start:stop]
+        total = (
+            S[:, xmax, ymax] - S[:, xmin, ymax] - S[:, xmax, ymin] + S[:, xmin, ymin]
+        )
+        return total / ((xmax - xmin) * (ymax - ymin))
 
     def draw_from_points(self, pts, finish=True):
+        self.invalidateMask()
         self.setPos(pts[0], finish=False)
         self.setSize(pts[1], finish=False)
         self.pts = np.array(pts)
@@ -744,7 +857,6 @@ class ROI_freehand(ROI_Base, pg.ROI):
             self.pts, self.pos()
         )
         self._untranslated_mask = None
-        self.getMask()
 
     def shape(self):
         p = QtGui.QPainterPath()
@@ -764,10 +876,14 @@ class ROI_freehand(ROI_Base, pg.ROI):
     def draw_from_points(
         self, pts: jaxtyping.Float[np.ndarray, "n 2"], finish: bool = False
     ) -> None:
+        self.invalidateMask()
         self.blockSignals(True)
         self.setPos(*np.min(pts, 0), False)
         self.setSize(np.ptp(pts, 0), False)
-        self._untranslated_pts = np.subtract(pts, self.pos())
+        untranslated_pts = np.subtract(pts, self.pos())
+        if not np.array_equal(untranslated_pts, self._untranslated_pts):
+            self._untranslated_mask = None
+        self._untranslated_pts = untranslated_pts
         self.pts = pts
 
         self.sigRegionChanged.emit(self)
@@ -791,22 +907,18 @@ class ROI_freehand(ROI_Base, pg.ROI):
         """not yet implemented"""
         pass
 
-    def getMask(self):
-        if self._untranslated_mask is not None:
-            xx = self._untranslated_mask[0] + int(self.state["pos"][0])
-            yy = self._untranslated_mask[1] + int(self.state["pos"][1])
-        else:
-            x, y = np.transpose(self._untranslated_pts)
-            mask = np.zeros(self.window.imageDimensions())
-            xx, yy = skimage.draw.polygon(x, y, shape=mask.shape)
-            self._untranslated_mask = xx, yy
+    def _maskKey(self):
+        x, y = self.state["pos"]
+        return int(x), int(y), self._untranslated_pts.tobytes()
 
-        idx_to_keep = np.logical_not(
-            (xx >= self.window.mx) | (xx < 0) | (yy >= self.window.my) | (yy < 0)
-        )
-        xx = xx[idx_to_keep]
-        yy = yy[idx_to_keep]
-        return xx, yy
+    def _computeMask(self):
+        if self._untranslated_mask is None:
+            x, y = np.transpose(self._untranslated_pts)
+            shape = tuple(self.window.imageDimensions())
+            self._untranslated_mask = skimage.draw.polygon(x, y, shape=shape)
+        xx = self._untranslated_mask[0] + int(self.state["pos"][0])
+        yy = self._untranslated_mask[1] + int(self.state["pos"][1])
+        return _clip_mask(xx, yy, self.window.mx, self.window.my)
 
 
 class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
@@ -887,6 +999,7 @@ class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
         if finish:
             self.sigRegionChangeFinished.emit(self)
         self.pts = pts
+        self.invalidateMask()
 
     def getTrace(
         self, bounds: list[int] | None = None
@@ -896,25 +1009,44 @@ class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
                 "Plotting trace of RGB movies is not supported. Try splitting the channels."
             )
             return None
-        trace: jaxtyping.Float[np.ndarray, "t"]
-        if self.window.image.ndim == 3:
-            region = self.getArrayRegion(
-                self.window.imageview.image,
-                self.window.imageview.getImageItem(),
-                (1, 2),
-            )
-            while region.ndim > 1:
-                trace = np.average(region, 1)
-        elif self.window.image.ndim == 2:
-            region = self.getArrayRegion(
-                self.window.imageview.image,
-                self.window.imageview.getImageItem(),
-                (0, 1),
-            )
-            trace = np.array([np.average(region)])
-        if bounds:
-            trace = trace[bounds[0] : bounds[1]]
-        return trace
+        image = self.window.image
+        if image.ndim == 2:
+            image = image[np.newaxis]
+        return average_traces(image, self.getSamplingWeights(), bounds)[0]
+
+    def getTraceSampling(self):
+        return self.getSamplingWeights()
+
+    def getTraceIncremental(
+        self, bounds: list[int] | None = None, sampling=None
+    ) -> jaxtyping.Float[np.ndarray, "t"] | None:
+        if sampling is None:
+            sampling = self.getTraceSampling()
+        if self.window.image.ndim > 3 or self.window.metadata["is_rgb"]:
+            return self.getTrace(bounds)
+        image = self.window.image
+        if image.ndim == 2:
+            image = image[np.newaxis]
+        return average_traces(image, sampling, bounds)[0]
+
+    def getSamplingWeights(self) -> scipy.sparse.csr_matrix:
+        """Get the sparse map of how much each pixel contributes to the trace
+
+        The trace is the average of the image at the points returned by
+        getRibbonCoordinates(), interpolated linearly. The map is cached until the
+        geometry or the width of the ROI changes.
+
+        Returns:
+            scipy.sparse.csr_matrix: [1, mx*my] matrix, see average_traces
+        """
+        mx, my = self.window.mx, self.window.my
+        key = (self.maskGeneration, mx, my, self._maskKey(), self.width)
+        cache = getattr(self, "_weightsCache", None)
+        if cache is None or cache[0] != key:
+            coords = self.getRibbonCoordinates()
+            cache = (key, _interpolation_weights(coords.reshape(2, -1), mx, my))
+            self._weightsCache = cache
+        return cache[1]
 
     def preview(self):
         im = self.getArrayRegion(
@@ -1122,21 +1254,8 @@ class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
             self.setCurrentPen(self.pen)
             l.mouseHovering = False
 
-    def getMask(self):
-        xxs = []
-        yys = []
-        for i in range(len(self.pts) - 1):
-            p1, p2 = self.pts[i], self.pts[i + 1]
-            xx, yy = skimage.draw.line(int(p1[0]), int(p1[1]), int(p2[0]), int(p2[1]))
-            idx_to_keep = np.logical_not(
-                (xx >= self.window.mx) | (xx < 0) | (yy >= self.window.my) | (yy < 0)
-            )
-            xx = xx[idx_to_keep]
-            yy = yy[idx_to_keep]
-            xxs.extend(xx)
-            yys.extend(yy)
-
-        return np.array(xxs, dtype=int), np.array(yys, dtype=int)
+    def _computeMask(self):
+        return _line_mask(self.pts, self.window.mx, self.window.my)
 
     def makeMenu(self):
         ROI_Base.makeMenu(self)
@@ -1183,18 +1302,7 @@ class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
             g.alert("Can only kymograph on 3D movies")
             return
 
-        if self.width == 1:
-            w, h = self.window.imageDimensions()
-            r = QtCore.QRect(0, 0, w, h)
-            xx, yy = self.getMask()
-            mn = tif[:, xx, yy].T
-        else:
-            region = self.getArrayRegion(
-                self.window.imageview.image,
-                self.window.imageview.getImageItem(),
-                (1, 2),
-            )
-            mn = np.average(region, 2).T
+        mn = _kymograph(tif, self._kymographSampling()).T
 
         if self.kymograph is None:
             self.createKymograph(mn)
@@ -1219,6 +1327,7 @@ class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
         for l in self.lines:
             l.scale([1.0, newWidth / self.width], center=[0.5, 0.5])
         self.width = newWidth
+        self.invalidateMask()
         self.sigRegionChangeFinished.emit(self)
 
     def createKymograph(self, mn):
@@ -1227,18 +1336,411 @@ class ROI_rect_line(ROI_Base, QtWidgets.QGraphicsObject):
         oldwindow = g.win
         name = oldwindow.name + " - Kymograph"
         self.kymograph = Window(mn, name, metadata=self.window.metadata)
-        self.kymographproxy = pg.SignalProxy(
-            self.sigRegionChanged, rateLimit=1, slot=self.update_kymograph
-        )  # This will only update 3 Hz
-        self.sigRegionChanged.connect(self.update_kymograph)
+        self.kymographUpdater = _KymographUpdater(self)
+        self.sigRegionChanged.connect(self.kymographUpdater.request)
         self.kymograph.closeSignal.connect(self.deleteKymograph)
 
     def deleteKymograph(self):
-        self.kymographproxy.disconnect()
-        self.sigRegionChanged.disconnect(self.update_kymograph)
+        self.sigRegionChanged.disconnect(self.kymographUpdater.request)
+        self.kymographUpdater.shutdown()
         self.kymograph.closeSignal.disconnect(self.deleteKymograph)
         self.kymograph = None
 
+    def _kymographSampling(self):
+        """Flat indices of the pixels under a 1 pixel wide line, otherwise the [2,
+        width, length] coordinates of the points sampled across the ribbon"""
+        if self.window.image.ndim != 3:
+            return None
+        if self.width == 1:
+            return self.getMaskIndices()
+        return self.getRibbonCoordinates()
+
+    def getRibbonCoordinates(self) -> jaxtyping.Float[np.ndarray, "2 w l"]:
+        """Get the points sampled along and across each segment of the ROI
+
+        Returns:
+            [2, width, length] array of x and y image coordinates. Column i holds
+            width points, one pixel apart, across the ribbon at the i-th pixel
+            along the polyline
+        """
+        return _ribbon_coordinates(self.pts, self.width)
+
+
+def _ribbon_coordinates(pts, width) -> jaxtyping.Float[np.ndarray, "2 w l"]:
+    """Points sampled along and across a polyline, see
+    ROI_rect_line.getRibbonCoordinates"""
+    pts = np.array([[p[0], p[1]] for p in pts], dtype=float)
+    width = max(int(round(width)), 1)
+    offsets = np.arange(width) - (width - 1) / 2
+    columns = []
+    for p1, p2 in zip(pts[:-1], pts[1:]):
+        length = np.hypot(*(p2 - p1))
+        if length == 0:
+            continue
+        u = (p2 - p1) / length
+        n = np.array([-u[1], u[0]])
+        along = p1 + np.arange(max(int(round(length)), 1))[:, np.newaxis] * u
+        # [width, n, 2] points: the ribbon of this segment
+        columns.append(along[np.newaxis] + offsets[:, None, None] * n)
+    if len(columns) == 0:
+        return np.zeros((2, width, 0))
+    return np.concatenate(columns, 1).transpose(2, 0, 1)
+
+
+def _clip_mask(xx, yy, mx: int, my: int) -> tuple[np.ndarray, np.ndarray]:
+    """Drop the points of a mask that lie outside an [mx, my] image"""
+    idx_to_keep = np.logical_not((xx >= mx) | (xx < 0) | (yy >= my) | (yy < 0))
+    return xx[idx_to_keep], yy[idx_to_keep]
+
+
+def _rectangle_mask(pos, size, mx: int, my: int) -> tuple[np.ndarray, np.ndarray]:
+    """Pixels of the rectangle with corner pos and size that lie in the image"""
+    x, y = pos
+    ww, hh = size
+    xmin = max(x, 0)
+    ymin = max(y, 0)
+    xmax = min(x + ww, mx)
+    ymax = min(y + hh, my)
+    xx, yy = np.meshgrid(
+        np.arange(xmin, xmax, dtype=int), np.arange(ymin, ymax, dtype=int)
+    )
+    return xx.flatten(), yy.flatten()
+
+
+def _line_mask(pts, mx: int, my: int) -> tuple[np.ndarray, np.ndarray]:
+    """Pixels of the polyline through pts that lie in the image. Points are
+    truncated to integers."""
+    xxs, yys = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+    for p1, p2 in zip(pts[:-1], pts[1:]):
+        xx, yy = skimage.draw.line(int(p1[0]), int(p1[1]), int(p2[0]), int(p2[1]))
+        xx, yy = _clip_mask(xx, yy, mx, my)
+        xxs.append(xx)
+        yys.append(yy)
+    return np.concatenate(xxs), np.concatenate(yys)
+
+
+def _freehand_mask(pts, mx: int, my: int) -> tuple[np.ndarray, np.ndarray]:
+    """Pixels inside the polygon pts that lie in the image, computed like
+    ROI_freehand: relative to the polygon's corner, then translated"""
+    pos = np.min(pts, 0)
+    x, y = np.transpose(np.subtract(pts, pos))
+    xx, yy = skimage.draw.polygon(x, y, shape=(mx, my))
+    return _clip_mask(xx + int(pos[0]), yy + int(pos[1]), mx, my)
+
+
+def mask_weights(masks, mx: int, my: int) -> scipy.sparse.csr_matrix:
+    """Build the sparse matrix that averages the pixels of each mask
+
+    Args:
+        masks: list of (xx, yy) pixel coordinates, as returned by getMask()
+        mx (int): width of the image
+        my (int): height of the image
+
+    Returns:
+        scipy.sparse.csr_matrix: [nROIs, mx*my] matrix. Row i holds 1/N at the flat
+        index x*my + y of each of the N pixels in masks[i]
+    """
+    rows, cols, vals = [], [], []
+    for i, (xx, yy) in enumerate(masks):
+        n = np.size(xx)
+        if n == 0:
+            continue
+        rows.append(np.full(n, i))
+        cols.append(np.asarray(xx, dtype=np.intp) * my + np.asarray(yy, dtype=np.intp))
+        vals.append(np.full(n, 1.0 / n))
+    if len(rows) == 0:
+        return scipy.sparse.csr_matrix((len(masks), mx * my))
+    return scipy.sparse.csr_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(len(masks), mx * my),
+    )
+
+
+def _interpolation_weights(points, mx: int, my: int) -> scipy.sparse.csr_matrix:
+    """[1, mx*my] matrix averaging an image at subpixel points with linear
+    interpolation. Pixels outside the image count as 0, like the default
+    mode of scipy.ndimage.map_coordinates."""
+    x, y = points
+    n = len(x)
+    x0, y0 = np.floor(x), np.floor(y)
+    fx, fy = x - x0, y - y0
+    cols, vals = [], []
+    for dx, wx in ((0, 1 - fx), (1, fx)):
+        for dy, wy in ((0, 1 - fy), (1, fy)):
+            xi, yi = (x0 + dx).astype(np.intp), (y0 + dy).astype(np.intp)
+            w = wx * wy
+            keep = (w > 0) & (xi >= 0) & (xi < mx) & (yi >= 0) & (yi < my)
+            cols.append(xi[keep] * my + yi[keep])
+            vals.append(w[keep] / n)
+    cols, vals = np.concatenate(cols), np.concatenate(vals)
+    return scipy.sparse.csr_matrix(
+        (vals, (np.zeros(len(cols), dtype=np.intp), cols)), shape=(1, mx * my)
+    )
+
+
+def average_traces(
+    image: np.ndarray,
+    weights: scipy.sparse.csr_matrix,
+    bounds: list[int] | None = None,
+) -> jaxtyping.Float[np.ndarray, "n t"]:
+    """Compute the weighted average traces of a [t, x, y] movie
+
+    Only the pixels with a nonzero weight are read, in chunks of frames of
+    g.settings['memory_budget_mb'], and every trace of a chunk is computed with one
+    sparse-dense product.
+
+    Args:
+        image: [t, x, y] movie
+        weights: [nROIs, x*y] matrix, as returned by mask_weights()
+        bounds: [first, last) frames to compute, or None for the whole movie
+
+    Returns:
+        [nROIs, t] array of traces
+    """
+    mt = len(image)
+    if bounds:
+        start, stop, _ = slice(bounds[0], bounds[1]).indices(mt)
+    else:
+        start, stop = 0, mt
+    traces = np.zeros((weights.shape[0], max(stop - start, 0)))
+    cols = np.unique(weights.indices)
+    if len(cols) == 0:
+        return traces
+    weights = weights[:, cols]
+    chunk = max(1, int(g.settings["memory_budget_mb"] * 2**20 // (8 * len(cols))))
+    for t0 in range(start, stop, chunk):
+        t1 = min(t0 + chunk, stop)
+        block = _take_pixels(image[t0:t1], cols)
+        traces[:, t0 - start : t1 - start] = weights @ block.T
+    return traces
+
+
+def _mask_traces(window, rois, bounds=None):
+    traces = [roi._cachedTrace(bounds) for roi in rois]
+    idxs = [i for i, trace in enumerate(traces) if trace is None]
+    if len(idxs) == 0:
+        return traces
+    image = window.image
+    if image.ndim == 2:
+        image = image[np.newaxis]
+    weights = mask_weights([rois[i].getMask() for i in idxs], window.mx, window.my)
+    for i, trace in zip(idxs, average_traces(image, weights, bounds)):
+        traces[i] = trace
+    return traces
+
+
+def getTraces(rois, bounds=None) -> list:
+    """Compute the traces of many ROIs at once
+
+    ROIs in the same window share a single pass over the movie (see
+    average_traces). This gives the same result as calling getTrace() on each ROI.
+
+    Args:
+        rois: list of ROIs, possibly in different windows
+        bounds: [first, last) frames to compute, or None for the whole movie
+
+    Returns:
+        list with the trace of each ROI, or None where no trace could be computed
+    """
+    traces = [None] * len(rois)
+    by_window = {}
+    for i, roi in enumerate(rois):
+        if type(roi).getTrace is not ROI_Base.getTrace:
+            traces[i] = roi.getTrace(bounds)
+        else:
+            by_window.setdefault(roi.window, []).append(i)
+    for window, idxs in by_window.items():
+        if window.image.ndim == 4 or window.metadata["is_rgb"]:
+            g.alert(
+                "Plotting trace of RGB movies is not supported. Try splitting the channels."
+            )
+            continue
+        window_traces = _mask_traces(window, [rois[i] for i in idxs], bounds)
+        for i, trace in zip(idxs, window_traces):
+            traces[i] = trace
+    return traces
+
+
+class _RunningTrace:
+    """Per-frame sums of the pixels inside an ROI's mask, kept between calls so a
+    moved mask only has to read the pixels that changed.
+
+    The sums are recomputed from scratch when the window's image, its generation
+    (see Window.imageChanged) or the bounds change, when more pixels changed than
+    stayed, and every RESYNC_EVERY updates so rounding errors cannot build up.
+    """
+
+    RESYNC_EVERY = 64
+
+    def __init__(self):
+        self.image = None
+        self.key = None
+        self.idx = None
+        self.sums = None
+        self.steps = 0
+
+    def update(self, window, idx, bounds=None) -> jaxtyping.Float[np.ndarray, "t"]:
+        image = window.image
+        if image.ndim == 2:
+            image = image[np.newaxis]
+        mt = len(image)
+        if bounds:
+            start, stop, _ = slice(bounds[0], bounds[1]).indices(mt)
+        else:
+            start, stop = 0, mt
+        idx = np.unique(idx)
+        key = (window.imageGeneration, start, stop)
+        stale = self.image is not window.image or self.key != key
+        if stale or self.steps >= self.RESYNC_EVERY:
+            self.sums = self._sum(image, idx, start, stop)
+            self.steps = 0
+        else:
+            left = np.setdiff1d(self.idx, idx, assume_unique=True)
+            entered = np.setdiff1d(idx, self.idx, assume_unique=True)
+            if len(left) + len(entered) >= len(idx):
+                self.sums = self._sum(image, idx, start, stop)
+                self.steps = 0
+            elif len(left) + len(entered) > 0:
+                self.sums = self.sums + (
+                    self._sum(image, entered, start, stop)
+                    - self._sum(image, left, start, stop)
+                )
+                self.steps += 1
+        self.image = window.image
+        self.key = key
+        self.idx = idx
+        if len(idx) == 0:
+            return np.zeros(max(stop - start, 0))
+        return self.sums / len(idx)
+
+    @staticmethod
+    def _sum(image, idx, start, stop):
+        sums = np.zeros(max(stop - start, 0))
+        if len(idx) == 0:
+            return sums
+        chunk = max(1, int(g.settings["memory_budget_mb"] * 2**20 // (8 * len(idx))))
+        for t0 in range(start, stop, chunk):
+            t1 = min(t0 + chunk, stop)
+            sums[t0 - start : t1 - start] = np.sum(
+                _take_pixels(image[t0:t1], idx), 1, dtype=np.float64
+            )
+        return sums
+
+
+def _take_pixels(image, idx):
+    """Gather the pixels at flat indices x*my + y from each frame of a [t, x, y]
+    movie. Contiguous movies are read with np.take on a [t, x*y] view."""
+    if image.flags.c_contiguous:
+        return np.take(image.reshape(len(image), -1), idx, axis=1)
+    xx, yy = np.divmod(idx, image.shape[2])
+    return image[:, xx, yy]
+
+
+def _kymograph(image, sampling, out=None) -> np.ndarray:
+    """Sample a [t, x, y] movie along an ROI
+
+    Args:
+        image: [t, x, y] movie
+        sampling: flat pixel indices (see ROI_Base.getMaskIndices), or [2, width,
+            length] subpixel coordinates (see ROI_rect_line.getRibbonCoordinates)
+            that are interpolated linearly and averaged across the width
+        out: array to write the result into, reused if it has the right shape
+
+    Returns:
+        [t, length] array
+    """
+    if sampling.ndim == 1:
+        shape, dtype = (len(image), len(sampling)), image.dtype
+    else:
+        shape, dtype = (len(image), sampling.shape[2]), np.float64
+    if out is None or out.shape != shape or out.dtype != dtype:
+        out = np.empty(shape, dtype)
+    if sampling.ndim == 1:
+        if image.flags.c_contiguous:
+            np.take(image.reshape(len(image), -1), sampling, axis=1, out=out)
+        else:
+            out[:] = _take_pixels(image, sampling)
+        return out
+    _, width, length = sampling.shape
+    # interpolating a chunk takes 3 coordinates and 1 output value per sample
+    sample_bytes = 4 * 8 * width * length + image[0].nbytes
+    chunk = max(1, int(g.settings["memory_budget_mb"] * 2**20 // sample_bytes))
+    for t0 in range(0, len(image), chunk):
+        block = image[t0 : t0 + chunk]
+        ct = len(block)
+        coords = np.empty((3, ct, width, length))
+        coords[0] = np.arange(ct)[:, None, None]
+        coords[1:] = sampling[:, np.newaxis]
+        samples = scipy.ndimage.map_coordinates(
+            block, coords, output=np.float64, order=1
+        )
+        out[t0 : t0 + ct] = samples.mean(1)
+    return out
+
+
+class _KymographUpdater(QtCore.QObject):
+    """Recomputes the kymograph of an ROI on a worker thread while the ROI moves
+
+    Requests arriving within THROTTLE_MS of each other are merged, and at most one
+    computation runs at a time. The sampling positions are read on the GUI thread,
+    the movie is sampled on the worker thread into one of two reused buffers, and
+    the result is shown on the GUI thread through the ready signal.
+    """
+
+    ready = QtCore.Signal(object)
+    THROTTLE_MS = 30
+
+    def __init__(self, roi):
+        super().__init__()
+        self.roi = roi
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.buffers = [None, None]
+        self.running = False
+        self.pending = False
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.THROTTLE_MS)
+        self.timer.timeout.connect(self._start)
+        self.ready.connect(self._show, QtCore.Qt.QueuedConnection)
+
+    def request(self, *args) -> None:
+        self.pending = True
+        if not self.running and not self.timer.isActive():
+            self.timer.start()
+
+    def shutdown(self) -> None:
+        self.pending = False
+        self.timer.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self) -> None:
+        if self.running or not self.pending:
+            return
+        self.pending = False
+        sampling = self.roi._kymographSampling()
+        if sampling is None:
+            return
+        self.running = True
+        self.buffers.reverse()  # never write into the array being displayed
+        self.executor.submit(self._compute, self.roi.window.image, sampling)
+
+    def _compute(self, image, sampling) -> None:
+        mn = None
+        try:
+            mn = _kymograph(image, sampling, out=self.buffers[0])
+            self.buffers[0] = mn
+        except Exception as e:
+            logger.error(f"Failed to compute the kymograph of {self.roi}: {e}")
+        self.ready.emit(mn)
+
+    def _show(self, mn) -> None:
+        self.running = False
+        kymograph = self.roi.kymograph
+        if mn is not None and mn.size > 0 and kymograph is not None:
+            kymograph.imageview.setImage(mn.T, autoLevels=False, autoRange=False)
+        if self.pending:
+            self.timer.start()
+
 
 def makeROI(kind, pts, window=None, color=None, **kargs):
     """Create an ROI object in window with the given points
@@ -1292,33 +1794,116 @@ def makeROI(kind, pts, window=None, color=None, **kargs):
     return roi
 
 
-def open_rois(filename=None):
-    """
-    Open an roi.txt file, creates ROI objects and places them in the current Window.
+def makeROIs(kinds, pts, window=None, color=None, masks=None) -> list:
+    """Create many ROI objects in window at once
+
+    The window is repainted once, after all the ROIs are added.
 
     Args:
-        filename (str): The filename (including full path) of the roi.txt file.
+        kinds (list of str): kind of each ROI, see makeROI
+        pts (list of [N, 2] coords): points of each ROI, see makeROI
+        window (window.Window): window to draw the ROIs in, or currentWindow if not specified
+        color (QtGui.QColor): pen color of the new ROIs
+        masks (list of np.ndarray): optional flat indices x*my + y of the pixels of
+            each ROI, used instead of computing the masks
 
     Returns:
-        list: List of created ROI objects
+        list: the created ROI objects
     """
-    if filename is None:
-        filename = open_file_gui("Open ROI File", filetypes="*.txt")
-        if filename is None:
-            return
-    if not os.path.isfile(filename):
-        g.alert("Can't open roi file {}. File does not exist".format(filename))
-        return
+    if window is None:
+        window = g.win
+        if window is None:
+            g.alert("ERROR: In order to make and ROI a window needs to be selected")
+            return []
+    rois = []
+    window.imageview.setUpdatesEnabled(False)
     try:
-        with open(filename, "r") as file:
-            text = file.read()
+        for i, (kind, p) in enumerate(zip(kinds, pts)):
+            roi = makeROI(kind, p, window, color=color)
+            if roi is None:
+                continue
+            if masks is not None and masks[i] is not None:
+                roi._setCachedMask(masks[i])
+            rois.append(roi)
+    finally:
+        window.imageview.setUpdatesEnabled(True)
+    return rois
 
-    except Exception:
-        g.alert("Can't open roi file. Wrong file format")
-        return
-    if g.win is None:
-        g.alert("You need to open an image window before opening ROIs.")
-        return
+
+def save_rois_npz(filename: str, rois: list) -> None:
+    """Save ROIs to a binary .npz ROI file
+
+    The file holds the same points as the text format written by
+    Window.save_rois, packed for fast loading:
+        kinds: [nROIs] array of ROI kinds
+        offsets: [nROIs + 1] array, ROI i has points[offsets[i]:offsets[i + 1]]
+        points: [N, 2] int32 array
+    and the masks of the ROIs, if they are all in the same window:
+        mask_shape: [mx, my] of that window
+        mask_offsets: [nROIs + 1] array, like offsets
+        mask_indices: flat indices x*my + y of the pixels in each mask
+        mask_valid: [nROIs] bool array, False where the points were rounded when
+            saved, so the saved mask may not match the loaded ROI
+
+    Args:
+        filename (str): path of the .npz file
+        rois (list): ROIs to save
+    """
+    pts = [np.asarray(roi.pts, dtype=float).reshape(-1, 2) for roi in rois]
+    offsets = np.concatenate([[0], np.cumsum([len(p) for p in pts])]).astype(np.int64)
+    points = np.concatenate(pts) if pts else np.zeros((0, 2))
+    arrays = {
+        "kinds": np.array([roi.kind for roi in rois], dtype=str),
+        "offsets": offsets,
+        "points": points.astype(np.int32),
+    }
+    windows = {roi.window for roi in rois}
+    if len(windows) == 1:
+        window = windows.pop()
+        masks = [roi.getMaskIndices() for roi in rois]
+        arrays["mask_shape"] = np.array([window.mx, window.my])
+        arrays["mask_offsets"] = np.concatenate(
+            [[0], np.cumsum([len(m) for m in masks])]
+        ).astype(np.int64)
+        arrays["mask_indices"] = np.concatenate(masks).astype(np.int64)
+        arrays["mask_valid"] = np.array([np.all(p == np.trunc(p)) for p in pts])
+    np.savez(filename, **arrays)
+
+
+def read_rois_npz(filename: str) -> tuple[list, list, dict | None]:
+    """Read a binary .npz ROI file written by save_rois_npz, without creating ROIs
+
+    Returns:
+        tuple: (kinds, pts, masks). kinds is a list of str, pts a list of [N, 2]
+        int arrays. masks is None if the file has none, otherwise a dict with the
+        'shape' [mx, my] of the window they were computed in and the flat
+        'indices' of each ROI (None where the saved mask may not be valid)
+    """
+    with np.load(filename, allow_pickle=False) as f:
+        kinds = [str(kind) for kind in f["kinds"]]
+        pts = np.split(f["points"], f["offsets"][1:-1])
+        masks = None
+        if "mask_indices" in f:
+            indices = np.split(f["mask_indices"], f["mask_offsets"][1:-1])
+            masks = {
+                "shape": tuple(int(m) for m in f["mask_shape"]),
+                "indices": [
+                    idx if valid else None
+                    for idx, valid in zip(indices, f["mask_valid"])
+                ],
+            }
+    return kinds, pts, masks
+
+
+def read_rois_text(filename: str) -> tuple[list, list]:
+    """Read an roi.txt file written by Window.save_rois, without creating ROIs
+
+    Returns:
+        tuple: (kinds, pts). kinds is a list of str, pts a list of lists of int
+        (x, y) points
+    """
+    with open(filename, "r") as file:
+        text = file.read()
 
     kinds = []
     roi_starts = []
@@ -1343,7 +1928,7 @@ def open_rois(filename=None):
 
     text_lines = text.split("\n")
 
-    rois = []
+    roi_kinds, roi_pts = [], []
     for i in range(len(kinds)):
         roi_text_lines = text_lines[roi_starts[i] + 1 : roi_starts[i + 1]]
         pts = []
@@ -1357,8 +1942,153 @@ def open_rois(filename=None):
                 pts.append(tuple(int(float(i)) for i in text_line.split()))
 
         if pts is not None and len(pts) > 0:
-            roi = makeROI(kinds[i], pts)
-            if roi is not None:
-                rois.append(roi)
+            roi_kinds.append(kinds[i])
+            roi_pts.append(pts)
 
-    return rois
+    return roi_kinds, roi_pts
+
+
+def roi_weights(kinds, pts, mx: int, my: int, masks=None) -> scipy.sparse.csr_matrix:
+    """Build the matrix that averages each ROI, without creating ROI objects
+
+    Rectangle, line and freehand ROIs average the pixels that getMask() would
+    return. rect_line ROIs average the ribbon their getTrace() samples, with a
+    width of 1 since ROI files do not store the width.
+
+    Args:
+        kinds (list of str): kind of each ROI, see makeROI
+        pts (list of [N, 2] coords): points of each ROI, see makeROI
+        mx (int): width of the image
+        my (int): height of the image
+        masks (list of np.ndarray): optional flat indices x*my + y of the pixels of
+            each ROI, used instead of computing the masks (see read_rois_npz)
+
+    Returns:
+        scipy.sparse.csr_matrix: [nROIs, mx*my] matrix, see average_traces
+    """
+    rows = []
+    for i, (kind, p) in enumerate(zip(kinds, pts)):
+        p = np.asarray(p, dtype=float).reshape(-1, 2)
+        if kind == "rect_line":
+            coords = _ribbon_coordinates(p, 1)
+            rows.append(_interpolation_weights(coords.reshape(2, -1), mx, my))
+            continue
+        if masks is not None and masks[i] is not None:
+            mask = np.divmod(np.asarray(masks[i], dtype=np.intp), my)
+        elif kind == "rectangle":
+            if len(p) > 2:
+                mask = _rectangle_mask(np.min(p, 0), np.ptp(p, 0), mx, my)
+            else:
+                mask = _rectangle_mask(p[0], p[1], mx, my)
+        elif kind == "line":
+            mask = _line_mask(p, mx, my)
+        elif kind == "freehand":
+            mask = _freehand_mask(p, mx, my)
+        else:
+            raise ValueError(f"Unknown ROI kind: {kind}")
+        rows.append(mask_weights([mask], mx, my))
+    if len(rows) == 0:
+        return scipy.sparse.csr_matrix((0, mx * my))
+    return scipy.sparse.vstack(rows, format="csr")
+
+
+def extract_traces(
+    movie: np.ndarray | str, roi_file: str, bounds: list[int] | None = None
+) -> jaxtyping.Float[np.ndarray, "n t"]:
+    """Compute the trace of every ROI in an ROI file, without a Window
+
+    This needs neither a QApplication nor a display, so it can run in batch
+    scripts. Movies given as a path are memory mapped, and only the frames of one
+    chunk (see average_traces) are read at a time. The traces are the same as the
+    ones getTrace() computes for the ROIs open_rois creates from the file.
+
+    Example:
+        >>> traces = extract_traces('recording.tif', 'rois.txt')
+
+    Args:
+        movie: [t, x, y] or [x, y] array, or path of a .tif/.tiff or .npy movie
+        roi_file (str): path of an roi.txt or .npz ROI file
+        bounds: [first, last) frames to compute, or None for the whole movie
+
+    Returns:
+        [nROIs, t] array of traces
+    """
+    if isinstance(movie, (str, os.PathLike)):
+        movie = _open_movie(os.fspath(movie))
+    if movie.ndim == 2:
+        movie = movie[np.newaxis]
+    if movie.ndim != 3:
+        raise ValueError(
+            "Traces of RGB movies are not supported. Try splitting the channels."
+        )
+    mx, my = movie.shape[1:]
+    masks = None
+    if os.fspath(roi_file).endswith(".npz"):
+        kinds, pts, saved = read_rois_npz(roi_file)
+        if saved is not None and saved["shape"] == (mx, my):
+            masks = saved["indices"]
+    else:
+        kinds, pts = read_rois_text(roi_file)
+    return average_traces(movie, roi_weights(kinds, pts, mx, my, masks), bounds)
+
+
+def _open_movie(filename: str) -> np.ndarray:
+    """Memory map a movie file in flika's [t, x, y] layout, see open_tiff"""
+    from flika.process.file_ import get_permutation_tuple, tiff_target_axes
+    from flika.utils.io import tifffile
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".npy":
+        return np.load(filename, mmap_mode="r")
+    if ext not in (".tif", ".tiff", ".stk"):
+        raise ValueError(f"Can't extract traces from {filename}: unsupported format")
+    with tifffile.TiffFile(filename) as tif:
+        A = tif.asarray(memmap=True)
+        axes = [tifffile.AXES_LABELS[ax] for ax in tif.series[0].axes]
+    target_axes, is_rgb = tiff_target_axes(axes)
+    if target_axes is None or is_rgb or len(axes) != A.ndim:
+        raise ValueError(f"Can't extract traces from {filename}: axes {axes}")
+    return np.transpose(A, get_permutation_tuple(axes, target_axes))
+
+
+def open_rois(filename=None):
+    """
+    Open an roi.txt file, or a binary .npz ROI file written by save_rois_npz,
+    creates ROI objects and places them in the current Window.
+
+    Args:
+        filename (str): The filename (including full path) of the roi file.
+
+    Returns:
+        list: List of created ROI objects
+    """
+    if filename is None:
+        filetypes = "ROI files (*.txt *.npz)"
+        filename = open_file_gui("Open ROI File", filetypes=filetypes)
+        if filename is None:
+            return
+    if not os.path.isfile(filename):
+        g.alert("Can't open roi file {}. File does not exist".format(filename))
+        return
+    if filename.endswith(".npz"):
+        if g.win is None:
+            g.alert("You need to open an image window before opening ROIs.")
+            return
+        try:
+            kinds, pts, masks = read_rois_npz(filename)
+        except Exception:
+            g.alert("Can't open roi file. Wrong file format")
+            return
+        if masks is not None and masks["shape"] != (g.win.mx, g.win.my):
+            masks = None
+        return makeROIs(kinds, pts, g.win, masks=masks and masks["indices"])
+    try:
+        roi_kinds, roi_pts = read_rois_text(filename)
+    except Exception:
+        g.alert("Can't open roi file. Wrong file format")
+        return
+    if g.win is None:
+        g.alert("You need to open an image window before opening ROIs.")
+        return
+
+    return makeROIs(roi_kinds, roi_pts)
@@ -7,7 +7,8 @@ from ..window import Window
 import numpy as np
 import time
 import pytest
-from ..roi import makeROI, open_rois
+from ..roi import extract_traces, getTraces, makeROI, open_rois
+from ..utils.io import tifffile
 import pyqtgraph as pg
 from qtpy import QtGui
 
@@ -57,3 +58,130 @@ class Test_File:
         os.remove("test.roi")
         assert np.array_equal(b.pts, [[3, 7], [6, 5]])
         w.close()
+
+    def test_rois_npz_io(self, tmp_path):
+        w = Window(np.random.random([5, 60, 70]))
+        makeROI("rectangle", [[3, 7], [6, 5]])
+        makeROI("line", [[1, 2], [30, 50]])
+        makeROI("rect_line", [[1, 2], [30, 50], [40, 10]])
+        for i in range(50):
+            makeROI("freehand", [[i, i], [i + 9, i + 1], [i + 4, i + 8]])
+        filename = str(tmp_path / "rois.npz")
+        w.save_rois(filename)
+        saved = [(roi.kind, np.array(roi.pts), roi.getMaskIndices()) for roi in w.rois]
+        w.removeAllROIs()
+        rois = open_rois(filename)
+        assert len(rois) == len(saved)
+        for roi, (kind, pts, idx) in zip(rois, saved):
+            assert roi.kind == kind
+            np.testing.assert_array_equal(roi.pts, pts)
+            np.testing.assert_array_equal(roi.getMaskIndices(), idx)
+            roi.invalidateMask()
+            np.testing.assert_array_equal(roi.getMaskIndices(), idx)
+        w.close()
+
+    @pytest.mark.parametrize("ext", [".txt", ".npz"])
+    def test_extract_traces(self, ext, tmp_path):
+        A = np.random.randint(0, 1000, [20, 30, 40]).astype(np.uint16)
+        w = Window(A)
+        makeROI("rectangle", [[3, 7], [6, 5]])
+        makeROI("rectangle", [[25, 35], [10, 10]])
+        makeROI("line", [[1, 2], [28, 37]])
+        makeROI("freehand", [[-2, 4], [9, 5], [4, 12], [3, 6]])
+        makeROI("rect_line", [[1, 2], [20, 30], [25, 10]])
+        expected = np.array(getTraces(w.rois))
+        roi_file = str(tmp_path / ("rois" + ext))
+        w.save_rois(roi_file)
+        w.close()
+        movie_file = str(tmp_path / "movie.tif")
+        tifffile.imsave(movie_file, A.swapaxes(1, 2))  # tifs are [t, y, x]
+        np.testing.assert_allclose(extract_traces(A, roi_file), expected)
+        np.testing.assert_allclose(extract_traces(movie_file, roi_file), expected)
+        np.testing.assert_allclose(
+            extract_traces(movie_file, roi_file, [5, 12]), expected[:, 5:12]
+        )
+
+    def test_open_lazy(self, tmp_path):
+        A = np.random.randint(0, 1000, [20, 30, 40]).astype(np.uint16)
+        filename = str(tmp_path / "lazy.tif")
+        tifffile.imsave(filename, A)
+        w_eager = open_file(filename)
+        w_lazy = open_file(filename, lazy=True)
+        assert isinstance(w_lazy.image, np.memmap)
+        assert not w_lazy.image.flags.writeable
+        np.testing.assert_array_equal(w_lazy.image, w_eager.image)
+        w_lazy.setIndex(5)
+        w_lazy.close()
+        w_eager.close()
+
+    @pytest.mark.parametrize("compress", [0, 6, "lzma"])
+    @pytest.mark.parametrize(
+        "A, is_rgb",
+        [
+            (np.random.randint(0, 1000, [20, 30, 40]).astype(np.uint16), False),
+            (np.random.randint(0, 255, [7, 9, 3]).astype(np.uint8), True),
+        ],
+        ids=["movie", "rgb"],
+    )
+    def test_save_compressed(self, compress, A, is_rgb, tmp_path):
+        w = Window(A, metadata={"is_rgb": is_rgb})
+        w.metadata["note"] = "kept"
+        filename = save_file(str(tmp_path / "movie.tif"), compress=compress)
+        w2 = open_file(filename)
+        np.testing.assert_array_equal(w2.image, A)
+        assert w2.metadata["note"] == "kept"
+        w2.close()
+        w.close()
+
+    def test_save_movie(self, tmp_path, monkeypatch):
+        # Stands in for ffmpeg: saves the raw frames it is sent and its arguments
+        ffmpeg = tmp_path / "ffmpeg"
+        ffmpeg.write_text(
+            f"#!{sys.executable}\n"
+            "import shutil, sys\n"
+            "open(sys.argv[-1] + '.args', 'w').write(' '.join(sys.argv))\n"
+            "with open(sys.argv[-1], 'wb') as f:\n"
+            "    shutil.copyfileobj(sys.stdin.buffer, f)\n"
+        )
+        ffmpeg.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+        A = np.random.random([5, 30, 20])
+        w = Window(A)
+        w.imageview.setLevels(0, 1)
+        w.scatterPoints[2].append([10, 10, QtGui.QColor(255, 0, 0), 5])
+        filename = str(tmp_path / "movie.mp4")
+        assert save_movie(10, filename) == filename
+        args = open(filename + ".args").read().split()
+        width, height = map(int, args[args.index("-s") + 1].split("x"))
+        zoom = width // 30
+        assert (width, height) == (30 * zoom, 20 * zoom)
+        frames = np.fromfile(filename, np.uint8).reshape(5, height, width, 4)
+        gray = frames[:, ::zoom, ::zoom, :3].astype(int)
+        expected = A.swapaxes(1, 2) * 255
+        away = np.ones(gray.shape[:3], bool)
+        away[2, 9:12, 9:12] = False  # the point
+        assert np.abs(gray[..., 0] - expected)[away].max() <= 2
+        assert np.all(gray[away][:, 0] == gray[away][:, 2])
+        red = frames[2, 10 * zoom, 10 * zoom]
+        assert red[2] == 255 and red[0] == 0  # BGRA
+        w.close()
+
+    def test_set_value_in_roi_of_opened_tif(self, tmp_path):
+        from ..process.roi import set_value
+
+        A = np.random.randint(0, 1000, [6, 30, 40]).astype(np.uint16)
+        filename = str(tmp_path / "movie.tif")
+        tifffile.imsave(filename, A)
+        w = open_file(filename)
+        assert not w.image.flags.c_contiguous  # tifs open transposed
+        roi = makeROI("freehand", [[2, 2], [12, 3], [9, 15], [4, 10]])
+        w.currentROI = roi
+        xx, yy = roi.getMask()
+        w2 = set_value(7, 2, 4, restrictToROI=True, keepSourceWindow=True)
+        assert np.all(w2.image[2:5, xx, yy] == 7)
+        mask = np.zeros(w.image.shape[1:], bool)
+        mask[xx, yy] = True
+        np.testing.assert_array_equal(w2.image[:, ~mask], w.image[:, ~mask])
+        np.testing.assert_array_equal(w2.image[[0, 1, 5]], w.image[[0, 1, 5]])
+        w2.close()
+        w.close()
@@ -1,5 +1,7 @@
 # pylint: disable=missing-function-docstring,missing-class-docstring,missing-module-docstring
 import contextlib
+import gc
+import time
 import warnings
 
 import numpy as np
@@ -8,6 +10,7 @@ from qtpy import QtWidgets
 
 from .. import global_vars as g
 from ..process import *
+from ..utils.misc import is_file_backed
 from ..window import Window
 
 warnings.filterwarnings("ignore")
@@ -199,6 +202,37 @@ class TestFilters(ProcessTest):
 
             assert w is not None, "Butterworth filter should return a window"
 
+    def test_butterworth_filter_stack_matches_per_pixel(self, monkeypatch):
+        from scipy.signal import filtfilt
+
+        from ..process import filters
+        from ..process.filters import butterworth_filter_stack
+
+        monkeypatch.setattr(filters, "TILE_BYTES", 1000)  # force several tiles
+        tif = np.random.random([50, 7, 9])
+        b, a, padlen = butterworth_filter.makeButterFilter(2, 0.1, 0.6)
+        result = butterworth_filter_stack(b, a, padlen, tif)
+        for i in range(tif.shape[1]):
+            for j in range(tif.shape[2]):
+                expected = filtfilt(b, a, tif[:, i, j], padlen=padlen)
+                np.testing.assert_allclose(result[:, i, j], expected)
+
+    def test_butterworth_filter_multi_uses_worker_pool(self, monkeypatch):
+        from ..process.filters import butterworth_filter_multi, butterworth_filter_stack
+        from ..process.progress_bar import shutdown_worker_pool
+
+        monkeypatch.setitem(g.settings, "nCores", 2)
+        tif = np.random.random([50, 7, 9]).astype(np.float32)
+        b, a, padlen = butterworth_filter.makeButterFilter(2, 0.1, 0.6)
+        try:
+            result = butterworth_filter_multi(2, 0.1, 0.6, tif)
+        finally:
+            shutdown_worker_pool()
+        # the result is handed back without copying it out of shared memory
+        assert not result.flags.owndata
+        gc.collect()
+        np.testing.assert_allclose(result, butterworth_filter_stack(b, a, padlen, tif))
+
     def test_mean_filter(self, test_image, mock_message_box):
         # Mean filter only works on 3D grayscale movies
         if not self.is_3d_grayscale(test_image):
@@ -208,6 +242,23 @@ class TestFilters(ProcessTest):
         w = mean_filter(5)
         assert w is not None, "Mean filter should return a window"
 
+    def test_varfilt_matches_sliding_window(self):
+        from ..process.filters import varfilt
+
+        trace = np.random.random(40) + 1000
+        for nFrames in [2, 5, 8]:
+            expected = np.array(
+                [
+                    np.var(trace[max(0, int(i - nFrames / 2)) : int(i + nFrames / 2)])
+                    for i in range(len(trace))
+                ]
+            )
+            np.testing.assert_allclose(varfilt(trace, nFrames), expected, atol=1e-9)
+        movie = np.random.random([40, 3, 4])
+        np.testing.assert_allclose(
+            varfilt(movie, 5)[:, 1, 2], varfilt(movie[:, 1, 2], 5)
+        )
+
     def test_median_filter(self, test_image, mock_message_box):
         # Median filter requires at least 3 dimensions
         if not self.is_3d_grayscale(test_image):
@@ -217,6 +268,22 @@ class TestFilters(ProcessTest):
         w = median_filter(5)
         assert w is not None, "Median filter should return a window"
 
+    def test_median_filter_stack_matches_medfilt(self, monkeypatch):
+        from scipy.signal import medfilt
+
+        from ..process import filters
+        from ..process.filters import median_filter_stack
+
+        monkeypatch.setattr(filters, "TILE_BYTES", 1000)  # force several tiles
+        for dtype in ["uint16", "float32"]:
+            tif = (np.random.random([30, 5, 6]) * 1000).astype(dtype)
+            result = median_filter_stack(tif, 7)
+            assert result.dtype == tif.dtype
+            for i in range(tif.shape[1]):
+                for j in range(tif.shape[2]):
+                    expected = medfilt(tif[:, i, j].astype(np.float64), 7)
+                    np.testing.assert_array_equal(result[:, i, j], expected)
+
     def test_fourier_filter(self, test_image, mock_message_box):
         # For simplicity, only test on 3D grayscale which most reliably works
         if not self.is_3d_grayscale(test_image):
@@ -226,6 +293,20 @@ class TestFilters(ProcessTest):
         w = fourier_filter(3, 0.2, 0.6, False)
         assert w is not None, "Fourier filter should return a window"
 
+    def test_fourier_filter_stack_matches_complex_fft(self):
+        from scipy.fftpack import fft, fftfreq, ifft
+
+        from ..process.filters import fourier_filter_stack
+
+        frame_rate, low, high = 20.0, 1.0, 6.0
+        for mt in [64, 65]:
+            tif = np.random.random([mt, 3, 4])
+            W = fftfreq(mt, d=1.0 / frame_rate)
+            filt = ((np.abs(W) >= low) & (np.abs(W) <= high)).astype(float)
+            expected = np.real(ifft(fft(tif, axis=0) * filt[:, None, None], axis=0))
+            result = fourier_filter_stack(tif, frame_rate, low, high)
+            np.testing.assert_allclose(result, expected, atol=1e-12)
+
     def test_difference_filter(self, test_image, mock_message_box):
         # Skip for 2D images - needs a stack
         if self.is_2d_grayscale(test_image):
@@ -251,12 +332,172 @@ class TestFilters(ProcessTest):
         w2 = bilateral_filter(False, 30.0, 10.0, 0.05, 100)  # hard filter
         assert w2 is not None, "Bilateral filter (hard) should return a window"
 
+    def test_bilateral_smooth_matches_dense_kernel(self):
+        from ..process.filters import bilateral_smooth
+
+        def dense_bilateral_smooth(soft, beta, width, stoptol, maxiter, y):
+            idx = np.arange(len(y))
+            w = np.abs(idx[:, None] - idx[None, :]) <= width
+            xold = y.astype(np.float64)
+            for _ in range(1, maxiter):
+                d = 0.5 * (xold[:, None] - xold[None, :]) ** 2
+                W = (np.exp(-beta * d) if soft else d <= beta**2) * w
+                xnew = W @ xold / W.sum(1)
+                if np.sum(np.square(xold - xnew)) < stoptol:
+                    break
+                xold = xnew
+            return xold
+
+        movie = np.random.random([40, 2, 3]) * 3
+        for soft in [True, False]:
+            result = bilateral_smooth(soft, 2.0, 4.5, 1e-4, 20, movie)
+            assert result.shape == movie.shape
+            for i in range(2):
+                for j in range(3):
+                    expected = dense_bilateral_smooth(
+                        soft, 2.0, 4.5, 1e-4, 20, movie[:, i, j]
+                    )
+                    np.testing.assert_allclose(result[:, i, j], expected, atol=1e-10)
+
+    def test_map_frames_threaded_matches_serial(self, monkeypatch):
+        movie = np.random.random([12, 20, 20]).astype(np.float32)
+        w1 = Window(movie)
+        serial = gaussian_blur(1.5, keepSourceWindow=True).image
+        monkeypatch.setitem(g.settings, "multiprocessing", True)
+        monkeypatch.setitem(g.settings, "nCores", 4)
+        w1.setAsCurrentWindow()
+        threaded = gaussian_blur(1.5, keepSourceWindow=True).image
+        np.testing.assert_array_equal(threaded, serial)
+
+    def test_map_frames_cancel(self):
+        from ..process.filters import Gaussian_blur
+
+        process = Gaussian_blur()
+        calls = []
+
+        def kernel(frame):
+            calls.append(1)
+            process.cancel()
+            return frame
+
+        assert process.map_frames(kernel, np.zeros([10, 4, 4])) is None
+        assert len(calls) == 1
+
+    def test_map_frames_without_frames(self):
+        from ..process.filters import Gaussian_blur
+
+        process = Gaussian_blur()
+        result = process.map_frames(
+            lambda frame: frame, np.zeros([4, 0, 5]), dtype=np.uint8, axis=1
+        )
+        assert result.shape == (4, 0, 5)
+        assert result.dtype == np.uint8
+
+    @pytest.mark.parametrize(
+        "process, args",
+        [
+            ("mean_filter", (4,)),
+            ("variance_filter", (5,)),
+            ("median_filter", (5,)),
+            ("difference_filter", ()),
+            ("fourier_filter", (10, 1, 4, False)),
+            ("gaussian_blur", (1.5,)),
+            ("difference_of_gaussians", (1, 2)),
+            ("canny_edge_detector", (1,)),
+            ("adaptive_threshold", (-0.5, 5)),
+            ("adaptive_threshold", (-0.5, 5, True)),
+        ],
+    )
+    def test_out_of_core_matches_in_memory(
+        self, process, args, tmp_path, monkeypatch
+    ):
+        process = globals()[process]
+        movie = np.random.random([50, 12, 10]).astype(np.float32)
+        w1 = Window(movie)
+        expected = process(*args, keepSourceWindow=True).image
+
+        mm = np.memmap(tmp_path / "movie.dat", np.float32, "w+", shape=movie.shape)
+        mm[:] = movie
+        Window(mm)
+        # a few frames per chunk
+        budget = 8 * movie[0].nbytes / 2**20
+        monkeypatch.setitem(g.settings, "memory_budget_mb", budget)
+        w2 = process(*args)
+        assert is_file_backed(w2.image)
+        assert not w2.image.flags.writeable
+        np.testing.assert_allclose(w2.image, expected, rtol=1e-5, atol=1e-6)
+
+    def test_in_memory_memmap_is_not_out_of_core(self, tmp_path):
+        mm = np.memmap(tmp_path / "movie.dat", np.float32, "w+", shape=(20, 12, 10))
+        in_memory = mm.astype(np.float64)  # still an np.memmap, but in RAM
+        assert isinstance(in_memory, np.memmap)
+        Window(in_memory)
+        w2 = mean_filter(4)
+        assert not is_file_backed(w2.image)
+        assert w2.image.flags.writeable
+
+    @staticmethod
+    def wait_for(*runs):
+        deadline = time.time() + 30
+        while not all(run.done for run in runs) and time.time() < deadline:
+            QtWidgets.QApplication.processEvents()
+            time.sleep(0.01)
+        assert all(run.done for run in runs)
+
+    def test_run_in_background(self):
+        movie1 = np.random.random([12, 20, 20]).astype(np.float32)
+        movie2 = np.random.random([12, 20, 20]).astype(np.float32)
+        w1 = Window(movie1)
+        expected1 = gaussian_blur(1.5, keepSourceWindow=True).image
+        w2 = Window(movie2)
+        expected2 = median_filter(5, keepSourceWindow=True).image
+        w1.setAsCurrentWindow()
+        run1 = gaussian_blur.run_in_background(1.5, keepSourceWindow=True)
+        w2.setAsCurrentWindow()
+        run2 = median_filter.run_in_background(5, keepSourceWindow=True)
+        self.wait_for(run1, run2)
+        np.testing.assert_array_equal(run1.result.image, expected1)
+        np.testing.assert_array_equal(run2.result.image, expected2)
+        assert run1.result.name == w1.name + " - Gaussian Blur sigma=1.5"
+        assert run1.process is not gaussian_blur
+
+    def test_set_value_in_background_uses_its_window(self):
+        from ..roi import makeROI
+
+        w1 = Window(np.zeros([5, 20, 20]))
+        roi = makeROI("rectangle", [[2, 3], [4, 5]], window=w1)
+        w1.currentROI = roi
+        run = set_value.run_in_background(
+            7, 0, 4, restrictToROI=True, keepSourceWindow=True
+        )
+        Window(np.zeros([5, 20, 20]))  # the current window while the run works
+        self.wait_for(run)
+        xx, yy = roi.getMask()
+        assert np.all(run.result.image[:, xx, yy] == 7)
+        assert run.result.image.sum() == 7 * 5 * len(xx)
+        with pytest.raises(RuntimeError):
+            subtract_trace.run_in_background()
+
+    def test_run_in_background_cancel(self):
+        w = Window(np.random.random([200, 64, 64]))
+        nWindows = len(g.m.windows)
+        run = gaussian_blur.run_in_background(3)
+        run.cancel()
+        self.wait_for(run)
+        assert run.result is None
+        assert len(g.m.windows) == nWindows
+        assert w in g.m.windows
+
 
 class TestMath(ProcessTest):
     def test_subtract(self, test_image, mock_message_box):
         w1 = Window(test_image)
+        stats = w1.stats()
         w = subtract(2)
         assert w is not None, "Subtract should return a window"
+        # the statistics are handed over from the source window, not recomputed
+        assert w.stats().min == stats.min - 2
+        assert w.stats().max == np.max(w.image)
 
     def test_multiply(self, test_image, mock_message_box):
         w1 = Window(test_image)
@@ -1,5 +1,7 @@
 import contextlib
 import os
+import threading
+import time
 
 import numpy as np
 import pyqtgraph as pg
@@ -9,7 +11,8 @@ from qtpy.QtWidgets import QApplication
 
 from .. import global_vars as g
 from ..app import application
-from ..roi import makeROI
+from ..roi import getTraces, makeROI
+from ..tracefig import TracePyramid
 from ..window import Window
 
 # Create test images for various test cases
@@ -111,6 +114,119 @@ class TestWindow:
         win1.imageview.setImage(STANDARD_3D_IMAGE)
         assert win1.imageview.ui.roiPlot.isVisible() == True
 
+    def test_stats(self, mock_message_box):
+        A = np.random.random([10, 20, 20])
+        A[2, 3, 4] = np.nan
+        A[5, 6, 7] = -np.inf
+        win = Window(A)
+        try:
+            assert not np.isinf(win.image).any()  # replaced by 0 when opened
+            finite = win.image[np.isfinite(win.image)]
+            stats = win.stats()
+            assert win.stats() is stats
+            assert stats.min == finite.min() == 0
+            assert stats.max == finite.max()
+            assert stats.mean == pytest.approx(finite.mean())
+            assert (stats.n_inf, stats.n_nan) == (0, 1)
+            assert stats.histogram.sum() == pytest.approx(finite.size)
+            assert not stats.is_binary
+            win.image[2, 3, 4] = 7
+            win.imageChanged()
+            assert win.stats() is not stats
+            assert (win.stats().max, win.stats().n_nan) == (7, 0)
+        finally:
+            win.close()
+
+    def test_memmap_frames(self, tmp_path, mock_message_box):
+        filename = str(tmp_path / "movie.npy")
+        np.save(filename, STANDARD_3D_IMAGE)
+        win = Window(np.load(filename, mmap_mode="r"))
+        try:
+            frames = win.imageview.frames
+            assert frames is not None
+            for i in [0, 1, 2, 7, 6]:
+                win.setIndex(i)
+                QApplication.processEvents()
+                np.testing.assert_array_equal(
+                    win.imageview.imageItem.image, STANDARD_3D_IMAGE[i]
+                )
+            deadline = time.time() + 5
+            while 5 not in frames._ring and time.time() < deadline:
+                time.sleep(0.01)
+            assert 5 in frames._ring  # prefetched backwards from frame 6
+            assert len(frames._ring) <= frames.size
+            lo, hi = frames.levels
+            assert STANDARD_3D_IMAGE.min() <= lo <= hi <= STANDARD_3D_IMAGE.max()
+            win.imageChanged()
+            assert len(frames._ring) == 0
+            win.reset()
+            assert win.imageview.frames is not frames
+        finally:
+            win.close()
+
+    def test_render_cache(self, mock_message_box):
+        win = Window(STANDARD_3D_IMAGE)
+        try:
+            item = win.imageview.imageItem
+            cache = win.imageview.renderCache
+            item.render()
+            assert 0 in cache._images
+            deadline = time.time() + 5
+            while 3 not in cache._images and time.time() < deadline:
+                time.sleep(0.01)
+            assert 3 in cache._images  # rendered ahead of frame 0
+            prerendered = cache._images[3]
+            win.setIndex(3)
+            item.qimage = None
+            item.render()
+            assert item.qimage is prerendered
+            cache.clear()
+            item.qimage = None
+            item.render()
+            assert item.qimage is not prerendered
+            assert item.qimage == prerendered
+            win.imageview.setLevels(0, 1)
+            item.qimage = None
+            item.render()
+            assert list(cache._images) == [3]
+            assert item.qimage != prerendered
+        finally:
+            win.close()
+
+    def test_render_without_cache(self, mock_message_box, monkeypatch):
+        from .. import window
+
+        monkeypatch.setattr(window, "try_make_qimage", None)  # as in old pyqtgraph
+        win = Window(STANDARD_3D_IMAGE)
+        try:
+            item = win.imageview.imageItem
+            assert not item.cachesRenders
+            win.setIndex(3)
+            item.render()
+            assert item.qimage is not None
+            assert len(win.imageview.renderCache._images) == 0
+        finally:
+            win.close()
+
+    def test_scatter_cache(self, mock_message_box):
+        win = Window(STANDARD_3D_IMAGE)
+        try:
+            color = QtGui.QColor("red")
+            win.scatterPoints[2] = [[1, 2, color, 5], [3, 4, color, 5]]
+            win.setIndex(2)
+            data = win._scatterData(2)
+            assert win._scatterData(2) is data
+            np.testing.assert_array_equal(data["pos"], [[1, 2], [3, 4]])
+            assert data["brush"][0] is data["brush"][1]
+            win.scatterPoints[2].pop()
+            assert win._scatterData(2) is not data
+            assert len(win.scatterPlot.data) == 2
+            win.setIndex(0)
+            win.setIndex(2)
+            assert len(win.scatterPlot.data) == 1
+        finally:
+            win.close()
+
 
 # Base class for ROI tests with common setup/teardown
 class ROITest:
@@ -734,3 +850,258 @@ class TestTracefig:
         finally:
             if os.path.exists("tempROI.txt"):
                 os.remove("tempROI.txt")
+
+    def test_dragged_trace_redrawn(self, trace_setup, mock_message_box, monkeypatch):
+        w1, rect, trace = trace_setup
+        threads = []
+        getTraceSampling = rect.getTraceSampling
+
+        def recordThread():
+            threads.append(threading.current_thread())
+            return getTraceSampling()
+
+        monkeypatch.setattr(rect, "getTraceSampling", recordThread)
+        for x in range(4, 8):  # a burst of moves is computed once
+            rect.draw_from_points([[x, 2], [4, 5]], finish=False)
+        deadline = time.time() + 5
+        while len(trace.traceScheduler.latencies) == 0 and time.time() < deadline:
+            QApplication.processEvents()
+            time.sleep(0.005)
+        assert len(trace.traceScheduler.latencies) == 1
+        bounds = trace.getBounds()
+        bounds = [max(0, bounds[0]), min(bounds[1], w1.mt)]
+        drawn = trace.rois[0]["pyramid"].data
+        np.testing.assert_allclose(
+            drawn[bounds[0] : bounds[1]], rect.getTrace(bounds)[: bounds[1] - bounds[0]]
+        )
+        assert threads == [threading.main_thread()]
+
+    def test_measure_snaps_to_samples(self, mock_message_box):
+        from ..process.measure import measure
+
+        w1 = Window(np.random.random([5000, 6, 6]))
+        try:
+            trace = makeROI("rectangle", [[1, 1], [3, 3]], window=w1).plot()
+            x, y = trace.rois[0]["p2trace"].getData()
+            assert len(x) < 5000  # the plot is decimated
+            measure.fig = trace
+            data = trace.rois[0]["pyramid"].data
+            np.testing.assert_array_equal(
+                measure.getNearestPoint((1234.3, 0.5)), [1234, data[1234]]
+            )
+        finally:
+            measure.fig = None
+            w1.close()
+
+
+class TestTracePyramid:
+    def test_view_keeps_extremes(self):
+        rng = np.random.default_rng(0)
+        data = rng.normal(size=100003)
+        data[54321] = 50
+        data[777] = -50
+        pyramid = TracePyramid(data)
+        x, y = pyramid.view(0, len(data), 500)
+        assert len(x) == len(y) <= 1000
+        assert y.max() == 50 and y.min() == -50
+        x, y = pyramid.view(1000, 1600, 500)
+        np.testing.assert_array_equal(y, data[1000:1600])
+        np.testing.assert_array_equal(x, np.arange(1000, 1600))
+
+    def test_update_matches_rebuild(self):
+        rng = np.random.default_rng(1)
+        data = rng.normal(size=4099)
+        pyramid = TracePyramid(data)
+        data[1000:1500] = rng.normal(size=500) * 10
+        data[4098] = 100
+        pyramid.update(1000, data[1000:1500])
+        pyramid.update(4098, data[4098:])
+        rebuilt = TracePyramid(data)
+        for lo, hi, lo2, hi2 in zip(
+            pyramid.mins, pyramid.maxs, rebuilt.mins, rebuilt.maxs
+        ):
+            np.testing.assert_array_equal(lo, lo2)
+            np.testing.assert_array_equal(hi, hi2)
+        assert rebuilt.maxs[-1][0] == 100
+
+
+class TestROITraces:
+    @pytest.fixture
+    def rois(self, mock_message_box):
+        w1 = Window(STANDARD_3D_IMAGE)
+        rois = [
+            makeROI("rectangle", [[3, 2], [4, 5]], window=w1),
+            makeROI("freehand", [[2, 2], [12, 3], [9, 15], [4, 10]], window=w1),
+            makeROI("line", [[1, 1], [15, 8]], window=w1),
+            makeROI("rectangle", [[-5, -5], [2, 2]], window=w1),  # outside the image
+            makeROI("rectangle", [[-2, 10], [5, 40]], window=w1),  # partly outside
+        ]
+        yield w1, rois
+        w1.close()
+
+    @pytest.mark.parametrize("integral_image_cache", [False, True])
+    def test_getTraces_matches_fancy_indexing(
+        self, rois, monkeypatch, integral_image_cache
+    ):
+        w1, rois = rois
+        monkeypatch.setitem(g.settings, "integral_image_cache", integral_image_cache)
+        # one frame per chunk
+        budget = 8 / 2**20
+        monkeypatch.setitem(g.settings, "memory_budget_mb", budget)
+        for bounds in [None, [2, 7]]:
+            traces = getTraces(rois, bounds)
+            for roi, trace in zip(rois, traces):
+                xx, yy = roi.getMask()
+                if len(xx) == 0:
+                    expected = np.zeros(w1.mt)
+                else:
+                    expected = w1.image[:, xx, yy].mean(1)
+                if bounds:
+                    expected = expected[bounds[0] : bounds[1]]
+                np.testing.assert_allclose(trace, expected)
+                np.testing.assert_allclose(roi.getTrace(bounds), expected)
+
+    def test_integral_image_invalidated(self, rois, monkeypatch):
+        w1, rois = rois
+        monkeypatch.setitem(g.settings, "integral_image_cache", True)
+        roi = rois[0]
+        roi.getTrace()
+        assert w1.integralImage() is not None
+        xx, yy = roi.getMask()
+        w1.image = w1.image.copy()
+        w1.image[:, xx, yy] += 1
+        np.testing.assert_allclose(roi.getTrace(), w1.image[:, xx, yy].mean(1))
+        w1.image[:, xx, yy] += 1
+        w1.imageChanged()
+        np.testing.assert_allclose(roi.getTrace(), w1.image[:, xx, yy].mean(1))
+
+    def test_getTraceIncremental_matches_getTrace(self, rois):
+        w1, rois = rois
+        for roi in rois[:2]:
+            pts = roi.getPoints()
+            for step, bounds in enumerate([None, None, [2, 7], [2, 7], [2, 7]]):
+                if roi.kind == "rectangle":
+                    moved = [pts[0] + [step, step % 2], pts[1]]
+                else:
+                    moved = pts + [step, step % 2]
+                roi.draw_from_points(moved, finish=False)
+                np.testing.assert_allclose(
+                    roi.getTraceIncremental(bounds), roi.getTrace(bounds)
+                )
+            assert roi._runningTrace.steps > 0
+        w1.image = w1.image.copy()
+        for roi in rois[:2]:
+            roi.getTraceIncremental()
+            w1.image[:, 5:10, 5:10] += 1
+            w1.imageChanged()
+            np.testing.assert_allclose(roi.getTraceIncremental(), roi.getTrace())
+
+    def test_getTraceIncremental_uses_sampling(self, rois):
+        w1, rois = rois
+        rois = rois[:3] + [makeROI("rect_line", [[2, 3], [14, 12]], window=w1)]
+        for roi in rois:
+            sampling = roi.getTraceSampling()
+            expected = roi.getTrace()
+            pts = np.array(roi.getPoints())
+            if roi.kind == "rectangle":
+                moved = [pts[0] + [2, 1], pts[1]]
+            else:
+                moved = pts + [2, 1]
+            roi.draw_from_points(moved, finish=False)
+            np.testing.assert_allclose(
+                roi.getTraceIncremental(None, sampling), expected
+            )
+            np.testing.assert_allclose(roi.getTraceIncremental(), roi.getTrace())
+
+    def test_mask_cache(self, rois):
+        w1, rois = rois
+        for roi in rois[:3]:
+            xx, yy = roi.getMask()
+            assert roi.getMask()[0] is xx
+            np.testing.assert_array_equal(roi.getMaskIndices(), xx * w1.my + yy)
+            pts = np.array(roi.getPoints())
+            if roi.kind == "rectangle":
+                moved = [pts[0] + [2, 1], pts[1]]
+            else:
+                moved = pts + [2, 1]
+            roi.draw_from_points(moved, finish=False)
+            xx2, yy2 = roi.getMask()
+            np.testing.assert_array_equal(
+                np.sort(xx2 * w1.my + yy2), np.sort((xx + 2) * w1.my + yy + 1)
+            )
+            assert not xx2.flags.writeable
+
+    def test_set_value_in_roi(self, rois):
+        from ..process.roi import set_value
+
+        w1, rois = rois
+        w1.currentROI = rois[1]
+        xx, yy = rois[1].getMask()
+        w2 = set_value(7, 2, 4, restrictToROI=True, keepSourceWindow=True)
+        assert np.all(w2.image[2:5, xx, yy] == 7)
+        mask = np.zeros(w1.image.shape[1:], bool)
+        mask[xx, yy] = True
+        np.testing.assert_array_equal(w2.image[:, ~mask], w1.image[:, ~mask])
+        unchanged = [0, 1, 5]
+        np.testing.assert_array_equal(
+            w2.image[unchanged][:, mask], w1.image[unchanged][:, mask]
+        )
+        w2.close()
+
+    def test_line_kymograph_follows_roi(self, rois, monkeypatch):
+        w1, rois = rois
+        line = rois[2]
+        line.update_kymograph()
+        xx, yy = line.getMask()
+        np.testing.assert_array_equal(line.kymograph.image, w1.image[:, xx, yy].T)
+        line.draw_from_points([[3, 2], [12, 15]], finish=False)
+        line.sigRegionChanged.emit(line)
+        xx, yy = line.getMask()
+        deadline = time.time() + 5
+        shown = line.kymograph.imageview.image
+        while shown.shape[0] != len(xx) and time.time() < deadline:
+            QApplication.processEvents()
+            time.sleep(0.005)
+            shown = line.kymograph.imageview.image
+        np.testing.assert_array_equal(shown, w1.image[:, xx, yy].T)
+        line.kymograph.close()
+
+    def test_rect_line_kymograph(self, rois, monkeypatch):
+        import scipy.ndimage
+
+        from ..roi import _kymograph
+
+        w1, rois = rois
+        roi = makeROI("rect_line", [[2, 2], [10, 6], [12, 16]], window=w1)
+        roi.setWidth(3)
+        coords = roi.getRibbonCoordinates()
+        assert coords.shape[:2] == (2, 3)
+        # one frame per chunk
+        budget = STANDARD_3D_IMAGE[0].nbytes / 2**20
+        monkeypatch.setitem(g.settings, "memory_budget_mb", budget)
+        expected = [
+            scipy.ndimage.map_coordinates(frame, coords, order=1).mean(0)
+            for frame in w1.image
+        ]
+        np.testing.assert_allclose(_kymograph(w1.image, coords), expected)
+        roi.update_kymograph()
+        np.testing.assert_allclose(roi.kymograph.image, np.transpose(expected))
+        roi.kymograph.close()
+
+    @pytest.mark.parametrize("width", [1, 4])
+    def test_rect_line_trace(self, rois, monkeypatch, width):
+        from ..roi import _kymograph
+
+        w1, rois = rois
+        roi = makeROI("rect_line", [[2, 2], [10, 6], [12, 16]], window=w1)
+        roi.setWidth(width)
+        monkeypatch.setitem(g.settings, "memory_budget_mb", 8 / 2**20)
+        expected = _kymograph(w1.image, roi.getRibbonCoordinates()).mean(1)
+        np.testing.assert_allclose(roi.getTrace(), expected)
+        np.testing.assert_allclose(roi.getTrace([3, 6]), expected[3:6])
+        np.testing.assert_allclose(getTraces([rois[0], roi])[1], expected)
+        weights = roi.getSamplingWeights()
+        assert roi.getSamplingWeights() is weights
+        roi.draw_from_points([[3, 2], [10, 6], [12, 16]])
+        assert roi.getSamplingWeights() is not weights
+        roi.delete()
@@ -5,6 +5,8 @@ Trace display module for flika - provides visualization of ROI traces.
 
 import os
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, TypedDict
 
 import numpy as np
@@ -15,7 +17,7 @@ from scipy.fftpack import fft, fftfreq
 
 import flika.global_vars as g
 from flika.logger import logger
-from flika.roi import ROI_Base
+from flika.roi import ROI_Base, getTraces
 from flika.utils.misc import save_file_gui
 from flika.utils.pyqtgraph_patch import apply_pyqtgraph_patches, safe_disconnect
 
@@ -29,8 +31,8 @@ class ROIDict(TypedDict, total=False):
     roi: ROI_Base
     p1trace: pg.PlotDataItem
     p2trace: pg.PlotDataItem
-    toBeRedrawn: bool
     toBeRedrawnFull: bool
+    pyramid: "TracePyramid"
     power_spectrum_x: np.ndarray
     power_spectrum_y: np.ndarray
 
@@ -106,7 +108,7 @@ class TraceFig(QtWidgets.QWidget):
         self.rois: list[
             ROIDict
         ] = []  # roi in this list is a dict: {roi, p1trace, p2trace, sigproxy}
-        self.redrawPartialThread: "RedrawPartialThread | None" = None
+        self.traceScheduler = TraceScheduler(self)
         self.vb = self.p1.plotItem.getViewBox()
 
         self.proxy = pg.SignalProxy(
@@ -117,10 +119,8 @@ class TraceFig(QtWidgets.QWidget):
         self.region.sigRegionChanged.connect(self.update_region)
         self.p1.plotItem.sigRangeChanged.connect(self.updateRegion)
         self.region.setRegion([0, 200])
-
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.p1.update)
-        self.timer.start()
+        self.p1.plotItem.vb.sigResized.connect(lambda vb: self.update_plot_data())
+        self.p2.plotItem.vb.sigResized.connect(lambda vb: self.update_plot_data())
 
         from flika.process.measure import measure
 
@@ -204,10 +204,7 @@ class TraceFig(QtWidgets.QWidget):
         while len(self.rois) > 0:
             self.removeROI(0)
 
-        # Stop timer
-        if hasattr(self, "timer") and self.timer is not None:
-            self.timer.stop()
-            safe_disconnect(self.timer.timeout)
+        self.traceScheduler.shutdown()
 
         # Remove from global trackers
         if self in g.traceWindows:
@@ -227,6 +224,7 @@ class TraceFig(QtWidgets.QWidget):
         minX, maxX = self.region.getRegion()
         self.p1.plotItem.setXRange(minX, maxX, padding=0, update=False)
         self.p1.plotItem.axes["bottom"]["item"].setRange(minX, maxX)
+        self.update_plot_data(overview=False)
 
     def updateRegion(
         self, window: pg.ViewBox, viewRange: list[list[float | int]]
@@ -277,41 +275,51 @@ class TraceFig(QtWidgets.QWidget):
         pass
 
     def translated(self, roi: ROI_Base) -> None:
-        """Handle ROI translation and start redraw thread if needed"""
-        index = self.get_roi_index(roi)
-        self.rois[index]["toBeRedrawn"] = True
-        if self.redrawPartialThread is None or self.redrawPartialThread.isFinished():
-            self.alert("Launching redrawPartialThread")
-            self.redrawPartialThread = RedrawPartialThread(self)
-            self.redrawPartialThread.alert.connect(self.alert)
-            self.redrawPartialThread.start()
-            self.redrawPartialThread.updated.connect(
-                self.partialThreadUpdatedSignal.emit
-            )
+        """Handle ROI translation by scheduling a redraw of its visible trace"""
+        self.traceScheduler.schedule(roi)
 
     def translateFinished(self, roi: ROI_Base) -> None:
         """Handle completion of ROI translation"""
         roi_index = self.get_roi_index(roi)
-        if (
-            self.redrawPartialThread is not None
-            and self.redrawPartialThread.isRunning()
-        ):
-            self.redrawPartialThread.quit_loop = True
-            # self.redrawPartialThread.finished_sig.emit() #tell the thread to finish
-            # loop = QtCore.QEventLoop()
-            # self.redrawPartialThread.finished.connect(loop.quit)
-            # loop.exec_()# This blocks until the "finished" signal is emitted
+        self.traceScheduler.cancel(roi)
         trace = roi.getTrace()
         if trace is not None:
             self.update_trace_full(roi_index, trace)
 
     def update_trace_full(self, roi_index: int, trace: np.ndarray) -> None:
         """Update the complete trace display for an ROI"""
-        pen = QtGui.QPen(self.rois[roi_index]["roi"].pen)
-        self.rois[roi_index]["p1trace"].setData(trace, pen=pen)
-        self.rois[roi_index]["p2trace"].setData(trace, pen=pen)
+        self.rois[roi_index]["pyramid"] = TracePyramid(trace)
+        self.update_plot_data(roi_index)
         self.finishedDrawingSignal.emit()
 
+    def update_plot_data(
+        self, roi_index: int | None = None, overview: bool = True
+    ) -> None:
+        """Feed the plots the samples of each trace needed at their current width
+
+        The top plot gets the samples inside the region, the bottom plot
+        (if overview) the whole trace, both decimated with the min/max pyramid of
+        the trace so that no more than two points per pixel are drawn.
+
+        Args:
+            roi_index: index of the ROI to update, or None to update them all
+            overview: also update the bottom plot
+        """
+        idxs = range(len(self.rois)) if roi_index is None else [roi_index]
+        start, stop = self.getBounds()
+        for i in idxs:
+            roi_dict = self.rois[i]
+            pyramid = roi_dict["pyramid"]
+            pen = QtGui.QPen(roi_dict["roi"].pen)
+            if len(pyramid.data) == 1:
+                pen = None
+            width = int(self.p1.plotItem.vb.width())
+            roi_dict["p1trace"].setData(*pyramid.view(start, stop, width), pen=pen)
+            if overview:
+                width = int(self.p2.plotItem.vb.width())
+                view = pyramid.view(0, len(pyramid.data), width)
+                roi_dict["p2trace"].setData(*view, pen=pen)
+
     def addROI(self, roi: ROI_Base) -> None:
         """Add an ROI to the trace display"""
         if self.hasROI(roi):
@@ -325,8 +333,8 @@ class TraceFig(QtWidgets.QWidget):
             p1trace = self.p1.plot(trace, pen=None, symbol="o")
             p2trace = self.p2.plot(trace, pen=None, symbol="o")
         else:
-            p1trace = self.p1.plot(trace, pen=pen)
-            p2trace = self.p2.plot(trace, pen=pen)
+            p1trace = self.p1.plot(pen=pen)  # data is set by update_plot_data
+            p2trace = self.p2.plot(pen=pen)
 
         # Check if methods exist before connecting signals
         if hasattr(roi, "sigRegionChanged"):
@@ -341,10 +349,11 @@ class TraceFig(QtWidgets.QWidget):
             "roi": roi,
             "p1trace": p1trace,
             "p2trace": p2trace,
-            "toBeRedrawn": False,
             "toBeRedrawnFull": False,
+            "pyramid": TracePyramid(trace),
         }
         self.rois.append(new_roi)
+        self.update_plot_data(len(self.rois) - 1)
 
     def removeROI(self, roi: ROI_Base | int) -> None:
         """Remove an ROI from the trace display"""
@@ -366,6 +375,7 @@ class TraceFig(QtWidgets.QWidget):
             self.rois[index]["roi"].resetSignals()
         except Exception:
             pass
+        self.traceScheduler.cancel(self.rois[index]["roi"])
         del self.rois[index]
         if len(self.rois) == 0:
             self.close()
@@ -398,11 +408,8 @@ class TraceFig(QtWidgets.QWidget):
         if hasattr(g, "m") and g.m is not None and hasattr(g.m, "statusBar"):
             g.m.statusBar().showMessage(f"Saving {os.path.basename(filename)}")
 
-        traces = []
-        for roi in self.rois:
-            trace = roi["roi"].getTrace()
-            if trace is not None:
-                traces.append(trace)
+        traces = getTraces([roi["roi"] for roi in self.rois])
+        traces = [trace for trace in traces if trace is not None]
 
         if not traces:
             return
@@ -475,8 +482,7 @@ class FFT_Analyzer(QtWidgets.QWidget):
         """Calculate and display power spectrum for each ROI trace"""
         traces = []
         pens = []
-        for roi in rois:
-            trace = roi["roi"].getTrace()
+        for roi, trace in zip(rois, getTraces([roi["roi"] for roi in rois])):
             if trace is not None:
                 traces.append(trace)
                 pen = QtGui.QPen(roi["roi"].pen)
@@ -573,85 +579,180 @@ def roiPlot(roi: ROI_Base) -> TraceFig | None:
     return win
 
 
-class RedrawPartialThread(QtCore.QThread):
-    """Thread for redrawing traces in the background"""
+class TraceScheduler(QtCore.QObject):
+    """Computes the traces of ROIs that are being dragged on a pool of worker threads
+
+    Each move of an ROI marks it dirty. Moves that arrive within COALESCE_MS of
+    each other are merged, and at most one computation per ROI runs at a time: if
+    the ROI moves again meanwhile, the newest position is computed as soon as the
+    running one finishes. Finished traces are delivered to the GUI thread through
+    the traceReady signal.
+
+    Attributes:
+        latencies (collections.deque): seconds between the last move of an ROI and
+            the redraw of its trace, for the most recent redraws
+    """
 
-    finished = QtCore.Signal()  # this announces that the thread has finished
-    finished_sig = QtCore.Signal()  # This tells the thread to finish
-    alert = QtCore.Signal(str)
-    updated = QtCore.Signal()  # This signal is emitted after each redraw
+    # roi, request number, bounds, trace
+    traceReady = QtCore.Signal(object, int, object, object)
+    COALESCE_MS = 15
 
     def __init__(self, tracefig: TraceFig) -> None:
-        """Initialize redraw thread for a trace window"""
         super().__init__()
         self.tracefig = tracefig
-        self.redrawCompleted = True
-        self.quit_loop = False
-
-    def run(self) -> None:
-        """Main thread execution loop"""
-        self.finished_sig.connect(self.request_quit_loop)
-        while not self.quit_loop:
-            time.sleep(0.05)
-            self.redraw()
-            self.updated.emit()
-        self.alert.emit("Finished Redraw")
-        self.finished.emit()
-
-    def request_quit_loop(self) -> None:
-        """Signal thread to exit"""
-        self.quit_loop = True
-
-    def redraw(self) -> None:
-        """Redraw ROI traces that need updating"""
-        if not self.redrawCompleted:
-            self.alert.emit("Redraw hasn't finished")
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, min(g.settings["nCores"], 4))
+        )
+        self.requests: dict[ROI_Base, tuple[int, float]] = {}
+        self.cancelled: dict[ROI_Base, int] = {}
+        self.dirty: dict[ROI_Base, None] = {}
+        self.running: set[ROI_Base] = set()
+        self.latencies: deque[float] = deque(maxlen=100)
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.COALESCE_MS)
+        self.timer.timeout.connect(self._dispatch)
+        self.traceReady.connect(self._deliver, QtCore.Qt.QueuedConnection)
+
+    def schedule(self, roi: ROI_Base) -> None:
+        """Mark the trace of roi as out of date"""
+        request = self.requests.get(roi, (0, 0.0))[0] + 1
+        self.requests[roi] = (request, time.perf_counter())
+        self.dirty[roi] = None
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def cancel(self, roi: ROI_Base) -> None:
+        """Drop the pending and running computations of roi, e.g. because its full
+        trace is about to be drawn"""
+        self.dirty.pop(roi, None)
+        if roi in self.requests:
+            self.cancelled[roi] = self.requests[roi][0]
+
+    def shutdown(self) -> None:
+        self.timer.stop()
+        self.dirty.clear()
+        self.cancelled.update({roi: req[0] for roi, req in self.requests.items()})
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self) -> None:
+        bounds = self.tracefig.getBounds()
+        bounds = [max(0, bounds[0]), bounds[1]]
+        for roi in list(self.dirty):
+            if roi in self.running:
+                continue
+            del self.dirty[roi]
+            try:
+                # the ROI keeps moving on the GUI thread, so take its geometry here
+                sampling = roi.getTraceSampling()
+            except Exception as e:
+                logger.error(f"Failed to read the geometry of {roi}: {e}")
+                continue
+            self.running.add(roi)
+            self.executor.submit(
+                self._compute, roi, self.requests[roi][0], bounds, sampling
+            )
+
+    def _compute(
+        self, roi: ROI_Base, request: int, bounds: list[int], sampling
+    ) -> None:
+        trace = None
+        if request == self.requests[roi][0]:  # skip positions that are already stale
+            try:
+                trace = roi.getTraceIncremental(bounds, sampling)
+            except Exception as e:
+                logger.error(f"Failed to compute the trace of {roi}: {e}")
+        self.traceReady.emit(roi, request, bounds, trace)
+
+    def _deliver(
+        self, roi: ROI_Base, request: int, bounds: list[int], trace: np.ndarray | None
+    ) -> None:
+        self.running.discard(roi)
+        if self.dirty:
+            self.timer.start()
+        if trace is None or len(trace) == 0:
+            return
+        if request <= self.cancelled.get(roi, 0) or not self.tracefig.hasROI(roi):
             return
+        roi_index = self.tracefig.get_roi_index(roi)
+        pyramid = self.tracefig.rois[roi_index]["pyramid"]
+        stop = min(bounds[1], len(pyramid.data))
+        if bounds[0] >= stop:
+            return
+        pyramid.update(bounds[0], trace[: stop - bounds[0]])
+        self.tracefig.update_plot_data(roi_index, overview=False)
+        if request == self.requests[roi][0]:
+            self.latencies.append(time.perf_counter() - self.requests[roi][1])
+        self.tracefig.partialThreadUpdatedSignal.emit()
 
-        self.alert.emit("Redrawing")
-        self.redrawCompleted = False
-        idxs = []
-        for i in range(len(self.tracefig.rois)):
-            if self.tracefig.rois[i]["toBeRedrawn"]:
-                self.tracefig.rois[i]["toBeRedrawn"] = False
-                idxs.append(i)
 
-        traces = []
-        bounds = self.tracefig.getBounds()
-        bounds = [max(0, bounds[0]), bounds[1]]
+class TracePyramid:
+    """Multi-resolution min/max summary of a trace, used to plot long traces
 
-        for i in idxs:
-            roi = self.tracefig.rois[i]["roi"]
-            trace = roi.getTrace(bounds)
-            if trace is not None:
-                traces.append(trace)
-            else:
-                # If trace is None, append an empty array as a placeholder
-                traces.append(np.array([]))
-
-        for i, roi_index in enumerate(idxs):
-            if len(traces[i]) == 0:
-                continue  # Skip empty traces
-
-            trace = traces[i]  # This function can sometimes take a long time.
-            pen = QtGui.QPen(self.tracefig.rois[roi_index]["roi"].pen)
-            bb = self.tracefig.getBounds()
-            curve = self.tracefig.rois[roi_index]["p1trace"]
-            newtrace = curve.getData()[1]
-
-            if bb[0] < 0:
-                bb[0] = 0
-            if bb[1] > len(newtrace):
-                bb[1] = len(newtrace)
-            if bb[1] < 0 or bb[0] > len(newtrace):
-                return
-
-            newtrace[bb[0] : bb[1]] = trace
-            curve.setData(newtrace, pen=pen)
-            self.alert.emit(f"CURVE {roi_index} redrawn")
-            QtWidgets.QApplication.processEvents()
-
-        self.redrawCompleted = True
+    Level k (k >= 1) holds the minimum and maximum of each block of 2**k samples,
+    so a range of samples can be drawn at any zoom with about two points per
+    pixel without hiding spikes.
+
+    Attributes:
+        data (np.ndarray): the full resolution trace
+        mins (list of np.ndarray): block minimums of each level, starting at level 1
+        maxs (list of np.ndarray): block maximums of each level, starting at level 1
+    """
+
+    def __init__(self, trace: np.ndarray) -> None:
+        self.data = np.array(trace, dtype=float).ravel()
+        self.mins: list[np.ndarray] = []
+        self.maxs: list[np.ndarray] = []
+        n, k = len(self.data), 1
+        while (n - 1) >> (k - 1) > 0:
+            nblocks = ((n - 1) >> k) + 1
+            self.mins.append(np.empty(nblocks))
+            self.maxs.append(np.empty(nblocks))
+            k += 1
+        self._build(0, n)
+
+    def _build(self, start: int, stop: int) -> None:
+        lo, hi = self.data, self.data
+        for k in range(1, len(self.mins) + 1):
+            i0, i1 = start >> k, ((stop - 1) >> k) + 1
+            a, b = lo[2 * i0 : 2 * i1], hi[2 * i0 : 2 * i1]
+            if len(a) % 2:
+                a, b = np.append(a, a[-1]), np.append(b, b[-1])
+            self.mins[k - 1][i0:i1] = np.fmin(a[0::2], a[1::2])
+            self.maxs[k - 1][i0:i1] = np.fmax(b[0::2], b[1::2])
+            lo, hi = self.mins[k - 1], self.maxs[k - 1]
+
+    def update(self, start: int, values: np.ndarray) -> None:
+        """Replace data[start:start + len(values)] and the blocks that contain it"""
+        stop = start + len(values)
+        if stop <= start:
+            return
+        self.data[start:stop] = values
+        self._build(start, stop)
+
+    def view(self, start: int, stop: int, width: int) -> tuple[np.ndarray, np.ndarray]:
+        """Get the points to draw samples [start, stop) on width pixels
+
+        Returns:
+            x and y arrays. These are the samples themselves when there are fewer
+            than two per pixel, otherwise the min and max of each block of the
+            coarsest level with no more blocks than pixels
+        """
+        start, stop = max(int(start), 0), min(int(stop), len(self.data))
+        if stop <= start:
+            return np.array([]), np.array([])
+        width = max(width, 100)
+        k = 1
+        while k <= len(self.mins) and (stop - start) >> k > width:
+            k += 1
+        if k == 1:
+            return np.arange(start, stop), self.data[start:stop]
+        k = min(k, len(self.mins))
+        i0, i1 = start >> k, ((stop - 1) >> k) + 1
+        x = (np.arange(i0, i1) << k) + ((1 << k) - 1) / 2
+        x = np.minimum(x, len(self.data) - 1)
+        y = np.column_stack([self.mins[k - 1][i0:i1], self.maxs[k - 1][i0:i1]])
+        return np.repeat(x, 2), y.ravel()
 
 
 class InvalidTraceException(Exception):
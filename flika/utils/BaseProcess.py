@@ -2,7 +2,11 @@
 Base process module for flika operations.
 """
 
+import copy
 import inspect
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import numpy as np
 from qtpy import QtCore, QtWidgets
@@ -11,8 +15,10 @@ import flika.global_vars as g
 import flika.window
 from flika.logger import logger
 from flika.utils.custom_widgets import *  # pylint: disable=wildcard-import
+from flika.utils.misc import is_file_backed
+from flika.utils.thread_manager import global_thread_pool, run_on_gui_thread
 
-__all__ = ["BaseProcess", "BaseProcess_noPriorWindow"]
+__all__ = ["BaseProcess", "BaseProcess_noPriorWindow", "BackgroundRun"]
 
 
 # Type aliases for process items
@@ -52,8 +58,13 @@ class BaseProcess(object):
 
             Process subclasses should populate this list in their gui() method
             and access values via getValue().
+        runs_in_background: Whether run_in_background() may run the process. Set
+            it to False in processes that use widgets or windows outside of start()
+            and end(), which only the GUI thread may touch.
     """
 
+    runs_in_background: bool = True
+
     def __init__(self):
         self.noPriorWindow: bool = False
         self.__name__: str = self.__class__.__name__.lower()
@@ -65,6 +76,11 @@ class BaseProcess(object):
         self.oldname: str = ""
         self.keepSourceWindow: bool = False
         self.command: str = ""
+        self.out_of_core: bool = False
+        self._cancel_event = threading.Event()
+        # Set on the copies of a process that run_in_background() runs
+        self._worker = None
+        self._source_window: flika.window.Window | None = None
 
     def getValue(self, name: str) -> object:
         """getValue(self,name)
@@ -104,9 +120,13 @@ class BaseProcess(object):
             )
             + ")"
         )
-        g.m.statusBar().showMessage("Running function {}...".format(self.__name__))
+        self.show_status("Running function {}...".format(self.__name__))
+        if self._worker is None:
+            self._cancel_event.clear()
+            self.oldwindow = g.win
+        else:  # g.win may have changed since the process was started
+            self.oldwindow = self._source_window
         self.keepSourceWindow = keepSourceWindow
-        self.oldwindow = g.win
         if self.oldwindow is None:
             raise (
                 MissingWindowError(
@@ -117,36 +137,263 @@ class BaseProcess(object):
             )
         self.tif = self.oldwindow.image
         self.oldname = self.oldwindow.name
+        # A process that knows the statistics of its result can hand them to the
+        # new window here, instead of having it scan the result (see Window.stats)
+        self.newstats = None
+        # Windows backed by a file on disk (see open_file(lazy=True)) are processed
+        # out of core: results are written to memory-mapped temporary files.
+        self.out_of_core = is_file_backed(self.tif)
 
     def end(self) -> flika.window.Window | None:
+        # Windows are created on the GUI thread
+        return run_on_gui_thread(self._end)
+
+    def _end(self) -> flika.window.Window | None:
         from flika import window
 
+        if self.cancelled():
+            self.newtif = None
         if not hasattr(self, "newtif") or self.newtif is None:
             self.oldwindow.reset()
             return
         commands = self.oldwindow.commands[:]
         if hasattr(self, "command"):
             commands.append(self.command)
+        if is_file_backed(self.newtif):
+            # out-of-core results are displayed read-only, like files opened lazily
+            self.newtif.flags.writeable = False
         newWindow = window.Window(
             self.newtif,
             str(self.newname),
             self.oldwindow.filename,
             commands,
             self.oldwindow.metadata,
+            stats=getattr(self, "newstats", None),
         )
         if self.keepSourceWindow is False:
             self.oldwindow.close()
         else:
             self.oldwindow.reset()
-        if (
-            np.max(self.newtif) == 1 and np.min(self.newtif) == 0
-        ):  # if the array is boolean
+        if newWindow.stats().is_binary:
             newWindow.imageview.setLevels(-0.1, 1.1)
         g.m.statusBar().showMessage("Finished with {}.".format(self.__name__))
         del self.tif
         del self.newtif
+        self.newstats = None
         return newWindow
 
+    def cancel(self) -> None:
+        """cancel(self)
+        Asks a running map_frames() or map_chunks() to stop. Frames that have not
+        started yet are skipped, they return None, and end() makes no new window.
+        """
+        self._cancel_event.set()
+
+    def cancelled(self) -> bool:
+        """cancelled(self)
+        Whether cancel() was called, or the worker running the process was aborted.
+        Long loops that don't use map_frames() or map_chunks() should check it.
+        """
+        return self._cancel_event.is_set() or (
+            self._worker is not None and self._worker.should_abort()
+        )
+
+    @property
+    def in_background(self) -> bool:
+        """Whether the process is running on a worker thread, see
+        run_in_background()"""
+        return self._worker is not None
+
+    def show_status(self, msg: str) -> None:
+        """show_status(self, msg)
+        Shows a message in the status bar, from the GUI thread or a worker thread.
+        """
+        if self._worker is not None:
+            self._worker.status.emit(msg)
+        else:
+            g.m.statusBar().showMessage(msg)
+
+    def run_in_background(self, *args, **kwargs) -> "BackgroundRun":
+        """run_in_background(self, *args, **kwargs)
+        Calls the process with args and kwargs on a worker thread of the global
+        thread pool, and returns at once.
+
+        The process runs on a copy of itself, so several processes, or the same
+        process on different windows, can run at the same time. It processes the
+        window that is current when it is started. Its progress is shown in the
+        status bar, with a button that cancels it. The new window is created on
+        the GUI thread when the work is done.
+
+        Returns:
+            BackgroundRun: Reports the progress and result of the run
+        """
+        if not self.runs_in_background:
+            raise RuntimeError(f"{self.__name__} can only run on the GUI thread")
+        run = copy.copy(self)
+        run._cancel_event = threading.Event()
+        run._source_window = g.win
+
+        def task(worker):
+            run._worker = worker
+            return run(*args, **kwargs)
+
+        controller = global_thread_pool.prepare_task(task)
+        background_run = BackgroundRun(run, controller)
+        g.m.statusBar().addPermanentWidget(background_run)
+        controller.start()
+        return background_run
+
+    def map_frames(
+        self,
+        kernel,
+        tif: np.ndarray | None = None,
+        dtype=None,
+        axis: int = 0,
+        tile: int = 1,
+    ) -> np.ndarray | None:
+        """map_frames(self, kernel, tif=None, dtype=None, axis=0, tile=1)
+        Applies ``kernel`` to every frame of ``tif`` along ``axis`` and writes the
+        results into a single preallocated array.
+
+        When g.settings['multiprocessing'] is on, frames are processed on a pool of
+        g.settings['nCores'] threads. Otherwise they are processed one at a time.
+        Progress is shown in the status bar. If cancel() is called, the remaining
+        frames are skipped.
+
+        Args:
+            kernel: Function that takes one frame and returns the processed frame.
+                If ``tile`` > 1, it instead takes and returns blocks of up to
+                ``tile`` frames, stacked along the first axis.
+            tif: The array to process. Defaults to self.tif.
+            dtype: dtype of the output. Defaults to the dtype returned by kernel.
+            axis: The axis of tif that indexes frames.
+            tile: Number of frames passed to each call of kernel.
+
+        Returns:
+            The processed array, with the frames along ``axis``, or None if the
+            operation was cancelled.
+        """
+        if tif is None:
+            tif = self.tif
+        frames = np.moveaxis(tif, axis, 0)
+        nFrames = len(frames)
+        if nFrames == 0:  # there is no frame to learn the output shape from
+            out = np.empty(frames.shape, tif.dtype if dtype is None else dtype)
+            return np.moveaxis(out, 0, axis)
+        blocks = [slice(i, min(i + tile, nFrames)) for i in range(0, nFrames, tile)]
+
+        def run_block(sl):
+            if tile == 1:
+                return np.asarray(kernel(frames[sl.start]))[np.newaxis]
+            return np.asarray(kernel(frames[sl]))
+
+        first = run_block(blocks[0])
+        out = self.allocate(
+            (nFrames,) + first.shape[1:], first.dtype if dtype is None else dtype
+        )
+        out[blocks[0]] = first
+
+        def process(sl):
+            if not self.cancelled():
+                out[sl] = run_block(sl)
+
+        nCores = g.settings["nCores"]
+        if g.settings["multiprocessing"] and nCores > 1 and len(blocks) > 2:
+            with ThreadPoolExecutor(nCores) as executor:
+                futures = [executor.submit(process, sl) for sl in blocks[1:]]
+                for i, future in enumerate(as_completed(futures)):
+                    future.result()
+                    self._report_progress(i + 2, len(blocks))
+        else:
+            for i, sl in enumerate(blocks[1:]):
+                if self.cancelled():
+                    break
+                process(sl)
+                self._report_progress(i + 2, len(blocks))
+        if self.cancelled():
+            self.show_status("{} cancelled.".format(self.__name__))
+            return None
+        return np.moveaxis(out, 0, axis)
+
+    def map_chunks(
+        self,
+        kernel,
+        tif: np.ndarray | None = None,
+        dtype=None,
+        axis: int = 0,
+        halo: int = 0,
+    ) -> np.ndarray | None:
+        """map_chunks(self, kernel, tif=None, dtype=None, axis=0, halo=0)
+        Streams ``tif`` through ``kernel`` in chunks along ``axis``, so that movies
+        larger than memory can be processed.
+
+        The chunk size is chosen so that one chunk of input plus its output fits in
+        g.settings['memory_budget_mb']. Each chunk is extended by ``halo`` slices on
+        both sides, and the halo is cut from the result before it is written. For a
+        temporal filter, set halo to the number of frames the filter reaches in
+        either direction and the result is the same as filtering the whole movie at
+        once. Filters that need the whole trace of each pixel (e.g. Fourier or
+        Butterworth filters) can instead be chunked in space with axis=1.
+
+        Args:
+            kernel: Function that takes a chunk of tif, with the same axis order as
+                tif, and returns a result with the same shape along ``axis``.
+            tif: The array to process. Defaults to self.tif.
+            dtype: dtype of the output. Defaults to the dtype returned by kernel.
+            axis: The axis to chunk along.
+            halo: Number of overlapping slices on each side of a chunk.
+
+        Returns:
+            The processed array, or None if the operation was cancelled. When the
+            process runs out of core, this is a memory-mapped temporary file.
+        """
+        if tif is None:
+            tif = self.tif
+        A = np.moveaxis(tif, axis, 0)
+        n = len(A)
+        out_itemsize = np.dtype(tif.dtype if dtype is None else dtype).itemsize
+        slice_nbytes = A[0].nbytes + A[0].size * out_itemsize
+        budget = g.settings["memory_budget_mb"] * 2**20
+        chunk = max(1, int(budget // slice_nbytes) - 2 * halo)
+        out = None
+        for start in range(0, n, chunk):
+            if self.cancelled():
+                self.show_status("{} cancelled.".format(self.__name__))
+                return None
+            stop = min(start + chunk, n)
+            lo = max(0, start - halo)
+            hi = min(n, stop + halo)
+            block = np.moveaxis(np.asarray(A[lo:hi]), 0, axis)
+            result = np.moveaxis(np.asarray(kernel(block)), axis, 0)
+            if out is None:
+                out = self.allocate(
+                    (n,) + result.shape[1:], result.dtype if dtype is None else dtype
+                )
+            out[start:stop] = result[start - lo : stop - lo]
+            self._report_progress(stop, n)
+        return np.moveaxis(out, 0, axis)
+
+    def allocate(self, shape, dtype) -> np.ndarray:
+        """allocate(self, shape, dtype)
+        Returns an uninitialized output array. When the process runs out of core,
+        the array is a memory-mapped temporary file, which is deleted once the
+        array is no longer used.
+        """
+        if not self.out_of_core:
+            return np.empty(shape, dtype)
+        with tempfile.TemporaryFile() as fh:
+            return np.memmap(fh, dtype=dtype, mode="w+", shape=shape)
+
+    def _report_progress(self, done: int, total: int) -> None:
+        percent = int(100 * done / total)
+        if percent != int(100 * (done - 1) / total):
+            if self._worker is not None:
+                self._worker.progress.emit(percent)
+            else:
+                g.m.statusBar().showMessage(
+                    "Running function {}... {}%".format(self.__name__, percent)
+                )
+
     def gui(self):
         from pyqtgraph import SignalProxy
 
@@ -196,6 +443,12 @@ class BaseProcess(object):
                 newsettings[name] = value
         g.settings["baseprocesses"][self.__name__] = newsettings
         g.settings.save()
+        if g.settings["background_processes"] and self.runs_in_background:
+            if self.noPriorWindow:
+                self.run_in_background(*args)
+            else:
+                self.run_in_background(*args, keepSourceWindow=True)
+            return
         try:
             if self.noPriorWindow:
                 self.__call__(*args)
@@ -236,17 +489,84 @@ class BaseProcess_noPriorWindow(BaseProcess):
             )
             + ")"
         )
-        g.m.statusBar().showMessage("Performing {}...".format(self.__name__))
+        self.show_status("Performing {}...".format(self.__name__))
 
-    def end(self):
+    def _end(self):
         from flika import window
 
+        if self.cancelled():
+            return None
         commands = [self.command]
         newWindow = window.Window(self.newtif, str(self.newname), commands=commands)
-        if (
-            np.max(self.newtif) == 1 and np.min(self.newtif) == 0
-        ):  # if the array is boolean
+        if newWindow.stats().is_binary:  # if the array is boolean
             newWindow.imageview.setLevels(-0.1, 1.1)
         g.m.statusBar().showMessage("Finished with {}.".format(self.__name__))
         del self.newtif
         return newWindow
+
+
+class BackgroundRun(QtWidgets.QWidget):
+    """A process started by BaseProcess.run_in_background()
+
+    Sits in the status bar while the process runs, with its progress and a button
+    that cancels it, and removes itself when the process is done.
+
+    Attributes:
+        process: The copy of the process that runs
+        controller: The ThreadController of the worker thread
+        result: What the process returned, usually the new window, once it is done
+        done: Whether the process has finished, was cancelled, or failed
+    """
+
+    finished = QtCore.Signal(object)
+
+    def __init__(self, process, controller):
+        super().__init__()
+        self.process = process
+        self.controller = controller
+        self.result = None
+        self.done = False
+        self.label = QtWidgets.QLabel(process.__name__)
+        self.bar = QtWidgets.QProgressBar()
+        self.bar.setRange(0, 100)
+        self.bar.setMaximumWidth(100)
+        self.button = QtWidgets.QPushButton("Stop")
+        self.button.clicked.connect(self.cancel)
+        layout = QtWidgets.QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.label)
+        layout.addWidget(self.bar)
+        layout.addWidget(self.button)
+        self.setLayout(layout)
+        worker = controller.worker
+        worker.progress.connect(self.bar.setValue)
+        worker.status.connect(self._showStatus)
+        worker.result.connect(self._setResult)
+        worker.error.connect(self._showError)
+        worker.finished.connect(self._finish)
+
+    def cancel(self) -> None:
+        """cancel(self)
+        Asks the process to stop, see BaseProcess.cancel()
+        """
+        self.process.cancel()
+        self.button.setEnabled(False)
+
+    @QtCore.Slot(str)
+    def _showStatus(self, msg: str) -> None:
+        g.m.statusBar().showMessage(msg)
+
+    @QtCore.Slot(object)
+    def _setResult(self, result) -> None:
+        self.result = result
+
+    @QtCore.Slot(str)
+    def _showError(self, msg: str) -> None:
+        g.alert("There was an error in {}: {}".format(self.process.__name__, msg))
+
+    @QtCore.Slot()
+    def _finish(self) -> None:
+        self.done = True
+        g.m.statusBar().removeWidget(self)
+        self.setParent(None)
+        self.finished.emit(self.result)
@@ -490,7 +490,7 @@ class TiffWriter(object):
             self._fh.write(struct.pack(byteorder+self._offset_format, 0))
 
     def save(self, data, photometric=None, planarconfig=None, tile=None,
-             contiguous=True, compress=0, colormap=None,
+             contiguous=True, compress=0, compressed=None, colormap=None,
              description=None, datetime=None, resolution=None,
              metadata={}, extratags=()):
         """Write image data and tags to TIFF file.
@@ -539,6 +539,10 @@ class TiffWriter(object):
             Compression cannot be used to write contiguous files.
             If 'lzma', LZMA compression is used, which is not available on
             all platforms.
+        compressed : sequence of bytes
+            The planes of data, already compressed as specified by 'compress',
+            e.g. by a pool of threads. If None (default), the planes are
+            compressed here.
         colormap : numpy.ndarray
             RGB color values for the corresponding data value.
             Must be of shape (3, 2**(data.itemsize*8)) and dtype uint16.
@@ -1024,8 +1028,11 @@ class TiffWriter(object):
                                     fh.write_array(chunk)
                                     fh.flush()
             elif compress:
-                for plane in data[pageindex]:
-                    plane = compress(plane)
+                for planeindex, plane in enumerate(data[pageindex]):
+                    if compressed is None:
+                        plane = compress(plane)
+                    else:
+                        plane = compressed[pageindex * shape[1] + planeindex]
                     strip_byte_counts.append(len(plane))
                     fh.write(plane)
             else:
@@ -2568,13 +2575,13 @@ class TiffPage(object):
                         # needs the raw byte order
                         typecode = dtype
                     try:
-                        return numpy.fromstring(x, typecode)
+                        return numpy.frombuffer(x, typecode).copy()
                     except ValueError as e:
                         # strips may be missing EOI
                         warnings.warn("unpack: %s" % e)
                         xlen = ((len(x) // (bits_per_sample // 8)) *
                                 (bits_per_sample // 8))
-                        return numpy.fromstring(x[:xlen], typecode)
+                        return numpy.frombuffer(x[:xlen], typecode).copy()
 
             elif isinstance(bits_per_sample, tuple):
                 def unpack(x):
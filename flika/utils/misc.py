@@ -18,6 +18,7 @@ __all__ = [
     "open_file_gui",
     "inside_ipython",
     "get_flika_icon",
+    "is_file_backed",
 ]
 
 
@@ -256,3 +257,22 @@ def convert_to_string(arg) -> str:
         return "np.array(" + str(arg.tolist()) + ")"
     else:
         return str(arg)
+
+
+def is_file_backed(A) -> bool:
+    """
+    Whether an array is a view of a memory-mapped file. Arrays computed from a
+    np.memmap (with astype, ufuncs, ...) are np.memmap instances too, but they are
+    in memory.
+
+    Args:
+        A: Any array
+
+    Returns:
+        bool: True if A, or an array it is a view of, maps a file
+    """
+    while A is not None:
+        if getattr(A, "_mmap", None) is not None:
+            return True
+        A = getattr(A, "base", None)
+    return False
@@ -11,6 +11,7 @@ It includes:
 2. Worker pattern for background tasks
 3. Thread Pool for managing multiple worker threads
 4. Utilities for safe thread termination
+5. A way for worker threads to run functions on the GUI thread
 """
 
 import logging
@@ -176,7 +177,7 @@ class ThreadController:
             timeout: Maximum time to wait in milliseconds
         """
         try:
-            if self.thread.isRunning():
+            if self.thread is not None and self.thread.isRunning():
                 return self.thread.wait(timeout)
             return True
         except RuntimeError:
@@ -243,6 +244,22 @@ class ThreadPool:
         """
         Start a new task in the thread pool.
 
+        Args:
+            task_func: The function to run in the thread
+            *args, **kwargs: Arguments to pass to the task function
+
+        Returns:
+            ThreadController: The controller for the new thread
+        """
+        controller = self.prepare_task(task_func, *args, **kwargs)
+        controller.start()
+        return controller
+
+    def prepare_task(self, task_func: Callable, *args, **kwargs) -> ThreadController:
+        """
+        Add a task to the thread pool without starting it, so that its signals can
+        be connected before it runs. Call start() on the controller to run it.
+
         Args:
             task_func: The function to run in the thread
             *args, **kwargs: Arguments to pass to the task function
@@ -261,7 +278,7 @@ class ThreadPool:
                 pass
         self.controllers = valid_controllers
 
-        # Create and start a new thread controller
+        # Create a new thread controller
         controller = ThreadController(task_func, *args, **kwargs)
 
         # Connect to track active count
@@ -269,7 +286,6 @@ class ThreadPool:
         controller.connect("finished", lambda: self._decrement_active())
 
         self.controllers.append(controller)
-        controller.start()
         return controller
 
     def _increment_active(self):
@@ -317,6 +333,62 @@ def run_in_thread(task_func: Callable, *args, **kwargs) -> ThreadController:
     return global_thread_pool.start_task(task_func, *args, **kwargs)
 
 
+class _GuiInvoker(QtCore.QObject):
+    """Runs the functions sent to it on the thread it lives in"""
+
+    call = QtCore.Signal(object)
+
+    def __init__(self):
+        super().__init__()
+        self.call.connect(
+            self._run, QtCore.Qt.ConnectionType.BlockingQueuedConnection
+        )
+
+    @QtCore.Slot(object)
+    def _run(self, task: Callable):
+        task()
+
+
+_gui_invoker: Optional[_GuiInvoker] = None
+_gui_invoker_lock = threading.Lock()
+
+
+def run_on_gui_thread(task_func: Callable, *args, **kwargs):
+    """
+    Run a function on the GUI thread and wait for its result. Worker threads use
+    this for work that must be done on the GUI thread, such as creating windows.
+    Called from the GUI thread, the function is simply called.
+
+    Args:
+        task_func: The function to run on the GUI thread
+        *args, **kwargs: Arguments to pass to the function
+
+    Returns:
+        The result of the function. Exceptions it raises are raised again here.
+    """
+    global _gui_invoker
+    app = QtCore.QCoreApplication.instance()
+    if app is None or QtCore.QThread.currentThread() == app.thread():
+        return task_func(*args, **kwargs)
+    with _gui_invoker_lock:
+        if _gui_invoker is None:
+            invoker = _GuiInvoker()
+            invoker.moveToThread(app.thread())
+            _gui_invoker = invoker
+    outcome = {}
+
+    def task():
+        try:
+            outcome["result"] = task_func(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    _gui_invoker.call.emit(task)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
 def cleanup_threads():
     """
     Clean up all threads in the global thread pool.
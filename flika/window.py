@@ -2,8 +2,12 @@
 Window module for flika - provides the main UI window component.
 """
 
+import dataclasses
 import os
+import threading
+from collections import OrderedDict
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional
 
 import numpy as np
@@ -12,11 +16,16 @@ from qtpy import QtCore, QtGui, QtWidgets
 
 import flika.global_vars as g
 from flika.logger import logger
-from flika.roi import ROI_Drawing, makeROI
+from flika.roi import ROI_Drawing, makeROI, save_rois_npz
 from flika.utils.custom_widgets import SliderLabel, WindowSelector
-from flika.utils.misc import save_file_gui
+from flika.utils.misc import is_file_backed, save_file_gui
 from flika.utils.pyqtgraph_patch import apply_pyqtgraph_patches, safe_disconnect
 
+try:
+    from pyqtgraph.functions_qimage import try_make_qimage
+except ImportError:  # older pyqtgraph releases render frames without a RenderCache
+    try_make_qimage = None
+
 pg.setConfigOptions()
 
 # Apply PyQtGraph patches to prevent errors during cleanup
@@ -66,9 +75,483 @@ class Bg_im_dialog(QtWidgets.QDialog):
             self.bg_im = None
 
 
+class FrameProvider:
+    """Serves the frames of a memory-mapped [t, ...] movie one at a time
+
+    Frames are read into a ring of at most RING_SIZE copies. After each request a
+    worker thread reads the next frames in the direction the movie is being
+    scrubbed, so stepping through it rarely waits on the disk. The (min, max) of
+    every frame read is folded into levels, an estimate of the levels of the whole
+    movie that improves as more of it is seen.
+    """
+
+    RING_SIZE = 8
+
+    def __init__(self, image: np.ndarray) -> None:
+        self.image = image
+        frame_mb = max(image[0].nbytes / 2**20, 1e-6)
+        budget = g.settings["memory_budget_mb"] // frame_mb
+        self.size = int(min(self.RING_SIZE, max(2, budget)))
+        self.levels: tuple[float, float] | None = None
+        self._ring: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._last = 0
+        self._target: tuple[int, int] | None = None
+        self._generation = 0  # frames read before invalidate() are dropped
+        self._pending = False
+        self._closed = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def frame(self, index: int) -> np.ndarray:
+        """frame(self, index)
+        Get a frame, from the ring if it was prefetched, and prefetch the frames
+        after it.
+
+        Returns:
+            The frame, as an in-memory array
+        """
+        frame = self.get(index)
+        step = -1 if index < self._last else 1
+        self._last = index
+        self._request(index, step)
+        return frame
+
+    def get(self, index: int) -> np.ndarray:
+        """get(self, index)
+        Get a frame, from the ring if it was prefetched, without prefetching
+        others. Safe to call from any thread.
+        """
+        with self._lock:
+            frame = self._ring.get(index)
+            if frame is not None:
+                self._ring.move_to_end(index)
+        if frame is None:
+            frame = self._read(index)
+        return frame
+
+    def invalidate(self) -> None:
+        """invalidate(self)
+        Drop the frames read so far, e.g. after the movie was edited in place.
+        """
+        with self._lock:
+            self._ring.clear()
+            self.levels = None
+            self._generation += 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._ring.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _read(self, index: int) -> np.ndarray:
+        """Read a frame into the ring and fold its (min, max) into levels"""
+        generation = self._generation
+        frame = np.array(self.image[index])
+        levels = None
+        if frame.size > 0 and frame.dtype != np.bool_:
+            with np.errstate(invalid="ignore"):
+                levels = float(np.nanmin(frame)), float(np.nanmax(frame))
+        with self._lock:
+            if self._closed or generation != self._generation:
+                return frame
+            self._store(index, frame)
+            if levels is not None and np.all(np.isfinite(levels)):
+                if self.levels is not None:
+                    levels = (
+                        min(self.levels[0], levels[0]),
+                        max(self.levels[1], levels[1]),
+                    )
+                self.levels = levels
+        return frame
+
+    def _store(self, index: int, frame: np.ndarray) -> None:
+        self._ring[index] = frame
+        self._ring.move_to_end(index)
+        while len(self._ring) > self.size:
+            self._ring.popitem(last=False)
+
+    def _request(self, index: int, step: int) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._target = (index, step)
+            if self._pending:
+                return
+            self._pending = True
+        try:
+            self.executor.submit(self._prefetch)
+        except RuntimeError:  # shut down
+            self._pending = False
+
+    def _prefetch(self) -> None:
+        while True:
+            with self._lock:
+                if self._target is None or self._closed:
+                    self._pending = False
+                    return
+                index, step = self._target
+                self._target = None
+            for k in range(1, self.size):
+                i = index + k * step
+                if not 0 <= i < len(self.image):
+                    break
+                with self._lock:
+                    if self._target is not None or self._closed:
+                        break  # the movie moved on, restart from the new frame
+                    if i in self._ring:
+                        continue
+                try:
+                    self._read(i)
+                except Exception as e:
+                    logger.error(f"Failed to prefetch frame {i}: {e}")
+                    break
+
+
+class RenderCache:
+    """LRU cache of the QImages rendered from the frames of a movie
+
+    FrameImageItem paints cached frames without mapping them through the levels
+    and lookup table again. Each time a frame is shown, a worker thread renders
+    the next AHEAD frames in the direction the movie is played. Playback and
+    scrubbing then mostly paint frames rendered ahead of time. The cache is
+    dropped when the levels or the lookup table change, or when the image does.
+    """
+
+    SIZE = 32
+    AHEAD = 8
+
+    def __init__(self) -> None:
+        self.size = self.SIZE
+        self._images: OrderedDict[int, QtGui.QImage] = OrderedDict()
+        self._key = None
+        self._lock = threading.Lock()
+        self._last = 0
+        self._source = None
+        self._target = None
+        self._generation = 0  # renders started before clear() are dropped
+        self._pending = False
+        self._closed = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def get(self, index: int, key) -> QtGui.QImage | None:
+        """get(self, index, key)
+        The cached rendering of a frame, or None. key identifies the levels and
+        lookup table it must have been rendered with (see
+        FrameImageItem.renderParams); a new key empties the cache.
+        """
+        with self._lock:
+            self._setKey(key)
+            qimage = self._images.get(index)
+            if qimage is not None:
+                self._images.move_to_end(index)
+            return qimage
+
+    def put(self, index: int, key, qimage: QtGui.QImage, generation=None) -> None:
+        with self._lock:
+            if self._closed or key != self._key:
+                return
+            if generation is not None and generation != self._generation:
+                return
+            if len(self._images) == 0:
+                frame_mb = max(qimage.sizeInBytes() / 2**20, 1e-6)
+                budget = g.settings["memory_budget_mb"] // frame_mb
+                self.size = int(min(self.SIZE, max(2, budget)))
+            self._images[index] = qimage
+            self._images.move_to_end(index)
+            while len(self._images) > self.size:
+                self._images.popitem(last=False)
+
+    def setSource(self, n: int, source) -> None:
+        """setSource(self, n, source)
+
+        Args:
+            n (int): The number of frames
+            source (Callable[[int], np.ndarray]): Returns frame i as it is passed
+                to the ImageItem. Called from the worker thread
+        """
+        with self._lock:
+            self._source = (n, source)
+
+    def request(self, index: int, params) -> None:
+        """request(self, index, params)
+        Render the frames after index in the background.
+
+        Args:
+            index (int): The frame being shown
+            params (tuple): (key, levels, lut, axisOrder), see
+                FrameImageItem.renderParams
+        """
+        step = -1 if index < self._last else 1
+        self._last = index
+        with self._lock:
+            if self._closed or self._source is None:
+                return
+            n, source = self._source
+            self._setKey(params[0])
+            self._target = (index, step, n, source, params, self._generation)
+            if self._pending:
+                return
+            self._pending = True
+        try:
+            self.executor.submit(self._prefetch)
+        except RuntimeError:  # shut down
+            self._pending = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._images.clear()
+            self._generation += 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._images.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _setKey(self, key) -> None:
+        if key != self._key:
+            self._images.clear()
+            self._key = key
+
+    def _prefetch(self) -> None:
+        while True:
+            with self._lock:
+                if self._target is None or self._closed:
+                    self._pending = False
+                    return
+                index, step, n, source, params, generation = self._target
+                self._target = None
+            key, levels, lut, axisOrder = params
+            for k in range(1, min(self.AHEAD, self.size - 1) + 1):
+                i = index + k * step
+                if not 0 <= i < n:
+                    break
+                with self._lock:
+                    if self._target is not None or self._closed or key != self._key:
+                        break  # the movie or its levels moved on
+                    if i in self._images:
+                        continue
+                try:
+                    qimage = _render_frame(source(i), levels, lut, axisOrder)
+                except Exception as e:
+                    logger.error(f"Failed to render frame {i}: {e}")
+                    break
+                if qimage is not None:
+                    self.put(i, key, qimage, generation)
+
+
+def _render_frame(frame, levels, lut, axisOrder) -> QtGui.QImage | None:
+    """The QImage ImageItem.render makes from a 2D frame, or None for frames it
+    renders another way (with nans, or through makeARGB)"""
+    if frame.ndim != 2 or frame.size == 0 or frame.dtype == np.bool_:
+        return None
+    if axisOrder == "col-major":
+        frame = frame.swapaxes(0, 1)
+    if frame.dtype.kind == "f" and np.isnan(frame.min()):
+        return None
+    return try_make_qimage(frame, levels=levels, lut=lut)
+
+
+class FrameImageItem(pg.ImageItem):
+    """pg.ImageItem that paints frames of a movie from a RenderCache
+
+    ImageView sets frameIndex after showing a frame of its movie. Any other
+    image given to setImage is rendered as usual.
+    """
+
+    # The state of pg.ImageItem that render() sets when it paints a cached frame
+    RENDER_STATE = (
+        "_processingBuffer",
+        "_displayBuffer",
+        "_renderRequired",
+        "_unrenderable",
+    )
+
+    def __init__(self, *args, **kargs) -> None:
+        self.frameIndex: int | None = None
+        self.renderCache: RenderCache | None = None
+        pg.ImageItem.__init__(self, *args, **kargs)
+        self.cachesRenders = try_make_qimage is not None and all(
+            hasattr(self, name) for name in self.RENDER_STATE
+        )
+
+    def setImage(self, image=None, *args, **kargs) -> None:
+        if image is not None:
+            self.frameIndex = None
+        pg.ImageItem.setImage(self, image, *args, **kargs)
+
+    def renderParams(self) -> tuple | None:
+        """renderParams(self)
+
+        Returns:
+            (key, levels, lut, axisOrder) that the image is rendered with, where
+            key is hashable, or None if the rendering can't be cached
+        """
+        if self.image is None or self.image.ndim != 2 or self.autoDownsample:
+            return None
+        lut = self.lut
+        if callable(lut):
+            lut = lut(self.image, 256)
+        if lut is not None and (
+            not isinstance(lut, np.ndarray) or lut.dtype != np.uint8
+        ):
+            return None
+        levels = self.levels
+        if levels is not None:
+            levels = np.asarray(levels, dtype=float)
+            if levels.ndim != 1:
+                return None
+        key = (
+            None if levels is None else tuple(levels),
+            None if lut is None else (lut.shape, lut.tobytes()),
+            self.axisOrder,
+        )
+        return key, levels, lut, self.axisOrder
+
+    def render(self) -> None:
+        params = None
+        if (
+            self.cachesRenders
+            and self.renderCache is not None
+            and self.frameIndex is not None
+        ):
+            params = self.renderParams()
+        if params is not None:
+            qimage = self.renderCache.get(self.frameIndex, params[0])
+            if qimage is not None:
+                self.qimage = qimage
+                self._processingBuffer = None
+                self._displayBuffer = None
+                self._renderRequired = False
+                self._unrenderable = False
+                self.renderCache.request(self.frameIndex, params)
+                return
+        pg.ImageItem.render(self)
+        if params is None:
+            return
+        # Renderings in _displayBuffer are overwritten by the next frame
+        if self.qimage is not None and self._displayBuffer is None:
+            self.renderCache.put(self.frameIndex, params[0], self.qimage)
+        self.renderCache.request(self.frameIndex, params)
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class ImageStats:
+    """Statistics of an image, computed in one pass by ImageStats.compute
+
+    min, max, mean and the histogram only count finite values.
+    """
+
+    min: float  # The smallest finite value, nan if there are none
+    max: float  # The largest finite value, nan if there are none
+    mean: float  # The mean of the finite values, nan if there are none
+    n_inf: int  # The number of +inf and -inf values
+    n_nan: int  # The number of nan values
+    histogram: np.ndarray  # Estimated counts in BINS bins evenly spaced from min to max
+    bin_edges: np.ndarray  # The BINS + 1 edges of the histogram bins
+
+    BINS = 64
+    HISTOGRAM_SAMPLES = 2**16  # values sampled from each chunk for the histogram
+
+    @property
+    def is_binary(self) -> bool:
+        """True if the smallest value is 0, the largest 1, and none are inf or nan"""
+        return self.min == 0 and self.max == 1 and self.n_inf == 0 and self.n_nan == 0
+
+    def shifted(self, offset: float) -> "ImageStats":
+        """Statistics of the image plus offset, e.g. for a process to hand over
+        the statistics of its result (see Window)"""
+        return dataclasses.replace(
+            self,
+            min=self.min + offset,
+            max=self.max + offset,
+            mean=self.mean + offset,
+            bin_edges=self.bin_edges + offset,
+        )
+
+    @classmethod
+    def compute(cls, A: np.ndarray) -> "ImageStats":
+        """compute(cls, A)
+        Computes the statistics of A in chunks of frames, on g.settings['nCores']
+        threads, reading each chunk once. The histogram is coarse: like
+        pyqtgraph's ImageItem.getHistogram, it bins a strided sample of each chunk,
+        over the chunk's own range, and these bins are merged into the bins of the
+        whole range.
+
+        Returns:
+            ImageStats of A
+        """
+        if A.ndim < 3:
+            A = A[np.newaxis]
+        nCores = max(1, g.settings["nCores"])
+        frame_bytes = max(A[0].nbytes, 1)
+        budget = g.settings["memory_budget_mb"] * 2**20 // nCores
+        chunk = max(1, int(budget // frame_bytes))
+        blocks = [A[t0 : t0 + chunk] for t0 in range(0, len(A), chunk)]
+        with ThreadPoolExecutor(max_workers=nCores) as executor:
+            parts = list(executor.map(_chunk_stats, blocks))
+        n_inf = sum(part[4] for part in parts)
+        n_nan = sum(part[5] for part in parts)
+        parts = [part for part in parts if part[2] > 0]
+        histogram = np.zeros(cls.BINS)
+        if len(parts) == 0:
+            nan = float("nan")
+            bin_edges = np.full(cls.BINS + 1, nan)
+            return cls(nan, nan, nan, n_inf, n_nan, histogram, bin_edges)
+        lo = min(part[0] for part in parts)
+        hi = max(part[1] for part in parts)
+        count = sum(part[2] for part in parts)
+        mean = sum(part[3] for part in parts) / count
+        bin_edges = np.linspace(lo, hi, cls.BINS + 1)
+        for part in parts:
+            centers = (part[7][:-1] + part[7][1:]) / 2
+            if hi > lo:
+                idx = ((centers - lo) * (cls.BINS / (hi - lo))).astype(np.intp)
+            else:
+                idx = np.zeros(len(centers), dtype=np.intp)
+            np.add.at(histogram, np.clip(idx, 0, cls.BINS - 1), part[6])
+        return cls(lo, hi, float(mean), n_inf, n_nan, histogram, bin_edges)
+
+
+def _chunk_stats(block: np.ndarray) -> tuple:
+    """(min, max, count, sum, n_inf, n_nan, histogram, bin_edges) of the finite
+    values of block, see ImageStats.compute"""
+    block = np.asarray(block)
+    if block.dtype == np.bool_:
+        block = block.view(np.uint8)
+    n_inf = n_nan = 0
+    values = block
+    if np.issubdtype(block.dtype, np.inexact):
+        finite = np.isfinite(block)
+        if not finite.all():
+            n_nan = int(np.count_nonzero(np.isnan(block)))
+            n_inf = int(block.size - np.count_nonzero(finite)) - n_nan
+            values = block[finite]
+    if values.size == 0:
+        return 0, 0, 0, 0.0, n_inf, n_nan, None, None
+    lo, hi = float(np.min(values)), float(np.max(values))
+    step = max(1, values.size // ImageStats.HISTOGRAM_SAMPLES)
+    sample = values.reshape(-1)[::step]
+    histogram, bin_edges = np.histogram(sample, ImageStats.BINS, (lo, hi))
+    histogram = histogram * (values.size / sample.size)
+    total = float(np.sum(values, dtype=np.float64))
+    return lo, hi, values.size, total, n_inf, n_nan, histogram, bin_edges
+
+
 class ImageView(pg.ImageView):
+    """pg.ImageView that reads memory-mapped movies through a FrameProvider, so
+    only the frames being displayed are loaded from disk"""
+
     def __init__(self, *args, **kargs) -> None:
+        self.frames: FrameProvider | None = None
+        self.renderCache = RenderCache()
+        if len(args) < 4 and kargs.get("imageItem") is None:
+            # pg.ImageView shows the image of the item it is given, so it needs one
+            kargs["imageItem"] = FrameImageItem(np.zeros((2, 2)))
         pg.ImageView.__init__(self, *args, **kargs)
+        if isinstance(self.imageItem, FrameImageItem):
+            self.imageItem.renderCache = self.renderCache
         self.view.unregister()
         self.view.removeItem(self.roi)
         self.view.removeItem(self.normRoi)
@@ -92,6 +575,77 @@ class ImageView(pg.ImageView):
         self.ui.roiPlot.getPlotItem().getViewBox().setMouseEnabled(False)
         self.ui.roiPlot.getPlotItem().hideButtons()
 
+    def setImage(self, img, *args, **kargs) -> None:
+        if self.frames is not None:
+            self.frames.shutdown()
+            self.frames = None
+        if img is not None and img.ndim >= 3 and is_file_backed(img):
+            self.frames = FrameProvider(img)
+        self.renderCache.clear()
+        pg.ImageView.setImage(self, img, *args, **kargs)
+
+    def _lazy(self) -> bool:
+        return (
+            self.frames is not None
+            and self.frames.image is self.image
+            and self.axes["t"] == 0
+            and self.ui.normOffRadio.isChecked()
+        )
+
+    def getProcessedImage(self):
+        if self.imageDisp is None and self._lazy():
+            # Don't scan the movie for its levels, estimate them from the frames
+            # read so far (see FrameProvider.levels)
+            self.frames.frame(self.currentIndex)
+            self.imageDisp = self.image
+            self._updateLevels()
+        return pg.ImageView.getProcessedImage(self)
+
+    def _updateLevels(self) -> None:
+        levels = self.frames.levels or (0.0, 0.0)
+        self._imageLevels = [levels]
+        self.levelMin, self.levelMax = levels
+
+    def updateImage(self, autoHistogramRange=True) -> None:
+        if self.image is None:
+            return
+        if self._lazy():
+            self._updateLazyImage(autoHistogramRange)
+        else:
+            pg.ImageView.updateImage(self, autoHistogramRange)
+        if self.axes["t"] is None or not isinstance(self.imageItem, FrameImageItem):
+            return
+        self.renderCache.setSource(self.nframes(), self.frameSource())
+        self.imageItem.frameIndex = self.currentIndex
+
+    def frameSource(self) -> Callable[[int], np.ndarray]:
+        """Function returning frame i the way updateImage passes it to the
+        ImageItem, for rendering frames on another thread"""
+        if self.imageItem.axisOrder == "col-major":
+            axorder = ["t", "x", "y", "c"]
+        else:
+            axorder = ["t", "y", "x", "c"]
+        axorder = [self.axes[ax] for ax in axorder if self.axes[ax] is not None]
+        if self._lazy():
+            frames, frame_axorder = self.frames, [ax - 1 for ax in axorder[1:]]
+            return lambda i: frames.get(i).transpose(frame_axorder)
+        image = self.getProcessedImage().transpose(axorder)
+        return lambda i: image[i]
+
+    def _updateLazyImage(self, autoHistogramRange=True) -> None:
+        self.getProcessedImage()
+        frame = self.frames.frame(self.currentIndex)
+        self._updateLevels()
+        if autoHistogramRange:
+            self.ui.histogram.setHistogramRange(self.levelMin, self.levelMax)
+        if self.imageItem.axisOrder == "col-major":
+            axorder = ["x", "y", "c"]
+        else:
+            axorder = ["y", "x", "c"]
+        axorder = [self.axes[ax] - 1 for ax in axorder if self.axes[ax] is not None]
+        self.ui.roiPlot.show()
+        self.imageItem.updateImage(frame.transpose(axorder))
+
     def hasTimeAxis(self) -> bool:
         return "t" in self.axes and not (
             self.axes["t"] is None or self.image.shape[self.axes["t"]] == 1
@@ -128,10 +682,14 @@ class Window(QtWidgets.QWidget):
         filename (str): The filename (including full path) of file this window's image orinated from.
         commands (list of str): a list of the commands used to create this window, starting with loading the file.
         metadata (dict): dict: a dictionary containing the original file's metadata.
+        stats (ImageStats): statistics of tif, if the code that made it already
+            knows them. Otherwise they are computed on first use, see stats().
 
 
     """
 
+    SCATTER_CACHE_SIZE = 256
+
     closeSignal = QtCore.Signal()
     keyPressSignal = QtCore.Signal(QtCore.QEvent)
     sigTimeChanged = QtCore.Signal(int)
@@ -145,6 +703,7 @@ class Window(QtWidgets.QWidget):
         filename: str = "",
         commands: list[str] = [],
         metadata: dict = {},
+        stats: ImageStats | None = None,
     ) -> None:
         from .process.measure import measure
 
@@ -171,6 +730,11 @@ class Window(QtWidgets.QWidget):
             None  #: float: The number of frames per second (Hz).
         )
         self.image: np.ndarray = tif
+        self._integral_image: np.ndarray | None = None
+        self._integral_image_source: np.ndarray | None = None
+        self.imageGeneration: int = 0  #: int: Incremented by imageChanged(), so caches built from the pixels of the image can tell they are stale.
+        self._stats: ImageStats | None = stats
+        self._stats_source: np.ndarray | None = tif if stats is not None else None
         self.dtype = (
             tif.dtype
         )  #: dtype: The datatype of the stored image, e.g. ``uint8``.
@@ -238,9 +802,14 @@ class Window(QtWidgets.QWidget):
             QtWidgets.QApplication.processEvents()
 
     def _check_for_infinities(self, tif: np.ndarray) -> None:
+        # Only float arrays can hold inf, and read-only (memory-mapped) arrays
+        # cannot be fixed in place, so don't read them all from disk.
+        if not np.issubdtype(tif.dtype, np.inexact) or not tif.flags.writeable:
+            return
         try:
-            if np.any(np.isinf(tif)):
+            if self.stats().n_inf > 0:
                 tif[np.isinf(tif)] = 0
+                self.imageChanged()
                 g.alert("Some array values were inf. Setting those values to 0")
         except MemoryError:
             pass
@@ -321,6 +890,8 @@ class Window(QtWidgets.QWidget):
             brush=pg.mkBrush(*pointColor.getRgb()),
         )  # this is the plot that all the red points will be drawn on
         self.scatterPoints = [[] for _ in np.arange(self.mt)]
+        self._scatterCache: OrderedDict[int, tuple] = OrderedDict()
+        self._scatterBrushes: dict[int, QtGui.QBrush] = {}
         self.scatterPlot.sigClicked.connect(self.clickedScatter)
         self.imageview.addItem(self.scatterPlot)
 
@@ -376,72 +947,60 @@ class Window(QtWidgets.QWidget):
         """Set the display levels for the image based on its content and type.
 
         Handles boolean, integer, and float arrays properly by ensuring appropriate
-        type conversion before arithmetic operations.
+        type conversion before arithmetic operations. The range of the whole image
+        comes from its cached statistics (see stats()).
         """
         # First, determine if we're dealing with a boolean array and convert if needed
         is_bool_array = tif.dtype == np.bool_
 
+        def global_range() -> tuple[float, float]:
+            stats = self.stats() if tif is self.image else ImageStats.compute(tif)
+            return stats.min, stats.max
+
+        def setPaddedLevels(min_val: float, max_val: float) -> None:
+            if not (np.isfinite(min_val) and np.isfinite(max_val)):
+                return
+            if min_val == max_val:
+                # Avoid division by zero if image is uniform
+                padding = 0.01 if min_val == 0 else min_val * 0.01
+            else:
+                # Add 1% padding to min/max range
+                padding = (max_val - min_val) / 100
+            self.imageview.setLevels(min_val - padding, max_val + padding)
+
         if self.nDims == 2:
             # Handle 2D images
-            if is_bool_array or (
-                np.min(tif) == 0 and (np.max(tif) == 0 or np.max(tif) == 1)
-            ):
+            if is_bool_array:
+                self.imageview.setLevels(-0.01, 1.01)
+                return
+            min_val, max_val = global_range()
+            if min_val == 0 and (max_val == 0 or max_val == 1):
                 # For binary images, set levels slightly outside 0-1 range
                 self.imageview.setLevels(-0.01, 1.01)
             else:
                 # For grayscale, compute appropriate range
-                min_val = float(np.min(tif))
-                max_val = float(np.max(tif))
-                if min_val == max_val:
-                    # Avoid division by zero if image is uniform
-                    padding = 0.01 if min_val == 0 else min_val * 0.01
-                    self.imageview.setLevels(min_val - padding, max_val + padding)
-                else:
-                    # Add 1% padding to min/max range
-                    padding = (max_val - min_val) / 100
-                    self.imageview.setLevels(min_val - padding, max_val + padding)
+                setPaddedLevels(min_val, max_val)
 
         elif self.nDims == 3 and not self.metadata["is_rgb"]:
             # Handle 3D grayscale stacks
             if is_bool_array:
-                # Convert boolean array to uint8 for computation
-                # This is just for level calculation, doesn't change the actual data
-                if np.all(tif[self.currentIndex] == 0):
-                    # If current frame is all zeros, use global min/max
-                    self.imageview.setLevels(-0.01, 1.01)
-                else:
-                    # For binary data, always use 0-1 range with small padding
-                    self.imageview.setLevels(-0.01, 1.01)
+                # For binary data, always use 0-1 range with small padding
+                self.imageview.setLevels(-0.01, 1.01)
+            elif np.all(tif[self.currentIndex] == 0):
+                # If current frame is all zeros, use global min/max
+                setPaddedLevels(*global_range())
             else:
-                # Handle numeric arrays
-                if np.all(tif[self.currentIndex] == 0):
-                    # If current frame is all zeros, use global min/max
-                    min_val = float(np.min(tif))
-                    max_val = float(np.max(tif))
-                    if min_val == max_val:
-                        # Avoid division by zero
-                        padding = 0.01 if min_val == 0 else min_val * 0.01
-                        self.imageview.setLevels(min_val - padding, max_val + padding)
-                    else:
-                        padding = (max_val - min_val) / 100
-                        self.imageview.setLevels(min_val - padding, max_val + padding)
-                else:
-                    # Use current frame's min/max for better contrast
-                    min_val = float(np.min(tif[self.currentIndex]))
-                    max_val = float(np.max(tif[self.currentIndex]))
-                    if min_val == max_val:
-                        # Avoid division by zero
-                        padding = 0.01 if min_val == 0 else min_val * 0.01
-                        self.imageview.setLevels(min_val - padding, max_val + padding)
-                    else:
-                        padding = (max_val - min_val) / 100
-                        self.imageview.setLevels(min_val - padding, max_val + padding)
+                # Use current frame's min/max for better contrast
+                frame = tif[self.currentIndex]
+                setPaddedLevels(float(np.min(frame)), float(np.max(frame)))
 
         elif self.nDims == 4 and not self.metadata["is_rgb"]:
             # Handle 4D arrays
-            if is_bool_array or (
-                np.min(tif) == 0 and (np.max(tif) == 0 or np.max(tif) == 1)
-            ):
+            if is_bool_array:
+                self.imageview.setLevels(-0.01, 1.01)
+                return
+            min_val, max_val = global_range()
+            if min_val == 0 and (max_val == 0 or max_val == 1):
                 # For binary volumes, set levels slightly outside 0-1 range
                 self.imageview.setLevels(-0.01, 1.01)
 
@@ -497,13 +1056,37 @@ class Window(QtWidgets.QWidget):
         if 0 <= t < self.mt:
             self.currentIndex = t
             if not g.settings["show_all_points"]:
-                pointSizes = [pt[3] for pt in self.scatterPoints[t]]
-                brushes = [pg.mkBrush(*pt[2].getRgb()) for pt in self.scatterPoints[t]]
-                self.scatterPlot.setData(
-                    pos=self.scatterPoints[t], size=pointSizes, brush=brushes
-                )
+                self.scatterPlot.setData(**self._scatterData(t))
             self.sigTimeChanged.emit(t)
 
+    def _scatterData(self, t: int) -> dict:
+        """_scatterData(self, t)
+        The arguments of scatterPlot.setData that show the points of frame t. They
+        are cached for the last SCATTER_CACHE_SIZE frames shown, until the points of
+        the frame change, and points of the same color share one brush.
+        """
+        points = self.scatterPoints[t]
+        fingerprint = tuple((pt[0], pt[1], pt[2].rgba(), pt[3]) for pt in points)
+        cached = self._scatterCache.get(t)
+        if cached is not None and cached[0] == fingerprint:
+            self._scatterCache.move_to_end(t)
+            return cached[1]
+        brushes = []
+        for pt in points:
+            rgba = pt[2].rgba()
+            if rgba not in self._scatterBrushes:
+                self._scatterBrushes[rgba] = pg.mkBrush(*pt[2].getRgb())
+            brushes.append(self._scatterBrushes[rgba])
+        data = {
+            "pos": np.array([pt[:2] for pt in points], dtype=float).reshape(-1, 2),
+            "size": [pt[3] for pt in points],
+            "brush": brushes,
+        }
+        self._scatterCache[t] = (fingerprint, data)
+        while len(self._scatterCache) > self.SCATTER_CACHE_SIZE:
+            self._scatterCache.popitem(last=False)
+        return data
+
     def setIndex(self, index: int) -> None:
         """setIndex(self, index)
         This sets the index (frame) of this window.
@@ -601,6 +1184,7 @@ class Window(QtWidgets.QWidget):
 
                     # Clean up the image data before deleting
                     self.imageview.setImage(np.zeros((2, 2)))
+                    self.imageview.renderCache.shutdown()
                 except Exception as e:
                     # Log but continue with cleanup
                     print(f"Error during imageview cleanup: {e}")
@@ -658,6 +1242,70 @@ class Window(QtWidgets.QWidget):
             return nDims
         return nDims
 
+    def integralImage(self) -> np.ndarray | None:
+        """integralImage(self)
+        Summed-area table of the image, used to average axis-aligned rectangles
+        with four lookups per frame. It is built on first use and kept until
+        self.image is replaced or imageChanged() is called.
+
+        Returns:
+            [t, mx+1, my+1] float64 array S where S[t, x, y] is the sum of
+            image[t, :x, :y], or None if g.settings['integral_image_cache'] is off,
+            the image is RGB, or there is not enough memory to build it
+        """
+        if not g.settings["integral_image_cache"]:
+            return None
+        if self.image.ndim == 4 or self.metadata["is_rgb"]:
+            return None
+        if self._integral_image_source is not self.image:
+            self._integral_image = None
+        if self._integral_image is None:
+            image = self.image
+            if image.ndim == 2:
+                image = image[np.newaxis]
+            mt, mx, my = image.shape
+            try:
+                S = np.zeros((mt, mx + 1, my + 1))
+            except MemoryError:
+                return None
+            chunk = max(1, int(g.settings["memory_budget_mb"] * 2**20 // S[0].nbytes))
+            for t0 in range(0, mt, chunk):
+                t1 = min(t0 + chunk, mt)
+                block = np.cumsum(image[t0:t1], 1, dtype=np.float64)
+                np.cumsum(block, 2, out=S[t0:t1, 1:, 1:])
+            self._integral_image = S
+            self._integral_image_source = self.image
+        return self._integral_image
+
+    def stats(self) -> ImageStats:
+        """stats(self)
+        Statistics of the whole image, shared by everything that needs its range.
+        They are computed on first use and kept until self.image is replaced or
+        imageChanged() is called.
+
+        Returns:
+            ImageStats of self.image
+        """
+        if self._stats is None or self._stats_source is not self.image:
+            self._stats = ImageStats.compute(self.image)
+            self._stats_source = self.image
+        return self._stats
+
+    def imageChanged(self) -> None:
+        """imageChanged(self)
+        Discard everything cached from the pixels of self.image. Call this after
+        modifying the image in place.
+        """
+        self._integral_image = None
+        self._integral_image_source = None
+        self._stats = None
+        self._stats_source = None
+        self.imageGeneration += 1
+        if self.imageview is not None:
+            self.imageview.renderCache.clear()
+            if self.imageview.frames is not None:
+                self.imageview.frames.invalidate()
+
     def resizeEvent(self, event: QtGui.QResizeEvent) -> None:
         event.accept()
         if self.imageview is not None:
@@ -729,11 +1377,7 @@ class Window(QtWidgets.QWidget):
             self.scatterPoints[t] = [
                 p for p in self.scatterPoints[t] if not (x == p[0] and y == p[1])
             ]
-            pointSizes = [pt[3] for pt in self.scatterPoints[t]]
-            brushes = [pg.mkBrush(*pt[2].getRgb()) for pt in self.scatterPoints[t]]
-            self.scatterPlot.setData(
-                pos=self.scatterPoints[t], size=pointSizes, brush=brushes
-            )
+            self.scatterPlot.setData(**self._scatterData(t))
 
     def getScatterPts(self):
         """getScatterPts(self)
@@ -808,16 +1452,19 @@ class Window(QtWidgets.QWidget):
 
         Args:
             filename (str): The filename, including the full path, where the ROI file will be saved.
+                ROIs are saved in the binary format of :func:`flika.roi.save_rois_npz` if it ends with '.npz'.
 
         """
         if not isinstance(filename, str):
             if filename is not None and os.path.isfile(filename):
                 filename = os.path.splitext(g.settings["filename"])[0]
-                filename = save_file_gui("Save ROI", filename, "*.txt")
+                filename = save_file_gui("Save ROI", filename, "*.txt;;*.npz")
             else:
-                filename = save_file_gui("Save ROI", "", "*.txt")
+                filename = save_file_gui("Save ROI", "", "*.txt;;*.npz")
 
-        if filename != "" and isinstance(filename, str):
+        if filename != "" and isinstance(filename, str) and filename.endswith(".npz"):
+            save_rois_npz(filename, self.rois)
+        elif filename != "" and isinstance(filename, str):
             reprs = [roi._str() for roi in self.rois]
             reprs = "\n".join(reprs)
             open(filename, "w").write(reprs)
@@ -891,6 +1538,7 @@ class Window(QtWidgets.QWidget):
                         else:
                             xs, ys = get_line(x, y, self.last_x, self.last_y).T
                             image[xs, ys] = v
+                        self.imageChanged()
                         self.imageview.imageItem.updateImage(image)
                         self.last_x = x
                         self.last_y = y
@@ -926,47 +1574,33 @@ class Window(QtWidgets.QWidget):
                         self.currentROI.extend(self.x, self.y)
 
     def updateTimeStampLabel(self, frame: int) -> None:
-        label = self.timeStampLabel
+        self.timeStampLabel.setHtml(self.timeStampHtml(frame))
+
+    def timeStampHtml(self, frame: int) -> str:
+        """timeStampHtml(self, frame)
+        The html the time stamp shows at a frame, given the window's framerate.
+        """
+        style = "font-size: 12pt;color:white;background-color:None;"
         if self.framerate == 0:
-            label.setHtml(
-                "<span style='font-size: 12pt;color:white;background-color:None;'>Frame rate is 0 Hz</span>"
-            )
-            return False
+            return f"<span style='{style}'>Frame rate is 0 Hz</span>"
         ttime = (
             frame / self.framerate
         )  # Time elapsed since the first frame until the current frame, in seconds.
         if ttime < 1:
-            ttime = ttime * 1000
-            label.setHtml(
-                "<span style='font-size: 12pt;color:white;background-color:None;'>{:.0f} ms</span>".format(
-                    ttime
-                )
-            )
+            text = f"{ttime * 1000:.0f} ms"
         elif ttime < 60:
-            label.setHtml(
-                "<span style='font-size: 12pt;color:white;background-color:None;'>{:.3f} s</span>".format(
-                    ttime
-                )
-            )
+            text = f"{ttime:.3f} s"
         elif ttime < 3600:
             minutes = int(np.floor(ttime / 60))
             seconds = ttime % 60
-            label.setHtml(
-                "<span style='font-size: 12pt;color:white;background-color:None;'>{}m {:.3f} s</span>".format(
-                    minutes, seconds
-                )
-            )
+            text = f"{minutes}m {seconds:.3f} s"
         else:
             hours = int(np.floor(ttime / 3600))
             mminutes = ttime - hours * 3600
             minutes = int(np.floor(mminutes / 60))
             seconds = mminutes - minutes * 60
-            label.setHtml(
-                "<span style='font-size: 12pt;color:white;background-color:None;'>{}h {}m {:.3f} s</span>".format(
-                    hours, minutes, seconds
-                )
-            )
-
+            text = f"{hours}h {minutes}m {seconds:.3f} s"
+        return f"<span style='{style}'>{text}</span>"
 
 def get_line(x1: int, y1: int, x2: int, y2: int) -> np.ndarray:
     """Bresenham's Line Algorithm